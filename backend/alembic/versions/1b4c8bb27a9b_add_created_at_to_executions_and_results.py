@@ -0,0 +1,53 @@
+"""Add created_at to test executions and results
+
+Revision ID: 1b4c8bb27a9b
+Revises: af4a33e45134
+Create Date: 2026-10-19 09:12:40.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1b4c8bb27a9b'
+down_revision: Union[str, None] = 'af4a33e45134'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('test_executions', sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+    op.add_column('test_results', sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True))
+
+    # 回填歷史數據：執行記錄取執行時間(不早於所屬計劃的創建時間)，步驟結果沿用所屬執行記錄的時間
+    op.execute("UPDATE test_executions SET created_at = COALESCE(executed_at, now())")
+    op.execute("""
+        UPDATE test_executions e
+        SET created_at = p.created_at
+        FROM test_plans p
+        WHERE p.id = e.test_plan_id AND p.created_at > e.created_at
+    """)
+    op.execute("""
+        UPDATE test_results r
+        SET created_at = e.created_at
+        FROM test_executions e
+        WHERE e.id = r.test_execution_id
+    """)
+
+    op.alter_column('test_executions', 'created_at', nullable=False)
+    op.alter_column('test_results', 'created_at', nullable=False)
+
+    op.create_index(op.f('ix_test_executions_test_plan_id'), 'test_executions', ['test_plan_id'], unique=False)
+    op.create_index(op.f('ix_test_results_test_execution_id'), 'test_results', ['test_execution_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_test_results_test_execution_id'), table_name='test_results')
+    op.drop_index(op.f('ix_test_executions_test_plan_id'), table_name='test_executions')
+    op.drop_column('test_results', 'created_at')
+    op.drop_column('test_executions', 'created_at')
@@ -0,0 +1,49 @@
+"""Add jira outbox
+
+Revision ID: a3c5e7f9b1d2
+Revises: d6e1f3a2c7b9
+Create Date: 2026-10-19 20:12:37.504118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e7f9b1d2'
+down_revision: Union[str, None] = 'd6e1f3a2c7b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TEST_STATUSES = ('PASSED', 'FAILED', 'SKIPPED', 'PENDING', 'BLOCKED')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 復用已有的 teststatus 枚舉類型
+    status_type = sa.Enum(*TEST_STATUSES, name='teststatus').with_variant(
+        postgresql.ENUM(*TEST_STATUSES, name='teststatus', create_type=False), 'postgresql'
+    )
+    op.create_table('jira_outbox',
+    sa.Column('jira_issue_key', sa.String(length=50), nullable=False),
+    sa.Column('test_execution_id', sa.Integer(), nullable=False),
+    sa.Column('status', status_type, nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('event_count', sa.Integer(), nullable=False),
+    sa.Column('queued_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('available_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('failed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('jira_issue_key')
+    )
+    op.create_index(op.f('ix_jira_outbox_available_at'), 'jira_outbox', ['available_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_jira_outbox_available_at'), table_name='jira_outbox')
+    op.drop_table('jira_outbox')
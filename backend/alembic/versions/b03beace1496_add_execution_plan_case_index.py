@@ -0,0 +1,31 @@
+"""Replace executions test_plan_id index with (test_plan_id, test_case_id)
+
+Revision ID: b03beace1496
+Revises: cc8512c96b4d
+Create Date: 2026-10-19 16:20:11.539804
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b03beace1496'
+down_revision: Union[str, None] = 'cc8512c96b4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_test_executions_plan_case', 'test_executions', ['test_plan_id', 'test_case_id'], unique=False)
+    # 組合索引的前綴已覆蓋按計劃查詢，移除單列索引以減少寫入開銷
+    op.drop_index('ix_test_executions_test_plan_id', table_name='test_executions')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_test_executions_test_plan_id', 'test_executions', ['test_plan_id'], unique=False)
+    op.drop_index('ix_test_executions_plan_case', table_name='test_executions')
@@ -0,0 +1,127 @@
+"""Optional range partitioning of test executions and results
+
+按月對 test_executions / test_results 進行 created_at 範圍分區。
+該遷移默認不做任何改動，僅在PostgreSQL上顯式啟用時執行：
+
+    alembic -x partitioning=range upgrade head
+    # 或
+    TM_PARTITIONING=range alembic upgrade head
+
+分區表的主鍵必須包含分區鍵，因此 test_executions.id 不再單獨唯一，
+指向 test_executions 的外鍵(test_results、jira_integrations)會被移除，
+過期數據改為整分區刪除(見 app/services/partition_service.py)。
+
+Revision ID: b4a411dcb95e
+Revises: 1b4c8bb27a9b
+Create Date: 2026-10-19 09:40:02.774913
+
+"""
+import os
+from datetime import date
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4a411dcb95e'
+down_revision: Union[str, None] = '1b4c8bb27a9b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 遷移時預先創建的未來月份分區數
+MONTHS_AHEAD = 3
+
+
+def _partitioning_enabled() -> bool:
+    mode = context.get_x_argument(as_dictionary=True).get("partitioning") or os.getenv("TM_PARTITIONING", "")
+    return mode.lower() == "range" and op.get_bind().dialect.name == "postgresql"
+
+
+def _is_partitioned(table: str) -> bool:
+    return bool(op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"), {"t": table}
+    ).scalar())
+
+
+def _add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_monthly_partitions(table: str, first: date, last: date) -> None:
+    month = first
+    while month <= last:
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_p{month:%Y%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+    op.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _partitioning_enabled() or _is_partitioned('test_executions'):
+        return
+
+    bind = op.get_bind()
+    oldest = bind.execute(sa.text("SELECT min(created_at) FROM test_executions")).scalar()
+    today = date.today().replace(day=1)
+    first = oldest.date().replace(day=1) if oldest else today
+    last = _add_months(today, MONTHS_AHEAD)
+
+    for table in ('test_results', 'test_executions'):
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+    for table in ('test_executions', 'test_results'):
+        op.execute(f"CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)")
+        _create_monthly_partitions(table, first, last)
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_legacy")
+
+    # 刪除舊表時一併移除 jira_integrations 指向舊執行表的外鍵
+    op.execute("DROP TABLE test_results_legacy")
+    op.execute("DROP TABLE test_executions_legacy CASCADE")
+
+    op.execute("ALTER TABLE test_executions ADD PRIMARY KEY (id, created_at)")
+    op.execute("ALTER TABLE test_results ADD PRIMARY KEY (id, created_at)")
+    op.execute("ALTER SEQUENCE test_executions_id_seq OWNED BY test_executions.id")
+    op.execute("ALTER SEQUENCE test_results_id_seq OWNED BY test_results.id")
+    op.create_foreign_key('test_executions_test_plan_id_fkey', 'test_executions', 'test_plans', ['test_plan_id'], ['id'])
+    op.create_foreign_key('test_executions_test_case_id_fkey', 'test_executions', 'test_cases', ['test_case_id'], ['id'])
+    op.create_index(op.f('ix_test_executions_id'), 'test_executions', ['id'], unique=False)
+    op.create_index(op.f('ix_test_executions_test_plan_id'), 'test_executions', ['test_plan_id'], unique=False)
+    op.create_index(op.f('ix_test_results_id'), 'test_results', ['id'], unique=False)
+    op.create_index(op.f('ix_test_results_test_execution_id'), 'test_results', ['test_execution_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != "postgresql" or not _is_partitioned('test_executions'):
+        return
+
+    for table in ('test_results', 'test_executions'):
+        op.execute(f"ALTER TABLE {table} RENAME TO {table}_partitioned")
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+
+    for table in ('test_executions', 'test_results'):
+        op.execute(f"CREATE TABLE {table} (LIKE {table}_partitioned INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {table}_partitioned")
+
+    op.execute("DROP TABLE test_results_partitioned CASCADE")
+    op.execute("DROP TABLE test_executions_partitioned CASCADE")
+
+    op.execute("ALTER TABLE test_executions ADD PRIMARY KEY (id)")
+    op.execute("ALTER TABLE test_results ADD PRIMARY KEY (id)")
+    op.execute("ALTER SEQUENCE test_executions_id_seq OWNED BY test_executions.id")
+    op.execute("ALTER SEQUENCE test_results_id_seq OWNED BY test_results.id")
+    op.create_foreign_key('test_executions_test_plan_id_fkey', 'test_executions', 'test_plans', ['test_plan_id'], ['id'])
+    op.create_foreign_key('test_executions_test_case_id_fkey', 'test_executions', 'test_cases', ['test_case_id'], ['id'])
+    op.create_foreign_key('test_results_test_execution_id_fkey', 'test_results', 'test_executions', ['test_execution_id'], ['id'])
+    op.create_foreign_key('jira_integrations_test_execution_id_fkey', 'jira_integrations', 'test_executions', ['test_execution_id'], ['id'])
+    op.create_index(op.f('ix_test_executions_id'), 'test_executions', ['id'], unique=False)
+    op.create_index(op.f('ix_test_executions_test_plan_id'), 'test_executions', ['test_plan_id'], unique=False)
+    op.create_index(op.f('ix_test_results_id'), 'test_results', ['id'], unique=False)
+    op.create_index(op.f('ix_test_results_test_execution_id'), 'test_results', ['test_execution_id'], unique=False)
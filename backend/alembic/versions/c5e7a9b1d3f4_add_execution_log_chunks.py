@@ -0,0 +1,39 @@
+"""Add execution log chunks
+
+Revision ID: c5e7a9b1d3f4
+Revises: a7d9c1e3f5b2
+Create Date: 2026-10-19 19:28:51.604417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e7a9b1d3f4'
+down_revision: Union[str, None] = 'a7d9c1e3f5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('execution_log_chunks',
+    sa.Column('test_execution_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('raw_offset', sa.BigInteger(), nullable=False),
+    sa.Column('raw_length', sa.Integer(), nullable=False),
+    sa.Column('first_line', sa.BigInteger(), nullable=False),
+    sa.Column('line_count', sa.Integer(), nullable=False),
+    sa.Column('codec', sa.String(length=10), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('test_execution_id', 'seq')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('execution_log_chunks')
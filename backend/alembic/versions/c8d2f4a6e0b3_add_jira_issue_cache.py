@@ -0,0 +1,38 @@
+"""Add jira issue cache
+
+Revision ID: c8d2f4a6e0b3
+Revises: a3c5e7f9b1d2
+Create Date: 2026-10-19 21:03:51.276940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8d2f4a6e0b3'
+down_revision: Union[str, None] = 'a3c5e7f9b1d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('jira_issue_cache',
+    sa.Column('jira_issue_key', sa.String(length=50), nullable=False),
+    sa.Column('project_key', sa.String(length=50), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=100), nullable=True),
+    sa.Column('issue_type', sa.String(length=100), nullable=True),
+    sa.Column('fetched_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('jira_issue_key')
+    )
+    op.create_index(op.f('ix_jira_issue_cache_project_key'), 'jira_issue_cache', ['project_key'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_jira_issue_cache_project_key'), table_name='jira_issue_cache')
+    op.drop_table('jira_issue_cache')
@@ -0,0 +1,42 @@
+"""Add version counters for ETags
+
+Revision ID: cc8512c96b4d
+Revises: f9f3e0b6343d
+Create Date: 2026-10-19 15:02:36.418207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cc8512c96b4d'
+down_revision: Union[str, None] = 'f9f3e0b6343d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('test_plans', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('test_plans', sa.Column('data_version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('test_cases', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('test_executions', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+    # 覆蓋索引：條件請求的版本號查詢可使用僅索引掃描
+    op.create_index('ix_test_plans_id_versions', 'test_plans', ['id', 'version', 'data_version'], unique=False)
+    op.create_index('ix_test_cases_id_version', 'test_cases', ['id', 'version'], unique=False)
+    op.create_index('ix_test_executions_id_version', 'test_executions', ['id', 'version'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_test_executions_id_version', table_name='test_executions')
+    op.drop_index('ix_test_cases_id_version', table_name='test_cases')
+    op.drop_index('ix_test_plans_id_versions', table_name='test_plans')
+    op.drop_column('test_executions', 'version')
+    op.drop_column('test_cases', 'version')
+    op.drop_column('test_plans', 'data_version')
+    op.drop_column('test_plans', 'version')
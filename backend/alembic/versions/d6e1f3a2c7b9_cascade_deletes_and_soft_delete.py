@@ -0,0 +1,71 @@
+"""ON DELETE CASCADE foreign keys and soft delete for plans and cases
+
+Revision ID: d6e1f3a2c7b9
+Revises: b03beace1496
+Create Date: 2026-10-19 17:05:42.118530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6e1f3a2c7b9'
+down_revision: Union[str, None] = 'b03beace1496'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (約束名, 表, 引用表, 列, 是否引用執行記錄表)
+FOREIGN_KEYS = [
+    ('test_executions_test_plan_id_fkey', 'test_executions', 'test_plans', 'test_plan_id', False),
+    ('test_executions_test_case_id_fkey', 'test_executions', 'test_cases', 'test_case_id', False),
+    ('test_results_test_execution_id_fkey', 'test_results', 'test_executions', 'test_execution_id', True),
+    ('jira_integrations_test_case_id_fkey', 'jira_integrations', 'test_cases', 'test_case_id', False),
+    ('jira_integrations_test_execution_id_fkey', 'jira_integrations', 'test_executions', 'test_execution_id', True),
+    ('archive_segments_test_plan_id_fkey', 'archive_segments', 'test_plans', 'test_plan_id', False),
+]
+
+
+def _is_partitioned(table: str) -> bool:
+    return op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"), {"t": table}
+    ).first() is not None
+
+
+def _replace_foreign_keys(ondelete: Union[str, None]) -> None:
+    # 分區佈局下執行記錄表沒有單列主鍵，指向它的外鍵不存在，由清理任務顯式刪除子記錄
+    partitioned = _is_partitioned('test_executions')
+    for name, table, referent, column, references_executions in FOREIGN_KEYS:
+        if references_executions and partitioned:
+            continue
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+        op.create_foreign_key(name, table, referent, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('test_plans', 'test_cases'):
+        op.add_column(table, sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=True))
+        # 部分索引：只包含等待清理的行
+        op.create_index(f'ix_{table}_deleted_at', table, ['deleted_at'], unique=False,
+                        postgresql_where=sa.text('deleted_at IS NOT NULL'),
+                        sqlite_where=sa.text('deleted_at IS NOT NULL'))
+    # 按案例清理執行記錄
+    op.create_index(op.f('ix_test_executions_test_case_id'), 'test_executions', ['test_case_id'], unique=False)
+
+    # SQLite 不支持修改外鍵約束，僅依賴ORM和清理任務刪除子記錄
+    if op.get_bind().dialect.name == "postgresql":
+        _replace_foreign_keys('CASCADE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        _replace_foreign_keys(None)
+
+    op.drop_index(op.f('ix_test_executions_test_case_id'), table_name='test_executions')
+    for table in ('test_cases', 'test_plans'):
+        op.drop_index(f'ix_{table}_deleted_at', table_name=table)
+        op.drop_column(table, 'deleted_at')
@@ -0,0 +1,87 @@
+"""Add change log with triggers on executions and cases
+
+執行記錄和測試案例的每次寫入由觸發器追加到 change_log，供 GET /api/changes 增量同步。
+PostgreSQL使用帶轉換表的語句級觸發器(分區表上同樣適用)，批量寫入每條語句只追加一次。
+
+Revision ID: e1a7c3b5d9f2
+Revises: c8d2f4a6e0b3
+Create Date: 2026-10-19 22:41:08.215734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1a7c3b5d9f2'
+down_revision: Union[str, None] = 'c8d2f4a6e0b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (表, 實體名)
+ENTITIES = (('test_executions', 'test_execution'), ('test_cases', 'test_case'))
+OPERATIONS = ('insert', 'update', 'delete')
+
+PG_FUNCTIONS = {
+    'change_log_insert': "INSERT INTO change_log (entity, entity_id, op) SELECT TG_ARGV[0], id, 'insert' FROM new_rows ORDER BY id;",
+    'change_log_update': "INSERT INTO change_log (entity, entity_id, op) SELECT TG_ARGV[0], id, 'update' FROM new_rows ORDER BY id;",
+    'change_log_delete': "INSERT INTO change_log (entity, entity_id, op) SELECT TG_ARGV[0], id, 'delete' FROM old_rows ORDER BY id;",
+    # 測試案例的軟刪除記為delete
+    'change_log_case_update': (
+        "INSERT INTO change_log (entity, entity_id, op) "
+        "SELECT 'test_case', n.id, CASE WHEN n.deleted_at IS NOT NULL AND o.deleted_at IS NULL THEN 'delete' ELSE 'update' END "
+        "FROM new_rows n JOIN old_rows o ON o.id = n.id ORDER BY n.id;"
+    ),
+}
+
+
+def _pg_trigger(table: str, entity: str, operation: str) -> str:
+    if table == 'test_cases' and operation == 'update':
+        referencing, function = 'OLD TABLE AS old_rows NEW TABLE AS new_rows', 'change_log_case_update()'
+    else:
+        referencing = 'OLD TABLE AS old_rows' if operation == 'delete' else 'NEW TABLE AS new_rows'
+        function = f"change_log_{operation}('{entity}')"
+    return (
+        f"CREATE TRIGGER {table}_change_{operation} AFTER {operation.upper()} ON {table} "
+        f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION {function}"
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('change_log',
+    sa.Column('seq', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), autoincrement=True, nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('changed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('seq'),
+    sqlite_autoincrement=True
+    )
+    op.create_index(op.f('ix_change_log_changed_at'), 'change_log', ['changed_at'], unique=False)
+
+    # 嵌入式SQLite按模型建表，觸發器在建表時創建(見 app/models/models.py)
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for name, body in PG_FUNCTIONS.items():
+        op.execute(
+            f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$ "
+            f"BEGIN {body} RETURN NULL; END $$"
+        )
+    for table, entity in ENTITIES:
+        for operation in OPERATIONS:
+            op.execute(_pg_trigger(table, entity, operation))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, _ in ENTITIES:
+            for operation in OPERATIONS:
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_change_{operation} ON {table}")
+        for name in PG_FUNCTIONS:
+            op.execute(f"DROP FUNCTION IF EXISTS {name}()")
+    op.drop_index(op.f('ix_change_log_changed_at'), table_name='change_log')
+    op.drop_table('change_log')
@@ -0,0 +1,44 @@
+"""Add packed test results and step description dictionary
+
+Revision ID: f9f3e0b6343d
+Revises: 507efe90400d
+Create Date: 2026-10-19 13:21:47.091835
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f9f3e0b6343d'
+down_revision: Union[str, None] = '507efe90400d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('step_descriptions',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('test_executions', sa.Column('packed_results', sa.JSON().with_variant(postgresql.JSONB(astext_type=sa.Text()), 'postgresql'), nullable=True))
+
+    # PostgreSQL 14+ 使用 lz4 壓縮 TOAST 數據，解壓速度明顯快於默認的 pglz
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql" and bind.dialect.server_version_info >= (14,):
+        lz4_supported = bind.execute(sa.text(
+            "SELECT 'lz4' = ANY(enumvals) FROM pg_settings WHERE name = 'default_toast_compression'"
+        )).scalar()
+        if lz4_supported:
+            op.execute("ALTER TABLE test_executions ALTER COLUMN packed_results SET COMPRESSION lz4")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('test_executions', 'packed_results')
+    op.drop_table('step_descriptions')
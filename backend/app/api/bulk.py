@@ -0,0 +1,26 @@
+from typing import Any, List
+
+import orjson
+from fastapi import HTTPException, Request
+
+from app.services.bulk_service import BULK_MAX_ITEMS
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+async def read_bulk_payload(request: Request) -> List[Any]:
+    """讀取批量請求體：JSON數組，或每行一個JSON對象的NDJSON"""
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        if content_type in NDJSON_MEDIA_TYPES:
+            items = [orjson.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"請求體解析失敗: {str(e)}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="請求體必須是JSON數組或NDJSON")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"單次請求最多 {BULK_MAX_ITEMS} 條")
+    return items
@@ -0,0 +1,78 @@
+import hashlib
+import re
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+
+from app.api.serialization import wants_msgpack
+
+# 壓縮中間件會在ETag末尾附加編碼後綴(如 "abc-br")，比較時需去掉
+_ENCODING_SUFFIXES = ("-br", "-gzip")
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def make_etag(request: Request, *version) -> str:
+    """由資源版本號和表示形式(查詢參數、響應格式)計算強ETag"""
+    representation = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    media = "msgpack" if wants_msgpack() else "json"
+    raw = ":".join(str(part) for part in (request.url.path, representation, media, *version))
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:24] + '"'
+
+
+def _normalize(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in _ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[: -len(suffix) - 1] + '"'
+    return tag
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """請求的 If-None-Match 是否與當前ETag匹配"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(_normalize(tag) == etag for tag in header.split(","))
+
+
+def set_etag(response: Response, etag: Optional[str]) -> Response:
+    """設置ETag，並要求客戶端每次使用前重新驗證"""
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def not_modified_response(etag: str) -> Response:
+    return set_etag(Response(status_code=304), etag)
+
+
+def requested_range(request: Request, size: int, etag: Optional[str] = None) -> Optional[Tuple[int, int]]:
+    """解析 Range 頭，返回單個字節範圍 (start, end)，end 包含在內
+
+    沒有 Range 頭、If-Range 與當前ETag不匹配或請求多個範圍時返回 None(返回完整內容)；
+    範圍無法滿足時拋出416。
+    """
+    header = request.headers.get("range")
+    if not header:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and (etag is None or if_range.strip() != etag):
+        return None
+    match = _BYTE_RANGE.match(header.replace(" ", ""))
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # 後綴範圍：最後 N 個字節
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, detail="請求的範圍無效", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
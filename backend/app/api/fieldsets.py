@@ -0,0 +1,90 @@
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only, selectinload
+
+from app.api.serialization import dump_model, dump_models
+
+FIELDS_QUERY = Query(None, description="以逗號分隔的返回字段，例如 id,title,priority")
+EXPAND_QUERY = Query(None, description="以逗號分隔的需要展開的關聯數據")
+
+
+def _split(value: Optional[str]) -> Optional[List[str]]:
+    if value is None:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+class FieldSelection:
+    """將 fields / expand 查詢參數轉換為SQL加載選項和響應字典
+
+    - fields 只加載列出的列(load_only)，未指定時加載全部列
+    - expand 中的關聯通過 selectinload 一次額外查詢批量加載
+    - 兩個參數都未指定時保持原有響應結構(default_expand 中的關聯照常返回)
+    """
+
+    def __init__(
+        self,
+        model,
+        schema: Type[BaseModel],
+        fields: Optional[str] = None,
+        expand: Optional[str] = None,
+        expandable: Optional[Dict[str, Tuple[Type[BaseModel], List[str]]]] = None,
+        default_expand: Iterable[str] = (),
+    ):
+        self.model = model
+        self.schema = schema
+        self.expandable = expandable or {}
+        self.sparse = fields is not None or expand is not None
+
+        mapper = inspect(model)
+        self.column_names = [attr.key for attr in mapper.column_attrs]
+        schema_fields = [name for name in schema.model_fields if name not in self.expandable]
+
+        requested = _split(fields)
+        if requested is None:
+            self.fields = schema_fields
+        else:
+            unknown = [name for name in requested if name not in schema_fields]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"未知字段: {', '.join(unknown)}")
+            self.fields = ["id"] + [name for name in requested if name != "id"]
+
+        expanded = _split(expand)
+        if expanded is None:
+            expanded = list(default_expand) if not self.sparse else []
+        unknown = [name for name in expanded if name not in self.expandable]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"不支持展開: {', '.join(unknown)}")
+        self.expand = expanded
+
+    def options(self) -> list:
+        """構建查詢的加載選項"""
+        columns = [name for name in self.fields if name in self.column_names]
+        for name in self.expand:
+            columns.extend(self.expandable[name][1])
+        options = [load_only(*(getattr(self.model, name) for name in dict.fromkeys(columns)))]
+        options.extend(selectinload(getattr(self.model, name)) for name in self.expand)
+        return options
+
+    def dump(self, obj) -> Dict[str, Any]:
+        """按選定字段將ORM對象轉換為響應字典"""
+        if not self.sparse:
+            return dump_model(self.schema, obj)
+        data = {name: getattr(obj, name) for name in self.fields}
+        for name in self.expand:
+            nested_schema = self.expandable[name][0]
+            value = getattr(obj, name)
+            if isinstance(value, (list, tuple)):
+                data[name] = dump_models(nested_schema, value)
+            else:
+                data[name] = dump_model(nested_schema, value) if value is not None else None
+        return data
+
+    def dump_all(self, objs) -> List[Dict[str, Any]]:
+        """轉換列表頁的ORM對象"""
+        if not self.sparse:
+            return dump_models(self.schema, objs)
+        return [self.dump(obj) for obj in objs]
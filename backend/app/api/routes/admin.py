@@ -0,0 +1,43 @@
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+
+from app.core.profiling import get_profile, list_profiles, slow_queries
+from app.core.security import require_admin
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/profiles")
+async def get_profiles():
+    """最近的請求剖析結果(帶 X-Profile: 1 頭的管理員請求，或按 PROFILE_SAMPLE_RATE 抽樣的請求)"""
+    return list_profiles()
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: int, format: str = Query("speedscope", pattern="^(speedscope|collapsed)$")):
+    """下載剖析結果：speedscope 格式可拖入 https://www.speedscope.app 查看，collapsed 為火焰圖工具的摺疊棧格式"""
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="剖析結果不存在或已被淘汰")
+
+    if format == "collapsed":
+        return Response(
+            profile.to_collapsed(),
+            media_type="text/plain; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="profile_{profile_id}.folded"'},
+        )
+    return Response(
+        json.dumps(profile.to_speedscope(), ensure_ascii=False),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="profile_{profile_id}.speedscope.json"'},
+    )
+
+@router.get("/slow-queries")
+async def get_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """最近捕獲的慢查詢及其執行計劃，新的在前"""
+    return list(reversed(slow_queries))[:limit]
+
+@router.delete("/slow-queries")
+async def clear_slow_queries():
+    """清空慢查詢緩衝區"""
+    slow_queries.clear()
+    return {"message": "慢查詢記錄已清空"}
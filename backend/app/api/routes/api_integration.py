@@ -1,16 +1,25 @@
+import os
 from fastapi import APIRouter, Depends, HTTPException, Header, status, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from app.db.database import get_db
+from app.core.metrics import INGESTED_ROWS
+from app.db.database import get_async_db, AsyncSessionLocal
 from app.models.models import ApiKey, TestCase, TestExecution, TestResult, TestPlan, TestStatus
 from app.schemas.schemas import TestExecutionCreate, TestResultCreate
+from app.services.result_store import pack_steps, use_packed_storage
+from app.services.jira_outbox_service import enqueue_status_changes
+from app.services.purge_service import get_active, not_deleted
 
 router = APIRouter()
 
+# 後台處理批量上傳時每個事務寫入的執行記錄數
+UPLOAD_COMMIT_BATCH_SIZE = int(os.getenv("UPLOAD_COMMIT_BATCH_SIZE", "500"))
+
 # API密鑰認證
-async def verify_api_key(x_api_key: str = Header(...), db: Session = Depends(get_db)):
-    api_key = db.query(ApiKey).filter(ApiKey.key == x_api_key, ApiKey.is_active == True).first()
+async def verify_api_key(x_api_key: str = Header(...), db: AsyncSession = Depends(get_async_db)):
+    api_key = (await db.scalars(select(ApiKey).where(ApiKey.key == x_api_key, ApiKey.is_active == True))).first()
     if not api_key:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -19,14 +28,14 @@ async def verify_api_key(x_api_key: str = Header(...), db: Session = Depends(get
     return api_key
 
 @router.post("/api-keys")
-async def create_api_key(name: str, description: Optional[str] = None, db: Session = Depends(get_db)):
+async def create_api_key(name: str, description: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
     """創建新的API密鑰（需管理員權限）"""
     # 在真實系統中，這裡應該有權限檢查
     
     api_key = ApiKey(name=name, description=description)
     db.add(api_key)
-    db.commit()
-    db.refresh(api_key)
+    await db.commit()
+    await db.refresh(api_key)
     
     return {
         "id": api_key.id,
@@ -36,11 +45,11 @@ async def create_api_key(name: str, description: Optional[str] = None, db: Sessi
     }
 
 @router.get("/api-keys")
-async def list_api_keys(db: Session = Depends(get_db)):
+async def list_api_keys(db: AsyncSession = Depends(get_async_db)):
     """列出所有API密鑰（需管理員權限）"""
     # 在真實系統中，這裡應該有權限檢查
     
-    api_keys = db.query(ApiKey).all()
+    api_keys = (await db.scalars(select(ApiKey))).all()
     return [
         {
             "id": key.id,
@@ -54,16 +63,16 @@ async def list_api_keys(db: Session = Depends(get_db)):
     ]
 
 @router.delete("/api-keys/{key_id}")
-async def delete_api_key(key_id: int, db: Session = Depends(get_db)):
+async def delete_api_key(key_id: int, db: AsyncSession = Depends(get_async_db)):
     """停用API密鑰（需管理員權限）"""
     # 在真實系統中，這裡應該有權限檢查
     
-    api_key = db.query(ApiKey).filter(ApiKey.id == key_id).first()
+    api_key = await db.get(ApiKey, key_id)
     if not api_key:
         raise HTTPException(status_code=404, detail="API密鑰不存在")
     
     api_key.is_active = False
-    db.commit()
+    await db.commit()
     
     return {"message": "API密鑰已停用"}
 
@@ -72,7 +81,7 @@ async def upload_test_results(
     data: Dict[str, Any],
     background_tasks: BackgroundTasks,
     api_key: ApiKey = Depends(verify_api_key),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """批量上傳測試結果
     
@@ -104,7 +113,7 @@ async def upload_test_results(
     if not test_plan_id:
         raise HTTPException(status_code=400, detail="缺少test_plan_id字段")
     
-    test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
+    test_plan = await get_active(db, TestPlan, test_plan_id)
     if not test_plan:
         raise HTTPException(status_code=404, detail=f"測試計劃ID {test_plan_id} 不存在")
     
@@ -113,12 +122,11 @@ async def upload_test_results(
     if not results:
         raise HTTPException(status_code=400, detail="results列表為空")
     
-    # 在後台處理測試結果，避免長時間阻塞請求
+    # 在後台處理測試結果，避免長時間阻塞請求(後台任務使用獨立會話)
     background_tasks.add_task(
         process_test_results,
         test_plan_id=test_plan_id,
-        results=results,
-        db=db
+        results=results
     )
     
     return {
@@ -136,15 +144,15 @@ async def upload_single_test_result(
     duration: Optional[int] = None,
     notes: Optional[str] = None,
     api_key: ApiKey = Depends(verify_api_key),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """上傳單個測試結果"""
     # 驗證測試計劃和測試案例存在
-    test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
+    test_plan = await get_active(db, TestPlan, test_plan_id)
     if not test_plan:
         raise HTTPException(status_code=404, detail=f"測試計劃ID {test_plan_id} 不存在")
     
-    test_case = db.query(TestCase).filter(TestCase.id == test_case_id).first()
+    test_case = await get_active(db, TestCase, test_case_id)
     if not test_case:
         raise HTTPException(status_code=404, detail=f"測試案例ID {test_case_id} 不存在")
     
@@ -160,8 +168,10 @@ async def upload_single_test_result(
     )
     
     db.add(test_execution)
-    db.commit()
-    db.refresh(test_execution)
+    await db.flush()
+    await enqueue_status_changes(db, [(test_execution.id, test_case_id, status)])
+    await db.commit()
+    INGESTED_ROWS.inc("test_executions")
     
     return {
         "message": "測試結果已上傳",
@@ -170,50 +180,81 @@ async def upload_single_test_result(
     }
 
 # 後台處理函數
-async def process_test_results(test_plan_id: int, results: List[Dict[str, Any]], db: Session):
+async def process_test_results(test_plan_id: int, results: List[Dict[str, Any]]):
     """處理批量測試結果"""
-    try:
-        for result in results:
-            test_case_id = result.get("test_case_id")
-            if not test_case_id:
-                print(f"警告: 缺少test_case_id字段: {result}")
-                continue
-            
-            # 檢查測試案例是否存在
-            test_case = db.query(TestCase).filter(TestCase.id == test_case_id).first()
-            if not test_case:
-                print(f"警告: 測試案例ID {test_case_id} 不存在")
-                continue
-            
-            # 創建測試執行記錄
-            test_execution = TestExecution(
-                status=result.get("status", "pending"),
-                executed_at=datetime.now(),
-                executed_by=result.get("executed_by", "api"),
-                duration=result.get("duration"),
-                notes=result.get("notes"),
-                test_plan_id=test_plan_id,
-                test_case_id=test_case_id
-            )
-            
-            db.add(test_execution)
-            db.flush()  # 獲取新生成的ID，但尚未提交
-            
-            # 處理步驟結果
-            steps = result.get("steps", [])
-            for step in steps:
-                test_result = TestResult(
-                    step_number=step.get("step_number", 0),
-                    step_description=step.get("step_description", ""),
-                    status=step.get("status", "pending"),
-                    screenshot_url=step.get("screenshot_url"),
-                    notes=step.get("notes"),
-                    test_execution_id=test_execution.id
+    async with AsyncSessionLocal() as db:
+        try:
+            # 一次查詢所有引用的測試案例，避免逐條檢查
+            case_ids = {result.get("test_case_id") for result in results if result.get("test_case_id")}
+            existing_cases = set((await db.scalars(
+                select(TestCase.id).where(TestCase.id.in_(case_ids), not_deleted(TestCase))
+            )).all()) if case_ids else set()
+
+            batch: List[TestExecution] = []
+            batch_steps = 0
+
+            async def commit_batch():
+                nonlocal batch_steps
+                # 獲得執行記錄ID後，將本批的狀態變更與執行記錄在同一事務中寫入Jira同步發件箱
+                await db.flush()
+                await enqueue_status_changes(
+                    db, [(execution.id, execution.test_case_id, execution.status) for execution in batch]
                 )
-                db.add(test_result)
-            
-            db.commit()
+                await db.commit()
+                INGESTED_ROWS.inc("test_executions", amount=len(batch))
+                INGESTED_ROWS.inc("test_results", amount=batch_steps)
+                batch.clear()
+                batch_steps = 0
+
+            for result in results:
+                test_case_id = result.get("test_case_id")
+                if not test_case_id:
+                    print(f"警告: 缺少test_case_id字段: {result}")
+                    continue
+                
+                # 檢查測試案例是否存在
+                if test_case_id not in existing_cases:
+                    print(f"警告: 測試案例ID {test_case_id} 不存在")
+                    continue
+                
+                # 創建測試執行記錄
+                test_execution = TestExecution(
+                    status=result.get("status", "pending"),
+                    executed_at=datetime.now(),
+                    executed_by=result.get("executed_by", "api"),
+                    duration=result.get("duration"),
+                    notes=result.get("notes"),
+                    test_plan_id=test_plan_id,
+                    test_case_id=test_case_id
+                )
+                
+                # 處理步驟結果
+                steps = result.get("steps", [])
+                if use_packed_storage():
+                    # 緊湊存儲：所有步驟打包寫入執行記錄的一列，無需逐行插入
+                    test_execution.packed_results = await pack_steps(db, steps) if steps else None
+                else:
+                    # 通過關聯添加步驟結果，提交時與執行記錄一起批量插入
+                    test_execution.test_results = [
+                        TestResult(
+                            step_number=step.get("step_number", 0),
+                            step_description=step.get("step_description", ""),
+                            status=step.get("status", "pending"),
+                            screenshot_url=step.get("screenshot_url"),
+                            notes=step.get("notes"),
+                        )
+                        for step in steps
+                    ]
+                db.add(test_execution)
+                batch_steps += len(steps)
+                
+                # 按批提交，減少事務和刷盤次數(SQLite下尤為明顯)
+                batch.append(test_execution)
+                if len(batch) >= UPLOAD_COMMIT_BATCH_SIZE:
+                    await commit_batch()
             
-    except Exception as e:
-        db.rollback()
-        print(f"處理測試結果時出錯: {str(e)}") 
\ No newline at end of file
+            await commit_batch()
+                
+        except Exception as e:
+            await db.rollback()
+            print(f"處理測試結果時出錯: {str(e)}")
@@ -0,0 +1,147 @@
+from urllib.parse import quote
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.conditional import is_not_modified, requested_range
+from app.core.query_budget import query_budget
+from app.db.database import get_async_db
+from app.db.routing import get_read_db
+from app.models.models import Artifact
+from app.schemas.schemas import ArtifactResponse
+from app.services.artifact_store import (
+    ARTIFACT_MAX_SIZE, ARTIFACT_THUMBNAIL_MAX_SIZE, ARTIFACT_THUMBNAIL_SIZE,
+    ArtifactTooLargeError, InvalidUploadError, ensure_thumbnail, is_image, iter_object, read_thumbnail, receive_upload,
+)
+
+router = APIRouter()
+
+SHA256_PATTERN = "^[0-9a-f]{64}$"
+# 內容按哈希尋址，同一URL的內容永不改變
+_IMMUTABLE = "public, max-age=31536000, immutable"
+# 可在瀏覽器中直接顯示的類型；其他類型一律作為下載，避免上傳的HTML等在本站點下執行
+_INLINE_TYPES = ("image/png", "image/jpeg", "image/gif", "image/webp", "image/bmp", "text/plain", "application/pdf")
+
+
+def _artifact_response(artifact: Artifact, deduplicated: bool = False) -> ArtifactResponse:
+    url = f"/api/artifacts/{artifact.sha256}"
+    return ArtifactResponse(
+        sha256=artifact.sha256,
+        size=artifact.size,
+        content_type=artifact.content_type,
+        filename=artifact.filename,
+        created_at=artifact.created_at,
+        url=url,
+        thumbnail_url=f"{url}/thumbnail" if is_image(artifact.content_type) else None,
+        deduplicated=deduplicated,
+    )
+
+
+async def _get_artifact(db: AsyncSession, sha256: str) -> Artifact:
+    artifact = await db.get(Artifact, sha256)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="附件不存在")
+    return artifact
+
+
+def _content_headers(artifact: Artifact, etag: str) -> dict:
+    disposition = "inline" if artifact.content_type.split(";")[0].strip() in _INLINE_TYPES else "attachment"
+    if artifact.filename:
+        disposition += f"; filename*=UTF-8''{quote(artifact.filename)}"
+    return {
+        "ETag": etag,
+        "Cache-Control": _IMMUTABLE,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": disposition,
+        "X-Content-Type-Options": "nosniff",
+        "Content-Security-Policy": "sandbox",
+    }
+
+
+@router.post("/", response_model=ArtifactResponse, status_code=201)
+async def upload_artifact(
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    filename: str = Query(None, max_length=255, description="直接以請求體上傳時的文件名"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """上傳附件(截圖、日誌文件等)
+
+    支持 multipart/form-data(保存第一個文件字段)，或直接以請求體上傳並通過 Content-Type 聲明類型。
+    內容相同的文件只存儲一份並返回200；返回的 url 可直接作為步驟結果的 screenshot_url。
+    """
+    declared_length = request.headers.get("content-length")
+    if declared_length and declared_length.isdigit() and int(declared_length) > ARTIFACT_MAX_SIZE + 64 * 1024:
+        raise HTTPException(status_code=413, detail=f"附件超過大小上限 {ARTIFACT_MAX_SIZE} 字節")
+    try:
+        artifact, deduplicated = await receive_upload(
+            db, request.stream(), request.headers.get("content-type", ""), filename,
+        )
+    except ArtifactTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if deduplicated:
+        response.status_code = 200
+    elif is_image(artifact.content_type):
+        # 響應發送後預先生成默認尺寸的縮略圖
+        background_tasks.add_task(ensure_thumbnail, artifact)
+    return _artifact_response(artifact, deduplicated)
+
+
+@router.get("/{sha256}/info", response_model=ArtifactResponse, dependencies=[query_budget(1)])
+async def get_artifact_info(sha256: str = Path(..., pattern=SHA256_PATTERN), db: AsyncSession = Depends(get_read_db)):
+    """附件的元數據"""
+    return _artifact_response(await _get_artifact(db, sha256))
+
+
+@router.api_route("/{sha256}", methods=["GET", "HEAD"], dependencies=[query_budget(1)])
+async def download_artifact(
+    request: Request,
+    sha256: str = Path(..., pattern=SHA256_PATTERN),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """下載附件，支持 Range(斷點續傳、視頻拖動)和 If-None-Match；ETag 即內容的SHA-256
+
+    上傳前可先用 HEAD 檢查相同內容是否已存在，避免重複上傳。
+    """
+    artifact = await _get_artifact(db, sha256)
+    etag = f'"{artifact.sha256}"'
+    headers = _content_headers(artifact, etag)
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = requested_range(request, artifact.size, etag)
+    if byte_range is None:
+        status_code, start, end = 200, 0, artifact.size - 1
+    else:
+        status_code, (start, end) = 206, byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{artifact.size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=artifact.content_type)
+    return StreamingResponse(
+        iter_object(artifact.sha256, start, end), status_code=status_code, headers=headers, media_type=artifact.content_type,
+    )
+
+
+@router.get("/{sha256}/thumbnail", dependencies=[query_budget(1)])
+async def get_thumbnail(
+    request: Request,
+    sha256: str = Path(..., pattern=SHA256_PATTERN),
+    size: int = Query(ARTIFACT_THUMBNAIL_SIZE, ge=16, le=ARTIFACT_THUMBNAIL_MAX_SIZE, description="最長邊的像素數"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """圖片附件的JPEG縮略圖；首次請求某尺寸時在工作進程中生成並保存"""
+    artifact = await _get_artifact(db, sha256)
+    etag = f'"{artifact.sha256}-{size}"'
+    headers = {"ETag": etag, "Cache-Control": _IMMUTABLE}
+    if is_not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    if not await ensure_thumbnail(artifact, size):
+        raise HTTPException(status_code=404, detail="該附件不是可識別的圖片，沒有縮略圖")
+    return Response(await read_thumbnail(artifact.sha256, size), media_type="image/jpeg", headers=headers)
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Query, status
+
+from app.api.serialization import NegotiatedResponse
+from app.schemas.schemas import ChangeFeedResponse
+from app.services.change_feed import CHANGE_FEED_MAX_WAIT, CursorExpiredError, wait_for_changes
+
+router = APIRouter()
+
+@router.get("/", response_model=ChangeFeedResponse)
+async def get_changes(
+    since: int = Query(0, ge=0, description="上次響應中的 cursor，0表示從保留的最早變更開始"),
+    limit: int = Query(500, ge=1, le=5000),
+    wait: float = Query(0, ge=0, le=CHANGE_FEED_MAX_WAIT, description="沒有新變更時最多等待的秒數(長輪詢)"),
+):
+    """按提交順序返回執行記錄和測試案例的插入、更新、刪除
+
+    客戶端保存響應中的 cursor，下次以 since=cursor 請求；has_more 為 true 時應立即繼續讀取。
+    """
+    try:
+        page = await wait_for_changes(since, limit, wait)
+    except CursorExpiredError as e:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail=str(e))
+    # 條目已是字典，直接編碼以跳過響應模型的二次校驗
+    return NegotiatedResponse({key: page[key] for key in ("changes", "cursor", "has_more")})
@@ -0,0 +1,128 @@
+import re
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.conditional import requested_range
+from app.core.query_budget import query_budget
+from app.db.database import get_async_db
+from app.db.routing import get_read_db
+from app.models.models import TestExecution
+from app.schemas.schemas import ExecutionLogInfo, LogSearchResponse
+from app.services.execution_log import (
+    ExecutionNotFoundError, LogTooLargeError, append_stream, delete_log, iter_range, log_index, log_info, log_size,
+    search, tail,
+)
+from app.services.purge_service import visible_executions
+
+router = APIRouter()
+
+LOG_MEDIA_TYPE = "text/plain; charset=utf-8"
+
+
+async def _get_index(db: AsyncSession, execution_id: int):
+    index = await log_index(db, execution_id)
+    if not index:
+        raise HTTPException(status_code=404, detail="該執行記錄沒有日誌")
+    return index
+
+
+@router.post("/{execution_id}/log", response_model=ExecutionLogInfo)
+async def append_execution_log(execution_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    """追加執行日誌，請求體即日誌內容
+
+    可在測試運行期間以分塊傳輸持續上傳(如 `tail -f console.log | curl -T - ...`)，
+    已收到的內容每積累一個塊或停頓 EXECUTION_LOG_FLUSH_INTERVAL 秒即可被讀取。
+    """
+    # 所屬計劃或案例已刪除的執行記錄即將被清理，不再接受日誌
+    visible = await db.scalar(select(TestExecution.id).where(TestExecution.id == execution_id, visible_executions()))
+    if visible is None:
+        raise HTTPException(status_code=404, detail="測試執行記錄不存在")
+    try:
+        await append_stream(db, execution_id, request.stream())
+    except ExecutionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except LogTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await log_info(db, execution_id)
+
+
+@router.delete("/{execution_id}/log", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_execution_log(execution_id: int, db: AsyncSession = Depends(get_async_db)):
+    """刪除執行日誌"""
+    if not await delete_log(db, execution_id):
+        raise HTTPException(status_code=404, detail="該執行記錄沒有日誌")
+    return None
+
+
+@router.get("/{execution_id}/log/info", response_model=ExecutionLogInfo, dependencies=[query_budget(1)])
+async def get_execution_log_info(execution_id: int, db: AsyncSession = Depends(get_read_db)):
+    """日誌大小、換行數和壓縮後的大小"""
+    info = await log_info(db, execution_id)
+    if not info["chunks"]:
+        raise HTTPException(status_code=404, detail="該執行記錄沒有日誌")
+    return info
+
+
+@router.api_route("/{execution_id}/log", methods=["GET", "HEAD"])
+async def get_execution_log(execution_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    """下載執行日誌，支持 Range 讀取任意字節範圍，只解壓與範圍重疊的塊
+
+    X-Log-Size 頭為日誌當前的總字節數；實時跟隨時以 `Range: bytes=<上次的大小>-` 輪詢，沒有新內容時返回416。
+    """
+    index = await _get_index(db, execution_id)
+    size = log_size(index)
+    headers = {"Accept-Ranges": "bytes", "X-Log-Size": str(size), "Cache-Control": "no-cache"}
+    byte_range = requested_range(request, size)
+    if byte_range is None:
+        status_code, start, end = 200, 0, size - 1
+    else:
+        status_code, (start, end) = 206, byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=LOG_MEDIA_TYPE)
+    return StreamingResponse(
+        iter_range(db, execution_id, index, start, end), status_code=status_code, headers=headers, media_type=LOG_MEDIA_TYPE,
+    )
+
+
+@router.get("/{execution_id}/log/tail", dependencies=[query_budget(2)])
+async def tail_execution_log(
+    execution_id: int,
+    lines: int = Query(100, ge=1, le=10000),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """日誌的最後若干行，只解壓末尾需要的塊
+
+    X-Log-Offset / X-Log-First-Line 為返回內容在日誌中的起始字節和行號。
+    """
+    index = await _get_index(db, execution_id)
+    content, offset, first_line = await tail(db, execution_id, lines, index)
+    return Response(content, media_type=LOG_MEDIA_TYPE, headers={
+        "X-Log-Size": str(log_size(index)), "X-Log-Offset": str(offset), "X-Log-First-Line": str(first_line),
+        "Cache-Control": "no-cache",
+    })
+
+
+@router.get("/{execution_id}/log/search", response_model=LogSearchResponse)
+async def search_execution_log(
+    execution_id: int,
+    q: str = Query(..., min_length=1, max_length=500, description="搜索的文本或正則表達式"),
+    regex: bool = Query(False, description="將 q 作為正則表達式"),
+    ignore_case: bool = False,
+    max_matches: int = Query(100, ge=1, le=1000),
+    start: int = Query(0, ge=0, description="從該字節位置開始搜索(上次結果的 next_offset)"),
+    end: Optional[int] = Query(None, ge=0, description="搜索到該字節位置為止"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """按行搜索日誌(類似 grep)，返回匹配行的行號、字節位置和內容"""
+    index = await _get_index(db, execution_id)
+    try:
+        return await search(db, execution_id, q, index, regex, ignore_case, max_matches, start, end)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"無效的正則表達式: {e}")
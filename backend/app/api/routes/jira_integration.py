@@ -1,192 +1,226 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from functools import partial
+from sqlalchemy import distinct, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict, Any
-import os
-from app.db.database import get_db
-from app.models.models import JiraIntegration, TestExecution, TestCase
-from app.schemas.schemas import JiraIntegrationCreate, JiraIntegrationResponse
+import orjson
+from app.db.database import AsyncSessionLocal, get_async_db
+from app.db.routing import get_read_db
+from app.api.bulk import read_bulk_payload
+from app.api.serialization import NegotiatedResponse
+from app.models.models import JiraIntegration, JiraIssueCache, JiraOutbox, TestExecution, TestCase
+from app.schemas.schemas import (
+    BulkResponse, JiraCoverageItem, JiraIntegrationCreate, JiraIntegrationResponse, JiraOutboxResponse,
+)
+from app.services.bulk_service import bulk_create, summarize
+from app.services.purge_service import get_active, not_deleted, visible_executions
 
 # Jira API相關
-from jira import JIRA
-from jira.exceptions import JIRAError
+from app.services import jira_client
+from app.services.jira_client import JiraUnavailableError, ensure_configured
+from app.services.jira_issue_cache import check_links, prefetch_issues
+from app.services.jira_sync_service import sync_issue_statuses
 
 router = APIRouter()
 
-# 獲取Jira客戶端
-def get_jira_client():
-    jira_url = os.getenv("JIRA_URL")
-    jira_username = os.getenv("JIRA_USERNAME")
-    jira_api_token = os.getenv("JIRA_API_TOKEN")
-    
-    if not jira_url or not jira_username or not jira_api_token:
-        raise HTTPException(
-            status_code=500,
-            detail="Jira整合未配置，請設置JIRA_URL、JIRA_USERNAME和JIRA_API_TOKEN環境變量"
-        )
-    
-    try:
-        jira = JIRA(
-            server=jira_url,
-            basic_auth=(jira_username, jira_api_token)
-        )
-        return jira
-    except JIRAError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Jira連接失敗: {str(e)}"
-        )
+def _jira_error(e: Exception) -> HTTPException:
+    if isinstance(e, jira_client.JIRAError):
+        return HTTPException(status_code=500, detail=f"Jira API錯誤: {str(e)}")
+    if isinstance(e, jira_client.RequestException):
+        return HTTPException(status_code=500, detail=f"Jira連接失敗: {str(e)}")
+    return HTTPException(status_code=500, detail=str(e))
 
 @router.post("/link", response_model=JiraIntegrationResponse)
-def link_to_jira(
+async def link_to_jira(
     integration: JiraIntegrationCreate,
-    db: Session = Depends(get_db),
-    jira: JIRA = Depends(get_jira_client)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """將測試案例或測試執行關聯到Jira問題"""
-    # 檢查Jira問題是否存在
+    # 檢查Jira問題是否存在(優先讀取本地緩存，未命中時通過JQL查詢並寫入緩存)
     try:
-        issue = jira.issue(integration.jira_issue_key)
-    except JIRAError as e:
-        if e.status_code == 404:
-            raise HTTPException(status_code=404, detail=f"Jira問題 {integration.jira_issue_key} 不存在")
-        raise HTTPException(status_code=500, detail=f"Jira API錯誤: {str(e)}")
+        issues = await prefetch_issues(db, [integration.jira_issue_key])
+    except (JiraUnavailableError, jira_client.JIRAError, jira_client.RequestException) as e:
+        raise _jira_error(e)
+    if integration.jira_issue_key.strip().upper() not in issues:
+        raise HTTPException(status_code=404, detail=f"Jira問題 {integration.jira_issue_key} 不存在")
     
     # 檢查測試案例是否存在（如果提供了）
     if integration.test_case_id:
-        test_case = db.query(TestCase).filter(TestCase.id == integration.test_case_id).first()
+        test_case = await get_active(db, TestCase, integration.test_case_id)
         if not test_case:
             raise HTTPException(status_code=404, detail=f"測試案例 ID {integration.test_case_id} 不存在")
     
     # 檢查測試執行是否存在（如果提供了）
     if integration.test_execution_id:
-        test_execution = db.query(TestExecution).filter(TestExecution.id == integration.test_execution_id).first()
+        test_execution = await db.scalar(
+            select(TestExecution.id).where(TestExecution.id == integration.test_execution_id, visible_executions())
+        )
         if not test_execution:
             raise HTTPException(status_code=404, detail=f"測試執行 ID {integration.test_execution_id} 不存在")
     
     # 創建關聯記錄
     db_integration = JiraIntegration(**integration.dict())
     db.add(db_integration)
-    db.commit()
-    db.refresh(db_integration)
+    await db.commit()
+    await db.refresh(db_integration)
     
     return db_integration
 
+@router.post("/links/bulk", response_model=BulkResponse)
+async def bulk_link_to_jira(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """批量創建Jira關聯，請求體為JSON數組或NDJSON；所有問題通過JQL批量預取校驗，不逐個請求Jira"""
+    payload = await read_bulk_payload(request)
+    try:
+        results = await bulk_create(db, JiraIntegration, JiraIntegrationCreate, payload, check=partial(check_links, db))
+    except (JiraUnavailableError, jira_client.JIRAError, jira_client.RequestException) as e:
+        raise _jira_error(e)
+    return NegotiatedResponse(summarize(results))
+
 @router.get("/links", response_model=List[JiraIntegrationResponse])
-def get_jira_links(
+async def get_jira_links(
     test_case_id: Optional[int] = None,
     test_execution_id: Optional[int] = None,
     jira_issue_key: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """獲取Jira關聯記錄"""
-    query = db.query(JiraIntegration)
+    query = select(JiraIntegration)
     
     if test_case_id:
-        query = query.filter(JiraIntegration.test_case_id == test_case_id)
+        query = query.where(JiraIntegration.test_case_id == test_case_id)
     
     if test_execution_id:
-        query = query.filter(JiraIntegration.test_execution_id == test_execution_id)
+        query = query.where(JiraIntegration.test_execution_id == test_execution_id)
     
     if jira_issue_key:
-        query = query.filter(JiraIntegration.jira_issue_key == jira_issue_key)
+        query = query.where(JiraIntegration.jira_issue_key == jira_issue_key)
     
-    return query.all()
+    return (await db.scalars(query)).all()
 
 @router.delete("/links/{integration_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_jira_link(integration_id: int, db: Session = Depends(get_db)):
+async def delete_jira_link(integration_id: int, db: AsyncSession = Depends(get_async_db)):
     """刪除Jira關聯記錄"""
-    db_integration = db.query(JiraIntegration).filter(JiraIntegration.id == integration_id).first()
+    db_integration = await db.get(JiraIntegration, integration_id)
     if not db_integration:
         raise HTTPException(status_code=404, detail="關聯記錄不存在")
     
-    db.delete(db_integration)
-    db.commit()
+    await db.delete(db_integration)
+    await db.commit()
     return None
 
+@router.get("/coverage", response_model=List[JiraCoverageItem])
+async def get_jira_coverage(
+    project_key: Optional[str] = None,
+    test_plan_id: Optional[int] = None,
+    refresh: bool = False,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Jira問題覆蓋率：關聯到測試案例的每個問題的元數據、案例數和執行狀態分佈
+
+    問題元數據只讀取本地緩存；refresh=true 時先批量刷新未緩存或已過期的問題。
+    """
+    links = (
+        select(JiraIntegration.jira_issue_key, JiraIntegration.test_case_id)
+        .join(TestCase, TestCase.id == JiraIntegration.test_case_id)
+        .where(not_deleted(TestCase))
+    )
+    if project_key:
+        links = links.where(JiraIntegration.jira_project_key == project_key)
+    links = links.subquery()
+    
+    case_counts = dict((await db.execute(
+        select(links.c.jira_issue_key, func.count(distinct(links.c.test_case_id))).group_by(links.c.jira_issue_key)
+    )).all())
+    if not case_counts:
+        return []
+    
+    executions = (
+        select(links.c.jira_issue_key, TestExecution.status, func.count(distinct(TestExecution.id)))
+        .join(TestExecution, TestExecution.test_case_id == links.c.test_case_id)
+        .where(visible_executions())
+        .group_by(links.c.jira_issue_key, TestExecution.status)
+    )
+    if test_plan_id is not None:
+        executions = executions.where(TestExecution.test_plan_id == test_plan_id)
+    execution_counts: Dict[str, Dict[str, int]] = {}
+    for issue_key, execution_status, count in (await db.execute(executions)).all():
+        execution_counts.setdefault(issue_key, {})[getattr(execution_status, "value", execution_status)] = count
+    
+    keys = {key.upper() for key in case_counts}
+    if refresh:
+        # 讀取會話可能指向只讀副本，緩存刷新在主庫會話中進行
+        async with AsyncSessionLocal() as write_db:
+            try:
+                await prefetch_issues(write_db, keys)
+            except (JiraUnavailableError, jira_client.JIRAError, jira_client.RequestException) as e:
+                raise _jira_error(e)
+    cached = {
+        row.jira_issue_key: row
+        for row in (await db.scalars(select(JiraIssueCache).where(JiraIssueCache.jira_issue_key.in_(keys)))).all()
+    }
+    
+    items = []
+    for issue_key in sorted(case_counts):
+        issue = cached.get(issue_key.upper())
+        items.append({
+            "jira_issue_key": issue_key,
+            "project_key": issue.project_key if issue else None,
+            "summary": issue.summary if issue else None,
+            "issue_status": issue.status if issue else None,
+            "issue_type": issue.issue_type if issue else None,
+            "cached_at": issue.fetched_at if issue else None,
+            "test_case_count": case_counts[issue_key],
+            "execution_counts": execution_counts.get(issue_key, {}),
+        })
+    return items
+
+@router.get("/outbox", response_model=List[JiraOutboxResponse])
+async def get_jira_outbox(
+    failed: Optional[bool] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """查看等待發送(failed=false)或已放棄(failed=true)的Jira同步條目"""
+    query = select(JiraOutbox)
+    if failed is not None:
+        query = query.where(JiraOutbox.failed_at.isnot(None) if failed else JiraOutbox.failed_at.is_(None))
+    return (await db.scalars(query.order_by(JiraOutbox.available_at).limit(limit))).all()
+
 @router.post("/update-status/{execution_id}")
-def update_jira_status(
+async def update_jira_status(
     execution_id: int,
-    db: Session = Depends(get_db),
-    jira: JIRA = Depends(get_jira_client)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """更新Jira問題狀態，基於測試執行結果"""
+    """更新Jira問題狀態，基於測試執行結果
+
+    關聯的問題並發處理；請求頭 `Accept: application/x-ndjson` 時按完成順序逐行返回每個問題的結果。
+    """
     # 獲取測試執行
-    execution = db.query(TestExecution).filter(TestExecution.id == execution_id).first()
+    execution = await db.get(TestExecution, execution_id)
     if not execution:
         raise HTTPException(status_code=404, detail="測試執行不存在")
     
-    # 檢查是否有關聯的Jira問題
-    integrations = db.query(JiraIntegration).filter(JiraIntegration.test_execution_id == execution_id).all()
-    if not integrations:
+    # 檢查是否有關聯的Jira問題(同一問題只同步一次)
+    issue_keys = list(dict.fromkeys((await db.scalars(
+        select(JiraIntegration.jira_issue_key).where(JiraIntegration.test_execution_id == execution_id)
+    )).all()))
+    if not issue_keys:
         raise HTTPException(status_code=404, detail="沒有找到關聯的Jira問題")
     
-    results = []
-    for integration in integrations:
-        try:
-            issue = jira.issue(integration.jira_issue_key)
-            
-            # 根據測試結果添加評論
-            if execution.status == "passed":
-                comment = f"✅ 測試通過: 執行ID {execution_id} 已成功通過測試。"
-                transition_name = "Done"  # 假設的工作流轉換名稱
-            elif execution.status == "failed":
-                comment = f"❌ 測試失敗: 執行ID {execution_id} 未通過測試。請檢查詳細結果。"
-                transition_name = "Reopen"  # 假設的工作流轉換名稱
-            else:
-                comment = f"⚠️ 測試狀態: 執行ID {execution_id} 的狀態為 {execution.status}。"
-                transition_name = None
-            
-            # 添加評論
-            jira.add_comment(issue, comment)
-            
-            # 嘗試轉換問題狀態（這需要根據您的Jira工作流配置）
-            if transition_name:
-                try:
-                    # 獲取可用的轉換
-                    transitions = jira.transitions(issue)
-                    transition_id = None
-                    
-                    # 查找匹配的轉換
-                    for t in transitions:
-                        if t['name'].lower() == transition_name.lower():
-                            transition_id = t['id']
-                            break
-                    
-                    if transition_id:
-                        jira.transition_issue(issue, transition_id)
-                        results.append({
-                            "issue_key": integration.jira_issue_key,
-                            "comment_added": True,
-                            "status_updated": True,
-                            "new_status": transition_name
-                        })
-                    else:
-                        results.append({
-                            "issue_key": integration.jira_issue_key,
-                            "comment_added": True,
-                            "status_updated": False,
-                            "error": f"無法找到名為 '{transition_name}' 的轉換"
-                        })
-                except JIRAError as e:
-                    results.append({
-                        "issue_key": integration.jira_issue_key,
-                        "comment_added": True,
-                        "status_updated": False,
-                        "error": str(e)
-                    })
-            else:
-                results.append({
-                    "issue_key": integration.jira_issue_key,
-                    "comment_added": True,
-                    "status_updated": False
-                })
-                
-        except JIRAError as e:
-            results.append({
-                "issue_key": integration.jira_issue_key,
-                "error": str(e),
-                "comment_added": False,
-                "status_updated": False
-            })
-    
-    return {"results": results} 
\ No newline at end of file
+    try:
+        ensure_configured()
+    except JiraUnavailableError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    results = sync_issue_statuses(execution_id, execution.status, issue_keys)
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        return StreamingResponse(
+            (orjson.dumps(result) + b"\n" async for result in results),
+            media_type="application/x-ndjson",
+        )
+    
+    # 普通JSON響應按關聯順序返回
+    collected = sorted([result async for result in results], key=lambda result: result.pop("index"))
+    return {"results": collected}
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Response
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Response
 from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
-import tempfile
-from app.db.database import get_db
-from app.models.models import TestPlan, TestExecution, TestCase
+from app.core.metrics import record_cache
+from app.api.conditional import is_not_modified, make_etag, not_modified_response, set_etag
+from app.db.database import get_async_db
+from app.db.routing import get_read_db, read_session
+from app.core.query_budget import query_budget
+from app.models.models import TestPlan
 from app.schemas.schemas import ReportRequest
-from app.services.report_service import generate_pdf_report, generate_html_report
+from app.services.report_service import generate_pdf_report, generate_html_report, plan_status_counts
+from app.services.purge_service import get_active, not_deleted
 
 router = APIRouter()
 
@@ -14,11 +19,11 @@ router = APIRouter()
 async def generate_report(
     request: ReportRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """生成測試報告 - 異步任務"""
     # 檢查測試計劃是否存在
-    test_plan = db.query(TestPlan).filter(TestPlan.id == request.test_plan_id).first()
+    test_plan = await get_active(db, TestPlan, request.test_plan_id)
     if not test_plan:
         raise HTTPException(status_code=404, detail="測試計劃不存在")
     
@@ -31,8 +36,7 @@ async def generate_report(
         _generate_report_task,
         test_plan_id=request.test_plan_id,
         format=request.format,
-        task_id=task_id,
-        db=db
+        task_id=task_id
     )
     
     return {
@@ -40,11 +44,11 @@ async def generate_report(
         "task_id": task_id
     }
 
-@router.get("/download/{test_plan_id}")
-async def download_report(test_plan_id: int, format: str = "pdf", db: Session = Depends(get_db)):
+@router.get("/download/{test_plan_id}", dependencies=[query_budget(8)])
+async def download_report(test_plan_id: int, format: str = "pdf", db: AsyncSession = Depends(get_read_db)):
     """下載測試報告"""
     # 檢查測試計劃是否存在
-    test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
+    test_plan = await get_active(db, TestPlan, test_plan_id)
     if not test_plan:
         raise HTTPException(status_code=404, detail="測試計劃不存在")
     
@@ -56,9 +60,11 @@ async def download_report(test_plan_id: int, format: str = "pdf", db: Session =
     
     if format.lower() == "pdf":
         file_path = os.path.join(reports_dir, f"{filename}.pdf")
-        if not os.path.exists(file_path):
+        cached = os.path.exists(file_path)
+        record_cache("report_file", int(cached), int(not cached))
+        if not cached:
             # 即時生成報告
-            file_path = generate_pdf_report(test_plan_id, db)
+            file_path = await generate_pdf_report(test_plan_id, db)
         return FileResponse(
             path=file_path,
             filename=f"{test_plan.name}_report.pdf",
@@ -66,9 +72,11 @@ async def download_report(test_plan_id: int, format: str = "pdf", db: Session =
         )
     elif format.lower() == "html":
         file_path = os.path.join(reports_dir, f"{filename}.html")
-        if not os.path.exists(file_path):
+        cached = os.path.exists(file_path)
+        record_cache("report_file", int(cached), int(not cached))
+        if not cached:
             # 即時生成報告
-            file_path = generate_html_report(test_plan_id, db)
+            file_path = await generate_html_report(test_plan_id, db)
         return FileResponse(
             path=file_path,
             filename=f"{test_plan.name}_report.html",
@@ -77,24 +85,39 @@ async def download_report(test_plan_id: int, format: str = "pdf", db: Session =
     else:
         raise HTTPException(status_code=400, detail="不支持的報告格式，目前支持pdf和html")
 
-@router.get("/summary/{test_plan_id}")
-async def get_test_summary(test_plan_id: int, db: Session = Depends(get_db)):
+@router.get("/summary/{test_plan_id}", dependencies=[query_budget(5)])
+async def get_test_summary(
+    test_plan_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db)
+):
     """獲取測試計劃的摘要信息，包括通過/失敗/跳過的數量"""
-    # 檢查測試計劃是否存在
-    test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
+    # 摘要只取決於計劃自身字段和計劃下的執行數據，兩個版本號都未變時直接返回304
+    versions = (await db.execute(
+        select(TestPlan.version, TestPlan.data_version).where(TestPlan.id == test_plan_id, not_deleted(TestPlan))
+    )).first()
+    if versions is None:
+        raise HTTPException(status_code=404, detail="測試計劃不存在")
+    etag = make_etag(request, *versions)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+    set_etag(response, etag)
+
+    test_plan = await db.get(TestPlan, test_plan_id)
     if not test_plan:
         raise HTTPException(status_code=404, detail="測試計劃不存在")
     
-    # 獲取該測試計劃下的所有測試執行
-    executions = db.query(TestExecution).filter(TestExecution.test_plan_id == test_plan_id).all()
+    # 按狀態聚合該測試計劃下的測試執行數量(包括已歸檔的執行記錄)
+    counts = await plan_status_counts(db, test_plan_id)
     
     # 計算統計數據
-    total = len(executions)
-    passed = sum(1 for e in executions if e.status == "passed")
-    failed = sum(1 for e in executions if e.status == "failed")
-    skipped = sum(1 for e in executions if e.status == "skipped")
-    pending = sum(1 for e in executions if e.status == "pending")
-    blocked = sum(1 for e in executions if e.status == "blocked")
+    total = sum(counts.values())
+    passed = counts.get("passed", 0)
+    failed = counts.get("failed", 0)
+    skipped = counts.get("skipped", 0)
+    pending = counts.get("pending", 0)
+    blocked = counts.get("blocked", 0)
     
     # 計算完成率
     completion_rate = (passed + failed + skipped) / total if total > 0 else 0
@@ -120,14 +143,15 @@ async def get_test_summary(test_plan_id: int, db: Session = Depends(get_db)):
     }
 
 # 後台任務函數
-async def _generate_report_task(test_plan_id: int, format: str, task_id: str, db: Session):
+async def _generate_report_task(test_plan_id: int, format: str, task_id: str):
     """背景任務：生成報告"""
     try:
-        if format.lower() == "pdf":
-            generate_pdf_report(test_plan_id, db)
-        elif format.lower() == "html":
-            generate_html_report(test_plan_id, db)
-        else:
-            print(f"不支持的報告格式: {format}")
+        async with read_session() as db:
+            if format.lower() == "pdf":
+                await generate_pdf_report(test_plan_id, db)
+            elif format.lower() == "html":
+                await generate_html_report(test_plan_id, db)
+            else:
+                print(f"不支持的報告格式: {format}")
     except Exception as e:
         print(f"生成報告時出錯: {str(e)}") 
\ No newline at end of file
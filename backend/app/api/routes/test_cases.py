@@ -1,76 +1,135 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.db.database import get_db
+from app.db.database import get_async_db
+from app.db.routing import get_read_db
+from app.core.query_budget import query_budget
+from app.api.serialization import NegotiatedResponse
+from app.api.conditional import is_not_modified, make_etag, not_modified_response, set_etag
+from app.api.bulk import read_bulk_payload
+from app.api.fieldsets import FIELDS_QUERY, FieldSelection
 from app.models.models import TestCase
-from app.schemas.schemas import TestCaseCreate, TestCaseResponse, TestCaseUpdate, PaginatedResponse
+from app.schemas.schemas import TestCaseCreate, TestCaseResponse, TestCaseUpdate, PaginatedResponse, BulkResponse
+from app.services.bulk_service import bulk_create, bulk_delete, bulk_update, summarize
+from app.services.purge_service import get_active, not_deleted, run_purge, soft_delete
 
 router = APIRouter()
 
 @router.post("/", response_model=TestCaseResponse, status_code=status.HTTP_201_CREATED)
-def create_test_case(test_case: TestCaseCreate, db: Session = Depends(get_db)):
+async def create_test_case(test_case: TestCaseCreate, db: AsyncSession = Depends(get_async_db)):
     """創建新的測試案例"""
     db_test_case = TestCase(**test_case.dict())
     db.add(db_test_case)
-    db.commit()
-    db.refresh(db_test_case)
+    await db.commit()
+    await db.refresh(db_test_case)
     return db_test_case
 
-@router.get("/", response_model=PaginatedResponse)
-def get_test_cases(
+@router.get("/", response_model=PaginatedResponse, dependencies=[query_budget(3)])
+async def get_test_cases(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     title: Optional[str] = None,
     test_type: Optional[str] = None,
     priority: Optional[str] = None,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = FIELDS_QUERY,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """獲取測試案例列表，支持分頁和篩選"""
-    query = db.query(TestCase)
+    """獲取測試案例列表，支持分頁、篩選和字段選擇"""
+    selection = FieldSelection(TestCase, TestCaseResponse, fields)
+    query = select(TestCase).where(not_deleted(TestCase))
     
     # 應用篩選條件
     if title:
-        query = query.filter(TestCase.title.ilike(f"%{title}%"))
+        query = query.where(TestCase.title.ilike(f"%{title}%"))
     
     if test_type:
-        query = query.filter(TestCase.test_type == test_type)
+        query = query.where(TestCase.test_type == test_type)
     
     if priority:
-        query = query.filter(TestCase.priority == priority)
+        query = query.where(TestCase.priority == priority)
     
     # 計算總數
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # 應用分頁
-    test_cases = query.offset(skip).limit(limit).all()
+    test_cases = (await db.scalars(
+        query.options(*selection.options()).order_by(TestCase.id).offset(skip).limit(limit)
+    )).all()
     
     # 計算總頁數
     pages = (total + limit - 1) // limit if total > 0 else 0
     
-    return {
-        "items": test_cases,
+    # 列表項已轉換為字典，直接編碼以跳過響應模型的二次校驗
+    return NegotiatedResponse({
+        "items": selection.dump_all(test_cases),
         "total": total,
         "page": skip // limit + 1,
         "page_size": limit,
         "pages": pages
-    }
+    })
 
-@router.get("/{test_case_id}", response_model=TestCaseResponse)
-def get_test_case(test_case_id: int, db: Session = Depends(get_db)):
+# 批量操作路由需在 /{test_case_id} 之前註冊
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_create_test_cases(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """批量創建測試案例，請求體為JSON數組或NDJSON，按批提交並返回每個條目的狀態"""
+    results = await bulk_create(db, TestCase, TestCaseCreate, await read_bulk_payload(request))
+    return NegotiatedResponse(summarize(results))
+
+@router.patch("/bulk", response_model=BulkResponse)
+async def bulk_update_test_cases(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """批量更新測試案例，每個條目需包含 id，只更新提供的字段"""
+    results = await bulk_update(db, TestCase, TestCaseUpdate, await read_bulk_payload(request))
+    return NegotiatedResponse(summarize(results))
+
+@router.delete("/bulk", response_model=BulkResponse)
+async def bulk_delete_test_cases(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量刪除測試案例，請求體為ID數組或包含 id 的對象"""
+    results = await bulk_delete(db, TestCase, await read_bulk_payload(request))
+    background_tasks.add_task(run_purge)
+    return NegotiatedResponse(summarize(results))
+
+@router.get("/{test_case_id}", response_model=TestCaseResponse, dependencies=[query_budget(3)])
+async def get_test_case(
+    test_case_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = FIELDS_QUERY,
+    db: AsyncSession = Depends(get_read_db)
+):
     """根據ID獲取測試案例詳情"""
-    db_test_case = db.query(TestCase).filter(TestCase.id == test_case_id).first()
+    selection = FieldSelection(TestCase, TestCaseResponse, fields)
+    # 先只查詢版本號(覆蓋索引)，未變更時不加載實體
+    version = await db.scalar(select(TestCase.version).where(TestCase.id == test_case_id, not_deleted(TestCase)))
+    if version is None:
+        raise HTTPException(status_code=404, detail="測試案例不存在")
+    etag = make_etag(request, version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    db_test_case = (await db.scalars(
+        select(TestCase).options(*selection.options()).where(TestCase.id == test_case_id)
+    )).first()
     if db_test_case is None:
         raise HTTPException(status_code=404, detail="測試案例不存在")
+    # 部分字段的響應不符合完整響應模型，直接返回JSON
+    if selection.sparse:
+        return set_etag(NegotiatedResponse(selection.dump(db_test_case)), etag)
+    set_etag(response, etag)
     return db_test_case
 
 @router.put("/{test_case_id}", response_model=TestCaseResponse)
-def update_test_case(
+async def update_test_case(
     test_case_id: int, 
     test_case: TestCaseUpdate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新測試案例信息"""
-    db_test_case = db.query(TestCase).filter(TestCase.id == test_case_id).first()
+    db_test_case = await get_active(db, TestCase, test_case_id)
     if db_test_case is None:
         raise HTTPException(status_code=404, detail="測試案例不存在")
     
@@ -79,17 +138,18 @@ def update_test_case(
     for key, value in update_data.items():
         setattr(db_test_case, key, value)
     
-    db.commit()
-    db.refresh(db_test_case)
+    await db.commit()
+    await db.refresh(db_test_case)
     return db_test_case
 
 @router.delete("/{test_case_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_test_case(test_case_id: int, db: Session = Depends(get_db)):
-    """刪除測試案例"""
-    db_test_case = db.query(TestCase).filter(TestCase.id == test_case_id).first()
-    if db_test_case is None:
+async def delete_test_case(
+    test_case_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """刪除測試案例：立即軟刪除並返回，執行記錄等關聯數據由後台任務分批清理"""
+    if not await soft_delete(db, TestCase, [test_case_id]):
         raise HTTPException(status_code=404, detail="測試案例不存在")
-    
-    db.delete(db_test_case)
-    db.commit()
-    return None 
\ No newline at end of file
+    background_tasks.add_task(run_purge)
+    return None
@@ -1,84 +1,189 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
 from datetime import datetime
-from app.db.database import get_db
-from app.models.models import TestExecution, TestResult
+from app.db.database import get_async_db
+from app.db.routing import get_read_db
+from app.core.query_budget import query_budget
+from app.api.serialization import NegotiatedResponse
+from app.api.conditional import is_not_modified, make_etag, not_modified_response, set_etag
+from app.api.fieldsets import EXPAND_QUERY, FIELDS_QUERY, FieldSelection
+from app.models.models import TestCase, TestExecution, TestPlan, TestResult
 from app.schemas.schemas import (
     TestExecutionCreate, 
     TestExecutionResponse, 
     TestExecutionUpdate, 
     TestResultCreate,
     TestResultResponse,
+    TestCaseResponse,
+    TestPlanResponse,
     PaginatedResponse
 )
+from app.services.jira_outbox_service import enqueue_status_changes
+from app.services.partition_service import plan_pruning_clause, execution_pruning_clause
+from app.services.purge_service import delete_executions, get_active, visible_executions
+from app.services.result_store import append_packed_steps, expand_packed_results, unpack_results, use_packed_storage
 
 router = APIRouter()
 
+# 可通過 expand 參數展開的關聯：(響應模式, 需要同時加載的列)
+EXPANDABLE = {
+    "test_results": (TestResultResponse, ["packed_results"]),
+    "test_case": (TestCaseResponse, ["test_case_id"]),
+    "test_plan": (TestPlanResponse, ["test_plan_id"]),
+}
+
+def _execution_selection(fields: Optional[str], expand: Optional[str]) -> FieldSelection:
+    # 未指定 fields/expand 時保持原有響應結構，即包含步驟結果
+    return FieldSelection(
+        TestExecution, TestExecutionResponse, fields, expand,
+        expandable=EXPANDABLE, default_expand=("test_results",),
+    )
+
+def _covers_related(selection: FieldSelection) -> bool:
+    # 展開的測試案例、測試計劃有各自的版本號，不在執行記錄的ETag覆蓋範圍內
+    return not {"test_case", "test_plan"} & set(selection.expand)
+
+async def _get_execution_with_results(db: AsyncSession, execution_id: int) -> Optional[TestExecution]:
+    """查詢測試執行記錄並預加載步驟結果(異步會話不支持延遲加載)"""
+    query = (
+        select(TestExecution)
+        .options(selectinload(TestExecution.test_results))
+        .where(TestExecution.id == execution_id)
+        .execution_options(populate_existing=True)
+    )
+    execution = (await db.scalars(query)).first()
+    if execution is not None:
+        await expand_packed_results(db, [execution])
+    return execution
+
+async def _get_visible_execution(db: AsyncSession, execution_id: int) -> Optional[TestExecution]:
+    """按ID獲取所屬測試計劃和測試案例均未被軟刪除的執行記錄"""
+    return (await db.scalars(
+        select(TestExecution).where(TestExecution.id == execution_id, visible_executions())
+    )).first()
+
 @router.post("/", response_model=TestExecutionResponse, status_code=status.HTTP_201_CREATED)
-def create_test_execution(test_execution: TestExecutionCreate, db: Session = Depends(get_db)):
+async def create_test_execution(test_execution: TestExecutionCreate, db: AsyncSession = Depends(get_async_db)):
     """創建新的測試執行記錄"""
+    # 驗證測試計劃和測試案例存在且未被刪除
+    if not await get_active(db, TestPlan, test_execution.test_plan_id):
+        raise HTTPException(status_code=404, detail=f"測試計劃ID {test_execution.test_plan_id} 不存在")
+    if not await get_active(db, TestCase, test_execution.test_case_id):
+        raise HTTPException(status_code=404, detail=f"測試案例ID {test_execution.test_case_id} 不存在")
     db_test_execution = TestExecution(**test_execution.dict())
     db.add(db_test_execution)
-    db.commit()
-    db.refresh(db_test_execution)
-    return db_test_execution
+    await db.commit()
+    return await _get_execution_with_results(db, db_test_execution.id)
 
-@router.get("/", response_model=PaginatedResponse)
-def get_test_executions(
+@router.get("/", response_model=PaginatedResponse, dependencies=[query_budget(6)])
+async def get_test_executions(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     test_plan_id: Optional[int] = None,
     test_case_id: Optional[int] = None,
     status: Optional[str] = None,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = FIELDS_QUERY,
+    expand: Optional[str] = EXPAND_QUERY,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """獲取測試執行記錄列表，支持分頁和篩選"""
-    query = db.query(TestExecution)
+    """獲取測試執行記錄列表，支持分頁、篩選、字段選擇和關聯展開"""
+    selection = _execution_selection(fields, expand)
+
+    # 按測試計劃篩選時，計劃的數據版本號覆蓋整個列表
+    etag = None
+    if test_plan_id and _covers_related(selection):
+        data_version = await db.scalar(select(TestPlan.data_version).where(TestPlan.id == test_plan_id))
+        etag = make_etag(request, data_version)
+        if is_not_modified(request, etag):
+            return not_modified_response(etag)
+
+    # 已軟刪除的計劃或案例下的執行記錄不可見
+    query = select(TestExecution).where(visible_executions())
     
     # 應用篩選條件
     if test_plan_id:
-        query = query.filter(TestExecution.test_plan_id == test_plan_id)
+        query = query.where(TestExecution.test_plan_id == test_plan_id, plan_pruning_clause(test_plan_id))
     
     if test_case_id:
-        query = query.filter(TestExecution.test_case_id == test_case_id)
+        query = query.where(TestExecution.test_case_id == test_case_id)
     
     if status:
-        query = query.filter(TestExecution.status == status)
+        query = query.where(TestExecution.status == status)
     
     # 計算總數
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # 應用分頁
-    test_executions = query.offset(skip).limit(limit).all()
+    test_executions = (await db.scalars(
+        query.options(*selection.options())
+        .order_by(TestExecution.id)
+        .offset(skip)
+        .limit(limit)
+    )).all()
+    if "test_results" in selection.expand:
+        await expand_packed_results(db, test_executions)
     
     # 計算總頁數
     pages = (total + limit - 1) // limit if total > 0 else 0
     
-    return {
-        "items": test_executions,
+    # 列表項已轉換為字典，直接編碼以跳過響應模型的二次校驗
+    return set_etag(NegotiatedResponse({
+        "items": selection.dump_all(test_executions),
         "total": total,
         "page": skip // limit + 1,
         "page_size": limit,
         "pages": pages
-    }
+    }), etag)
 
-@router.get("/{execution_id}", response_model=TestExecutionResponse)
-def get_test_execution(execution_id: int, db: Session = Depends(get_db)):
+@router.get("/{execution_id}", response_model=TestExecutionResponse, dependencies=[query_budget(4)])
+async def get_test_execution(
+    execution_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = FIELDS_QUERY,
+    expand: Optional[str] = EXPAND_QUERY,
+    db: AsyncSession = Depends(get_read_db)
+):
     """根據ID獲取測試執行記錄詳情"""
-    db_test_execution = db.query(TestExecution).filter(TestExecution.id == execution_id).first()
+    selection = _execution_selection(fields, expand)
+
+    # 先只查詢版本號(覆蓋索引)，未變更時不加載實體
+    version = await db.scalar(select(TestExecution.version).where(TestExecution.id == execution_id, visible_executions()))
+    if version is None:
+        raise HTTPException(status_code=404, detail="測試執行記錄不存在")
+    etag = make_etag(request, version) if _covers_related(selection) else None
+    if etag and is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    if not selection.sparse:
+        db_test_execution = await _get_execution_with_results(db, execution_id)
+        if db_test_execution is None:
+            raise HTTPException(status_code=404, detail="測試執行記錄不存在")
+        set_etag(response, etag)
+        return db_test_execution
+
+    db_test_execution = (await db.scalars(
+        select(TestExecution).options(*selection.options()).where(TestExecution.id == execution_id)
+    )).first()
     if db_test_execution is None:
         raise HTTPException(status_code=404, detail="測試執行記錄不存在")
-    return db_test_execution
+    if "test_results" in selection.expand:
+        await expand_packed_results(db, [db_test_execution])
+    # 部分字段的響應不符合完整響應模型，直接返回JSON
+    return set_etag(NegotiatedResponse(selection.dump(db_test_execution)), etag)
 
 @router.put("/{execution_id}", response_model=TestExecutionResponse)
-def update_test_execution(
+async def update_test_execution(
     execution_id: int, 
     test_execution: TestExecutionUpdate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新測試執行記錄信息"""
-    db_test_execution = db.query(TestExecution).filter(TestExecution.id == execution_id).first()
+    db_test_execution = await _get_visible_execution(db, execution_id)
     if db_test_execution is None:
         raise HTTPException(status_code=404, detail="測試執行記錄不存在")
     
@@ -90,53 +195,71 @@ def update_test_execution(
         if not db_test_execution.executed_at:
             update_data["executed_at"] = datetime.now()
     
+    previous_status = db_test_execution.status
     for key, value in update_data.items():
         setattr(db_test_execution, key, value)
     
-    db.commit()
-    db.refresh(db_test_execution)
-    return db_test_execution
+    # 狀態變更與Jira同步事件在同一事務中寫入發件箱，由後台分發器合併發送
+    if "status" in update_data and db_test_execution.status != previous_status:
+        await enqueue_status_changes(
+            db, [(execution_id, db_test_execution.test_case_id, db_test_execution.status)]
+        )
+    
+    await db.commit()
+    return await _get_execution_with_results(db, execution_id)
 
 @router.delete("/{execution_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_test_execution(execution_id: int, db: Session = Depends(get_db)):
-    """刪除測試執行記錄"""
-    db_test_execution = db.query(TestExecution).filter(TestExecution.id == execution_id).first()
-    if db_test_execution is None:
+async def delete_test_execution(execution_id: int, db: AsyncSession = Depends(get_async_db)):
+    """刪除測試執行記錄及其步驟結果"""
+    if not await delete_executions(db, [execution_id]):
         raise HTTPException(status_code=404, detail="測試執行記錄不存在")
-    
-    db.delete(db_test_execution)
-    db.commit()
+    await db.commit()
     return None
 
 # 測試結果相關路由
 @router.post("/{execution_id}/results", response_model=TestResultResponse)
-def add_test_result(
+async def add_test_result(
     execution_id: int,
     test_result: TestResultCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """添加測試步驟結果"""
-    # 檢查測試執行記錄是否存在
-    db_test_execution = db.query(TestExecution).filter(TestExecution.id == execution_id).first()
+    # 檢查測試執行記錄是否存在(所屬計劃或案例已刪除時視為不存在)
+    db_test_execution = await _get_visible_execution(db, execution_id)
     if db_test_execution is None:
         raise HTTPException(status_code=404, detail="測試執行記錄不存在")
     
+    # 緊湊存儲模式：追加到執行記錄的打包列
+    if use_packed_storage() or db_test_execution.packed_results:
+        step = test_result.dict()
+        if not await append_packed_steps(db, execution_id, [step]):
+            raise HTTPException(status_code=404, detail="測試執行記錄不存在")
+        return TestResultResponse(**step, test_execution_id=execution_id)
+    
     # 創建測試結果
     db_test_result = TestResult(**test_result.dict(), test_execution_id=execution_id)
     db.add(db_test_result)
-    db.commit()
-    db.refresh(db_test_result)
+    await db.commit()
+    await db.refresh(db_test_result)
     
     return db_test_result
 
-@router.get("/{execution_id}/results", response_model=List[TestResultResponse])
-def get_test_results(execution_id: int, db: Session = Depends(get_db)):
+@router.get("/{execution_id}/results", response_model=List[TestResultResponse], dependencies=[query_budget(3)])
+async def get_test_results(execution_id: int, db: AsyncSession = Depends(get_read_db)):
     """獲取測試執行的所有步驟結果"""
-    # 檢查測試執行記錄是否存在
-    db_test_execution = db.query(TestExecution).filter(TestExecution.id == execution_id).first()
+    # 檢查測試執行記錄是否存在(所屬計劃或案例已刪除時視為不存在)
+    db_test_execution = await _get_visible_execution(db, execution_id)
     if db_test_execution is None:
         raise HTTPException(status_code=404, detail="測試執行記錄不存在")
     
     # 獲取所有測試結果
-    results = db.query(TestResult).filter(TestResult.test_execution_id == execution_id).all()
-    return results 
\ No newline at end of file
+    results = (await db.scalars(
+        select(TestResult).where(
+            TestResult.test_execution_id == execution_id,
+            execution_pruning_clause(execution_id)
+        )
+    )).all()
+    
+    # 合併緊湊存儲的步驟結果
+    packed = (await unpack_results(db, [db_test_execution])).get(execution_id, [])
+    return sorted(list(results) + packed, key=lambda r: r.step_number)
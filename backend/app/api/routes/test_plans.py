@@ -1,68 +1,185 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+import asyncio
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, WebSocket, status
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.db.database import get_db
+from app.db.database import get_async_db
+from app.db.routing import get_read_db, read_session
+from app.core.query_budget import query_budget
+from app.api.serialization import NegotiatedResponse
+from app.api.conditional import is_not_modified, make_etag, not_modified_response, set_etag
+from app.api.bulk import read_bulk_payload
+from app.api.fieldsets import FIELDS_QUERY, FieldSelection
 from app.models.models import TestPlan
-from app.schemas.schemas import TestPlanCreate, TestPlanResponse, TestPlanUpdate, PaginatedResponse
+from app.schemas.schemas import (
+    TestPlanCreate, TestPlanResponse, TestPlanUpdate, PaginatedResponse, BulkResponse,
+    PlanInstantiateRequest, PlanInstantiateResponse,
+)
+from app.services.bulk_service import bulk_create, bulk_delete, bulk_update, summarize
+from app.services.live_feed import LiveFeedLoadError, live_feed
+from app.services.purge_service import get_active, not_deleted, run_purge, soft_delete
+from app.services.plan_service import instantiate_plan
 
 router = APIRouter()
 
 @router.post("/", response_model=TestPlanResponse, status_code=status.HTTP_201_CREATED)
-def create_test_plan(test_plan: TestPlanCreate, db: Session = Depends(get_db)):
+async def create_test_plan(test_plan: TestPlanCreate, db: AsyncSession = Depends(get_async_db)):
     """創建新的測試計劃"""
     db_test_plan = TestPlan(**test_plan.dict())
     db.add(db_test_plan)
-    db.commit()
-    db.refresh(db_test_plan)
+    await db.commit()
+    await db.refresh(db_test_plan)
     return db_test_plan
 
-@router.get("/", response_model=PaginatedResponse)
-def get_test_plans(
+@router.get("/", response_model=PaginatedResponse, dependencies=[query_budget(3)])
+async def get_test_plans(
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     is_active: Optional[bool] = None,
-    db: Session = Depends(get_db)
+    fields: Optional[str] = FIELDS_QUERY,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """獲取測試計劃列表，支持分頁和篩選"""
-    query = db.query(TestPlan)
+    """獲取測試計劃列表，支持分頁、篩選和字段選擇"""
+    selection = FieldSelection(TestPlan, TestPlanResponse, fields)
+    query = select(TestPlan).where(not_deleted(TestPlan))
     
     # 根據活動狀態篩選
     if is_active is not None:
-        query = query.filter(TestPlan.is_active == is_active)
+        query = query.where(TestPlan.is_active == is_active)
     
     # 計算總數
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # 應用分頁
-    test_plans = query.offset(skip).limit(limit).all()
+    test_plans = (await db.scalars(
+        query.options(*selection.options()).order_by(TestPlan.id).offset(skip).limit(limit)
+    )).all()
     
     # 計算總頁數
     pages = (total + limit - 1) // limit if total > 0 else 0
     
-    return {
-        "items": test_plans,
+    # 列表項已轉換為字典，直接編碼以跳過響應模型的二次校驗
+    return NegotiatedResponse({
+        "items": selection.dump_all(test_plans),
         "total": total,
         "page": skip // limit + 1,
         "page_size": limit,
         "pages": pages
-    }
+    })
 
-@router.get("/{test_plan_id}", response_model=TestPlanResponse)
-def get_test_plan(test_plan_id: int, db: Session = Depends(get_db)):
+# 批量操作路由需在 /{test_plan_id} 之前註冊
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_create_test_plans(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """批量創建測試計劃，請求體為JSON數組或NDJSON，按批提交並返回每個條目的狀態"""
+    results = await bulk_create(db, TestPlan, TestPlanCreate, await read_bulk_payload(request))
+    return NegotiatedResponse(summarize(results))
+
+@router.patch("/bulk", response_model=BulkResponse)
+async def bulk_update_test_plans(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """批量更新測試計劃，每個條目需包含 id，只更新提供的字段"""
+    results = await bulk_update(db, TestPlan, TestPlanUpdate, await read_bulk_payload(request))
+    return NegotiatedResponse(summarize(results))
+
+@router.delete("/bulk", response_model=BulkResponse)
+async def bulk_delete_test_plans(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """批量刪除測試計劃，請求體為ID數組或包含 id 的對象"""
+    results = await bulk_delete(db, TestPlan, await read_bulk_payload(request))
+    background_tasks.add_task(run_purge)
+    return NegotiatedResponse(summarize(results))
+
+@router.get("/{test_plan_id}", response_model=TestPlanResponse, dependencies=[query_budget(3)])
+async def get_test_plan(
+    test_plan_id: int,
+    request: Request,
+    response: Response,
+    fields: Optional[str] = FIELDS_QUERY,
+    db: AsyncSession = Depends(get_read_db)
+):
     """根據ID獲取測試計劃詳情"""
-    db_test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
+    selection = FieldSelection(TestPlan, TestPlanResponse, fields)
+    # 先只查詢版本號(覆蓋索引)，未變更時不加載實體
+    version = await db.scalar(select(TestPlan.version).where(TestPlan.id == test_plan_id, not_deleted(TestPlan)))
+    if version is None:
+        raise HTTPException(status_code=404, detail="測試計劃不存在")
+    etag = make_etag(request, version)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag)
+
+    db_test_plan = (await db.scalars(
+        select(TestPlan).options(*selection.options()).where(TestPlan.id == test_plan_id)
+    )).first()
     if db_test_plan is None:
         raise HTTPException(status_code=404, detail="測試計劃不存在")
+    # 部分字段的響應不符合完整響應模型，直接返回JSON
+    if selection.sparse:
+        return set_etag(NegotiatedResponse(selection.dump(db_test_plan)), etag)
+    set_etag(response, etag)
     return db_test_plan
 
+@router.post("/{test_plan_id}/instantiate", response_model=PlanInstantiateResponse)
+async def instantiate_test_plan(
+    test_plan_id: int,
+    request: PlanInstantiateRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """按測試案例篩選條件、指定ID或複製已有計劃，一次性創建計劃的待執行記錄"""
+    if await get_active(db, TestPlan, test_plan_id) is None:
+        raise HTTPException(status_code=404, detail="測試計劃不存在")
+    if request.clone_from_plan_id is not None and await get_active(db, TestPlan, request.clone_from_plan_id) is None:
+        raise HTTPException(status_code=404, detail="要複製的測試計劃不存在")
+    return await instantiate_plan(db, test_plan_id, request)
+
+@router.websocket("/{test_plan_id}/live")
+async def live_test_plan_progress(websocket: WebSocket, test_plan_id: int):
+    """實時推送測試計劃的執行進度：連接後先收到狀態計數快照，之後是合併後的增量"""
+    # 只在連接時短暫佔用數據庫會話
+    async with read_session() as db:
+        test_plan = await get_active(db, TestPlan, test_plan_id)
+    if test_plan is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="測試計劃不存在")
+        return
+    if live_feed.bus is None:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="實時推送未啟動")
+        return
+    await websocket.accept()
+
+    async def send(queue: asyncio.Queue):
+        while True:
+            await websocket.send_text(await queue.get())
+
+    async def receive():
+        # 客戶端無需發送消息，讀取只用於及時發現斷開
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    try:
+        async with live_feed.subscribe(test_plan_id) as queue:
+            sender = asyncio.ensure_future(send(queue))
+            receiver = asyncio.ensure_future(receive())
+            try:
+                done, _ = await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sender.cancel()
+                receiver.cancel()
+            # 客戶端已斷開時忽略發送失敗，其他異常照常拋出
+            if receiver not in done:
+                sender.result()
+    except LiveFeedLoadError as e:
+        print(f"實時推送加載計劃 {test_plan_id} 的計數失敗: {str(e)}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason="加載測試計劃進度失敗")
+
 @router.put("/{test_plan_id}", response_model=TestPlanResponse)
-def update_test_plan(
+async def update_test_plan(
     test_plan_id: int, 
     test_plan: TestPlanUpdate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """更新測試計劃信息"""
-    db_test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
+    db_test_plan = await get_active(db, TestPlan, test_plan_id)
     if db_test_plan is None:
         raise HTTPException(status_code=404, detail="測試計劃不存在")
     
@@ -71,17 +188,18 @@ def update_test_plan(
     for key, value in update_data.items():
         setattr(db_test_plan, key, value)
     
-    db.commit()
-    db.refresh(db_test_plan)
+    await db.commit()
+    await db.refresh(db_test_plan)
     return db_test_plan
 
 @router.delete("/{test_plan_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_test_plan(test_plan_id: int, db: Session = Depends(get_db)):
-    """刪除測試計劃"""
-    db_test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
-    if db_test_plan is None:
+async def delete_test_plan(
+    test_plan_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """刪除測試計劃：立即軟刪除並返回，執行記錄等關聯數據由後台任務分批清理"""
+    if not await soft_delete(db, TestPlan, [test_plan_id]):
         raise HTTPException(status_code=404, detail="測試計劃不存在")
-    
-    db.delete(db_test_plan)
-    db.commit()
-    return None 
\ No newline at end of file
+    background_tasks.add_task(run_purge)
+    return None
@@ -0,0 +1,210 @@
+import contextvars
+import enum
+import gzip
+import os
+import typing
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import orjson
+from pydantic import BaseModel, TypeAdapter
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+# 響應體超過該字節數才壓縮
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# 只讀接口跳過Pydantic校驗，直接按響應模式的字段讀取ORM屬性(數據來自本庫，可信)
+SERIALIZATION_TRUSTED_READS = os.getenv("SERIALIZATION_TRUSTED_READS", "false").lower() in ("1", "true", "yes")
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_COMPRESSIBLE_TYPES = ("application/json", MSGPACK_MEDIA_TYPE, "application/x-ndjson", "text/")
+
+# 當前請求的 Accept 頭，由 ResponseEncodingMiddleware 設置
+_accept: contextvars.ContextVar[str] = contextvars.ContextVar("accept", default="")
+
+
+def _optional_module(name: str):
+    try:
+        return __import__(name)
+    except ImportError:
+        return None
+
+
+msgpack = _optional_module("msgpack")
+brotli = _optional_module("brotli")
+
+
+def _orjson_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"無法序列化類型: {type(obj).__name__}")
+
+
+# UTC時間輸出為 Z 後綴，與經過 response_model (Pydantic) 序列化的響應一致
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+
+def _msgpack_default(obj):
+    # 時間類型與JSON保持一致，使用ISO 8601字符串
+    if isinstance(obj, datetime) and obj.utcoffset() is not None and not obj.utcoffset():
+        return obj.replace(tzinfo=None).isoformat() + "Z"
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, enum.Enum):
+        return obj.value
+    return _orjson_default(obj)
+
+
+def wants_msgpack() -> bool:
+    return msgpack is not None and MSGPACK_MEDIA_TYPE in _accept.get()
+
+
+class NegotiatedResponse(Response):
+    """按 Accept 頭選擇 orjson 或 MessagePack 編碼的響應"""
+
+    media_type = "application/json"
+
+    def __init__(self, content: Any = None, status_code: int = 200, *args, **kwargs):
+        super().__init__(content, status_code, *args, **kwargs)
+        if msgpack is not None:
+            self.headers.add_vary_header("Accept")
+
+    def render(self, content: Any) -> bytes:
+        if wants_msgpack():
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+        return orjson.dumps(content, default=_orjson_default, option=_ORJSON_OPTIONS)
+
+
+# 每個響應模式的嵌套字段：{字段名: (嵌套模式, 是否列表)}
+_nested_fields: Dict[type, Dict[str, Tuple[Type[BaseModel], bool]]] = {}
+_list_adapters: Dict[type, TypeAdapter] = {}
+
+
+def _nested(schema: Type[BaseModel]) -> Dict[str, Tuple[Type[BaseModel], bool]]:
+    if schema not in _nested_fields:
+        nested = {}
+        for name, field in schema.model_fields.items():
+            annotation = field.annotation
+            is_list = typing.get_origin(annotation) in (list, List)
+            if is_list:
+                annotation = typing.get_args(annotation)[0]
+            if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+                nested[name] = (annotation, is_list)
+        _nested_fields[schema] = nested
+    return _nested_fields[schema]
+
+
+def _read_attributes(schema: Type[BaseModel], obj) -> Dict[str, Any]:
+    nested = _nested(schema)
+    data = {}
+    for name in schema.model_fields:
+        value = getattr(obj, name)
+        if name in nested and value is not None:
+            nested_schema, is_list = nested[name]
+            value = [_read_attributes(nested_schema, v) for v in value] if is_list else _read_attributes(nested_schema, value)
+        data[name] = value
+    return data
+
+
+def dump_model(schema: Type[BaseModel], obj) -> Dict[str, Any]:
+    """將ORM對象轉換為響應字典(值保留Python類型，由 NegotiatedResponse 編碼)"""
+    if SERIALIZATION_TRUSTED_READS:
+        return _read_attributes(schema, obj)
+    return schema.model_validate(obj, from_attributes=True).model_dump()
+
+
+def dump_models(schema: Type[BaseModel], objs) -> List[Dict[str, Any]]:
+    """批量轉換ORM對象，整個列表在 pydantic-core 中一次完成校驗"""
+    if SERIALIZATION_TRUSTED_READS:
+        return [_read_attributes(schema, obj) for obj in objs]
+    if schema not in _list_adapters:
+        _list_adapters[schema] = TypeAdapter(List[schema])
+    adapter = _list_adapters[schema]
+    return adapter.dump_python(adapter.validate_python(list(objs), from_attributes=True))
+
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class ResponseEncodingMiddleware:
+    """記錄請求的 Accept 頭供響應協商，並對超過閾值的響應做 br/gzip 壓縮
+
+    只壓縮一次性發送的響應體；流式響應(文件下載、NDJSON等)原樣透傳。
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        token = _accept.set(request_headers.get("accept", ""))
+        encoding = _choose_encoding(request_headers.get("accept-encoding", ""))
+        try:
+            if encoding is None:
+                await self.app(scope, receive, send)
+                return
+
+            pending_start = None
+
+            async def send_wrapper(message):
+                nonlocal pending_start
+                if message["type"] == "http.response.start":
+                    pending_start = message
+                    return
+                if message["type"] != "http.response.body" or pending_start is None:
+                    await send(message)
+                    return
+
+                start, pending_start = pending_start, None
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                body = message.get("body", b"")
+                content_type = headers.get("content-type", "")
+                if (
+                    not message.get("more_body", False)
+                    and len(body) >= self.minimum_size
+                    and "content-encoding" not in headers
+                    and content_type.startswith(_COMPRESSIBLE_TYPES)
+                ):
+                    body = _compress(encoding, body)
+                    headers["content-encoding"] = encoding
+                    headers["content-length"] = str(len(body))
+                    # 不同內容編碼的表示形式需要不同的強ETag
+                    etag = headers.get("etag")
+                    if etag and etag.endswith('"'):
+                        headers["etag"] = f'{etag[:-1]}-{encoding}"'
+                    message = {**message, "body": body}
+                headers.add_vary_header("Accept-Encoding")
+                await send({**start, "headers": headers.raw})
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _accept.reset(token)
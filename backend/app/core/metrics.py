@@ -0,0 +1,303 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+# 是否採集指標；關閉後中間件和數據庫事件監聽不會註冊
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# 延遲直方圖的桶上限(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 未匹配到路由的請求(404等)統一歸入一個標籤值，避免按原始路徑產生無限多的時間序列
+UNMATCHED_ROUTE = "<unmatched>"
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Prometheus 文本格式的指標；標籤值按位置傳入，更新時只做一次字典查找"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        # 同步引擎和線程池中的代碼也可能更新指標
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def samples(self) -> List[Tuple[str, Sequence[str], Sequence[str], float]]:
+        """返回 (指標名, 標籤名, 標籤值, 數值) 列表"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labelnames, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(f"{self.name}_total", self.labelnames, labels, value) for labels, value in items]
+
+
+class Gauge(_Metric):
+    """可增減的瞬時值；指定 collect 時在每次抓取時調用，返回 {標籤值元組: 數值}"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        if self.collect is not None:
+            values.update(self.collect())
+        return [(self.name, self.labelnames, labels, value) for labels, value in values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # [各桶計數(最後一個為+Inf), 總和]
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        """記錄代碼塊的耗時；也可作為裝飾器使用"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        bucket_labelnames = self.labelnames + ("le",)
+        samples = []
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", bucket_labelnames, labels + (_format_value(bound),), cumulative))
+            samples.append((f"{self.name}_sum", self.labelnames, labels, total))
+            samples.append((f"{self.name}_count", self.labelnames, labels, cumulative))
+        return samples
+
+
+def render() -> str:
+    """以Prometheus文本格式輸出所有指標"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# HTTP
+HTTP_REQUESTS = Counter("http_requests", "按路由模板和狀態碼統計的請求數", ("method", "route", "status"))
+HTTP_REQUEST_DURATION = Histogram("http_request_duration_seconds", "請求處理耗時(到響應體發送完畢)", ("method", "route"))
+HTTP_REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "正在處理的請求數", ("method",))
+HTTP_REQUEST_DB_QUERIES = Histogram("http_request_db_queries", "每個請求執行的SQL語句數", ("route",), QUERY_COUNT_BUCKETS)
+HTTP_REQUEST_DB_DURATION = Histogram("http_request_db_duration_seconds", "每個請求在數據庫上花費的時間", ("route",))
+
+# 數據庫
+DB_QUERIES = Counter("db_queries", "執行的SQL語句數", ("engine",))
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "單條SQL語句的執行耗時", ("engine",), QUERY_BUCKETS)
+DB_POOL_CHECKOUT_WAIT = Histogram("db_pool_checkout_wait_seconds", "從連接池取得連接的等待時間(包括新建連接)", ("engine",), QUERY_BUCKETS)
+DB_POOL_CHECKOUT_DURATION = Histogram("db_pool_checkout_duration_seconds", "連接從取出到歸還的佔用時間", ("engine",))
+
+# 業務
+INGESTED_ROWS = Counter("ingested_rows", "寫入的執行記錄和步驟結果行數(用 rate() 計算每秒行數)", ("table",))
+REPORT_RENDER_DURATION = Histogram("report_render_duration_seconds", "報告渲染耗時", ("format",))
+CACHE_REQUESTS = Counter("cache_requests", "緩存查找次數(用 hit / (hit + miss) 計算命中率)", ("cache", "result"))
+
+
+def record_cache(cache: str, hits: int, misses: int) -> None:
+    if hits:
+        CACHE_REQUESTS.inc(cache, "hit", amount=hits)
+    if misses:
+        CACHE_REQUESTS.inc(cache, "miss", amount=misses)
+
+
+# 當前請求的 [SQL語句數, 數據庫耗時]，由 MetricsMiddleware 設置
+_request_db: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_db", default=None)
+
+
+class MetricsMiddleware:
+    """記錄每個請求的耗時、狀態碼、SQL語句數和數據庫耗時，按路由模板(而不是原始路徑)分組
+
+    耗時截止到響應體發送完畢。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        db = [0, 0.0]
+        token = _request_db.set(db)
+        started = time.perf_counter()
+        status = 500
+        finished = False
+        HTTP_REQUESTS_IN_PROGRESS.inc(method)
+
+        def finish():
+            nonlocal finished
+            finished = True
+            HTTP_REQUESTS_IN_PROGRESS.dec(method)
+            # 路由匹配後 FastAPI 會把路由對象寫入 scope
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            HTTP_REQUESTS.inc(method, route, str(status))
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method, route)
+            HTTP_REQUEST_DB_QUERIES.observe(db[0], route)
+            HTTP_REQUEST_DB_DURATION.observe(db[1], route)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not finished:
+                finish()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not finished:
+                finish()
+            _request_db.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _pool_gauges(pools: Dict[str, object]) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    def collect():
+        values = {}
+        for name, pool in pools.items():
+            # NullPool / StaticPool 沒有這些統計
+            if not hasattr(pool, "checkedout"):
+                continue
+            values[(name, "size")] = pool.size()
+            values[(name, "idle")] = pool.checkedin()
+            values[(name, "in_use")] = pool.checkedout()
+            # QueuePool 的溢出計數從 -pool_size 開始
+            values[(name, "overflow")] = max(pool.overflow(), 0)
+        return values
+    return collect
+
+
+_pools: Dict[str, object] = {}
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "連接池狀態(容量、空閒、佔用、溢出)", ("engine", "state"), collect=_pool_gauges(_pools))
+
+
+def _wrap_pool(name: str, pool) -> None:
+    """計時連接池的 connect()：取得連接前沒有可監聽的事件"""
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started, name)
+
+    pool.connect = timed_connect
+    _pools[name] = pool
+
+
+def instrument_engine(sync_engine, name: str) -> None:
+    """為引擎註冊SQL語句計數、耗時和連接池指標(異步引擎傳入 async_engine.sync_engine)"""
+    if not METRICS_ENABLED:
+        return
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_started
+        DB_QUERIES.inc(name)
+        DB_QUERY_DURATION.observe(elapsed, name)
+        db = _request_db.get()
+        if db is not None:
+            db[0] += 1
+            db[1] += elapsed
+
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["metrics_checkout_at"] = time.perf_counter()
+
+    def checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("metrics_checkout_at", None)
+        if checked_out_at is not None:
+            DB_POOL_CHECKOUT_DURATION.observe(time.perf_counter() - checked_out_at, name)
+
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    # 連接池事件在 dispose() 重建連接池後仍然有效，connect() 的計時需要重新包裝
+    event.listen(sync_engine.pool, "checkout", checkout)
+    event.listen(sync_engine.pool, "checkin", checkin)
+    event.listen(sync_engine, "engine_disposed", lambda engine: _wrap_pool(name, engine.pool))
+    _wrap_pool(name, sync_engine.pool)
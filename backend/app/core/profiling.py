@@ -0,0 +1,338 @@
+import collections
+import contextvars
+import itertools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool as _run_in_threadpool
+from sqlalchemy import event
+
+from app.core.security import is_admin_token
+
+# 隨機抽樣剖析的請求比例(0-1)，0表示只剖析帶 X-Profile 頭的管理員請求
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# 採樣間隔秒數；持有GIL的CPU密集代碼會把實際間隔拉長到解釋器的線程切換間隔(默認5毫秒)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.002"))
+# 單個請求最多採樣的秒數，避免長輪詢或大文件下載無限佔用內存
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+# 內存中保留的剖析結果數
+PROFILE_BUFFER_SIZE = int(os.getenv("PROFILE_BUFFER_SIZE", "20"))
+
+# 慢查詢閾值(毫秒)，0表示不捕獲
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+# 內存中保留的慢查詢數
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "100"))
+# 同一語句在該秒數內複用上次的執行計劃，不重複 EXPLAIN
+SLOW_QUERY_EXPLAIN_TTL = float(os.getenv("SLOW_QUERY_EXPLAIN_TTL", "60"))
+
+PROFILE_HEADER = b"x-profile"
+
+_ids = itertools.count(1)
+# 當前請求的ASGI scope，慢查詢記錄用它標識所屬路由
+_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("profiling_scope", default=None)
+_profile: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+
+
+def request_label(scope: Optional[dict]) -> Optional[str]:
+    """請求的標識：路由匹配後為路由模板，否則為原始路徑"""
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f"{scope['method']} {route.path if route is not None else scope['path']}"
+
+
+Frame = Tuple[str, str, int]
+
+
+class Profile:
+    """一個請求的採樣剖析；只記錄處於該請求調用棧內的樣本(事件循環線程上的其他請求不計入)"""
+
+    def __init__(self, scope: dict, trigger: str):
+        self.id = next(_ids)
+        self.scope = scope
+        self.trigger = trigger
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.status = None
+        self.loop_thread = threading.get_ident()
+        # 線程ID -> 該線程上屬於本請求的最外層幀(之下的幀是中間件和線程池的內部實現)
+        self.roots: Dict[int, object] = {}
+        # 線程ID -> [(調用棧, 權重秒數)]
+        self.samples: Dict[int, List[Tuple[Tuple[Frame, ...], float]]] = collections.defaultdict(list)
+        self.last_sample = self.started
+
+    def sample(self, frames: Dict[int, object], now: float) -> None:
+        weight = now - self.last_sample
+        self.last_sample = now
+        for thread_id, root in list(self.roots.items()):
+            frame = frames.get(thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame)
+                if frame is root:
+                    break
+                frame = frame.f_back
+            else:
+                # 該線程正在運行其他請求或空閒
+                continue
+            self.samples[thread_id].append((tuple(_frame_key(f) for f in reversed(stack)), weight))
+
+    def run_attributed(self, func, *args, **kwargs):
+        """在線程池中運行 func，期間該線程的樣本計入本請求"""
+        thread_id = threading.get_ident()
+        self.roots[thread_id] = sys._getframe()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.roots.pop(thread_id, None)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "request": request_label(self.scope),
+            "path": self.scope["path"],
+            "query_string": self.scope.get("query_string", b"").decode("latin-1"),
+            "status": self.status,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "samples": sum(len(samples) for samples in self.samples.values()),
+        }
+
+    def to_speedscope(self) -> dict:
+        """轉換為 speedscope 文件格式(https://www.speedscope.app)，每個線程一個 sampled 剖析"""
+        frame_index: Dict[Frame, int] = {}
+        profiles = []
+        for thread_id, samples in self.samples.items():
+            name = "事件循環" if thread_id == self.loop_thread else f"線程池 {thread_id}"
+            stacks, weights = [], []
+            for stack, weight in samples:
+                stacks.append([frame_index.setdefault(frame, len(frame_index)) for frame in stack])
+                weights.append(weight)
+            profiles.append({
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": stacks,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"#{self.id} {request_label(self.scope)}",
+            "exporter": "TestManagement profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": name, "file": file, "line": line} for name, file, line in frame_index]},
+            "profiles": profiles,
+        }
+
+    def to_collapsed(self) -> str:
+        """轉換為摺疊棧格式(每行"幀;幀;幀 微秒數")，可用 flamegraph.pl 或 speedscope 打開"""
+        totals: Dict[str, float] = collections.defaultdict(float)
+        for samples in self.samples.values():
+            for stack, weight in samples:
+                totals[";".join(f"{name} ({os.path.basename(file)}:{line})" for name, file, line in stack)] += weight
+        return "".join(f"{stack} {max(int(weight * 1_000_000), 1)}\n" for stack, weight in totals.items())
+
+
+def _frame_key(frame) -> Frame:
+    code = frame.f_code
+    return getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno
+
+
+class _Sampler:
+    """後台採樣線程：有進行中的剖析時才運行"""
+
+    def __init__(self):
+        self.active: List[Profile] = []
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.finished: "collections.OrderedDict[int, Profile]" = collections.OrderedDict()
+
+    def start(self, profile: Profile) -> None:
+        with self.lock:
+            self.active.append(profile)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self.thread.start()
+
+    def stop(self, profile: Profile) -> None:
+        with self.lock:
+            if profile in self.active:
+                self.active.remove(profile)
+            self.finished[profile.id] = profile
+            while len(self.finished) > PROFILE_BUFFER_SIZE:
+                self.finished.popitem(last=False)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(PROFILE_INTERVAL)
+            with self.lock:
+                if not self.active:
+                    self.thread = None
+                    return
+                profiles = list(self.active)
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for profile in profiles:
+                if now - profile.started > PROFILE_MAX_SECONDS:
+                    continue
+                profile.sample(frames, now)
+            del frames
+
+
+sampler = _Sampler()
+
+
+def get_profile(profile_id: int) -> Optional[Profile]:
+    return sampler.finished.get(profile_id)
+
+
+def list_profiles() -> List[dict]:
+    """最近的剖析結果，新的在前"""
+    return [profile.summary() for profile in reversed(list(sampler.finished.values()))]
+
+
+async def run_in_threadpool(func, *args, **kwargs):
+    """與 fastapi.concurrency.run_in_threadpool 相同；請求正在被剖析時，線程池中的執行也計入剖析"""
+    profile = _profile.get()
+    if profile is None:
+        return await _run_in_threadpool(func, *args, **kwargs)
+    return await _run_in_threadpool(profile.run_attributed, func, *args, **kwargs)
+
+
+def _requested(scope) -> bool:
+    """請求帶 X-Profile: 1 且 X-Admin-Token 有效"""
+    profile = token = None
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            profile = value
+        elif name == b"x-admin-token":
+            token = value
+    return profile not in (None, b"", b"0") and is_admin_token(token.decode("latin-1") if token else None)
+
+
+class ProfilingMiddleware:
+    """按請求頭(管理員)或抽樣比例剖析請求，結果通過 /api/admin/profiles 獲取
+
+    被剖析的響應帶 X-Profile-Id 頭。中間件需要位於所有 BaseHTTPMiddleware 之內，
+    後者在單獨的任務中調用下游，剖析無法把那部分調用棧歸屬到請求。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        scope_token = _scope.set(scope)
+        if _requested(scope):
+            trigger = "header"
+        elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            trigger = "sample"
+        else:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _scope.reset(scope_token)
+            return
+
+        profile = Profile(scope, trigger)
+        profile.roots[profile.loop_thread] = sys._getframe()
+        profile_token = _profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", str(profile.id).encode())]
+            await send(message)
+
+        sampler.start(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.roots.clear()
+            profile.duration = time.perf_counter() - profile.started
+            sampler.stop(profile)
+            _profile.reset(profile_token)
+            _scope.reset(scope_token)
+
+
+# 慢查詢
+slow_queries: Deque[dict] = collections.deque(maxlen=SLOW_QUERY_BUFFER_SIZE)
+# 語句 -> (EXPLAIN時間, 執行計劃)
+_plans: Dict[str, Tuple[float, str]] = {}
+_PLAN_CACHE_SIZE = 256
+_QUERY = re.compile(r"\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    """在同一連接上獲取語句的執行計劃；只處理查詢語句(EXPLAIN 不會執行語句本身)"""
+    if not _QUERY.match(statement):
+        return None
+    now = time.monotonic()
+    cached = _plans.get(statement)
+    if cached is not None and now - cached[0] < SLOW_QUERY_EXPLAIN_TTL:
+        return cached[1]
+    if conn.dialect.name == "postgresql":
+        explain = f"EXPLAIN {statement}"
+    elif conn.dialect.name == "sqlite":
+        explain = f"EXPLAIN QUERY PLAN {statement}"
+    else:
+        return None
+    try:
+        # 直接使用DBAPI游標：不觸發引擎事件，也不計入請求的語句數
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(explain, parameters)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    except Exception as e:
+        return f"EXPLAIN 失敗: {e}"
+    if conn.dialect.name == "postgresql":
+        plan = "\n".join(row[0] for row in rows)
+    else:
+        # (id, parent, notused, detail)
+        plan = "\n".join(str(row[-1]) for row in rows)
+    if len(_plans) >= _PLAN_CACHE_SIZE:
+        _plans.clear()
+    _plans[statement] = (now, plan)
+    return plan
+
+
+def watch_slow_queries(sync_engine, name: str) -> None:
+    """捕獲超過 SLOW_QUERY_MS 的語句及其執行計劃(異步引擎傳入 async_engine.sync_engine)"""
+    if not SLOW_QUERY_MS:
+        return
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._slow_query_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._slow_query_started
+        if elapsed * 1000 < SLOW_QUERY_MS:
+            return
+        slow_queries.append({
+            "captured_at": datetime.now(timezone.utc).isoformat(),
+            "engine": name,
+            "duration_ms": round(elapsed * 1000, 3),
+            "request": request_label(_scope.get()),
+            "statement": statement,
+            "parameters": repr(parameters)[:1000],
+            "executemany": executemany,
+            "plan": None if executemany else _explain(conn, statement, parameters),
+        })
+
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
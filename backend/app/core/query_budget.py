@@ -0,0 +1,197 @@
+import contextvars
+import os
+import re
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from fastapi import Depends
+from sqlalchemy import event
+
+# 超出預算或發現重複查詢時的處理：off(不跟蹤請求)、log(打印警告)、raise(拋出 QueryBudgetExceeded，用於開發和測試)
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "log").lower()
+# 同一形狀的SELECT在一個請求(或被跟蹤的服務調用)內執行多少次視為N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "10"))
+# 未聲明預算的路由的默認語句數上限，0表示不限制
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "0"))
+
+# 語句形狀緩存的最大條目數(IN 列表長度不同的語句在歸一化前是不同的字符串)
+_SHAPE_CACHE_SIZE = 4096
+
+_PLACEHOLDER = r"(?:\?|\$\d+|%\(\w+\)s|:\w+)"
+# 佔位符列表，例如 IN (?, ?, ?) 或多行 VALUES 的一行
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})*\s*\)")
+_REPEATED_LISTS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_shapes: Dict[str, str] = {}
+
+
+class QueryBudgetExceeded(Exception):
+    """請求或服務調用執行的SQL語句超過聲明的預算，或同一查詢重複執行(N+1)"""
+
+
+def statement_shape(statement: str) -> str:
+    """將語句歸一化為形狀：佔位符列表折疊為 (?)，IN 列表和多行 VALUES 的長度不影響形狀"""
+    shape = _shapes.get(statement)
+    if shape is None:
+        shape = _REPEATED_LISTS.sub("(?)", _PLACEHOLDER_LIST.sub("(?)", statement))
+        if len(_shapes) >= _SHAPE_CACHE_SIZE:
+            _shapes.clear()
+        _shapes[statement] = shape
+    return shape
+
+
+class QueryTracker:
+    """統計一個請求或一段服務調用執行的SQL語句，嵌套時語句同時計入外層"""
+
+    __slots__ = ("name", "budget", "count", "shapes", "parent", "closed", "report", "scope")
+
+    def __init__(self, name: str, budget: Optional[int] = None, parent: Optional["QueryTracker"] = None,
+                 report: bool = True, scope: Optional[dict] = None):
+        self.name = name
+        self.budget = budget
+        self.count = 0
+        self.shapes: Dict[str, int] = {}
+        self.parent = parent
+        # 請求的響應發送完畢後關閉，之後運行的後台任務不再計入
+        self.closed = False
+        # 測試輔助函數使用的計數器只統計，不報告
+        self.report = report
+        # 請求的ASGI scope，路由匹配後用路由模板代替原始路徑標識請求
+        self.scope = scope
+
+    def record(self, shape: str) -> None:
+        if self.closed:
+            return
+        self.count += 1
+        repeats = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if self.report:
+            if self.budget and self.count == self.budget + 1:
+                _violation(f"{self.label()} 執行的SQL語句超過預算 {self.budget} 條")
+            if repeats == QUERY_REPEAT_THRESHOLD and shape.lstrip().upper().startswith("SELECT"):
+                _violation(f"{self.label()} 中同一查詢重複執行 {repeats} 次(疑似N+1): {shape[:300]}")
+        if self.parent is not None:
+            self.parent.record(shape)
+
+    def label(self) -> str:
+        route = self.scope.get("route") if self.scope is not None else None
+        if route is None:
+            return self.name
+        return f"{self.scope['method']} {route.path}"
+
+    def repeated(self, threshold: int = 2) -> List[str]:
+        """返回執行次數不少於 threshold 的SELECT形狀"""
+        return [
+            shape for shape, count in self.shapes.items()
+            if count >= threshold and shape.lstrip().upper().startswith("SELECT")
+        ]
+
+
+def _violation(message: str) -> None:
+    if QUERY_BUDGET_MODE == "off":
+        return
+    if QUERY_BUDGET_MODE == "raise":
+        raise QueryBudgetExceeded(message)
+    print(f"警告: {message}")
+
+
+_tracker: contextvars.ContextVar[Optional[QueryTracker]] = contextvars.ContextVar("query_tracker", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    tracker = _tracker.get()
+    if tracker is not None:
+        tracker.record(statement_shape(statement))
+
+
+def watch_engine(sync_engine) -> None:
+    """在引擎上註冊語句跟蹤(異步引擎傳入 async_engine.sync_engine)；沒有跟蹤器時只有一次上下文變量讀取"""
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def track_queries(name: str, budget: Optional[int] = None, detached: bool = False):
+    """跟蹤一段服務調用的SQL語句，超過 budget 或出現重複查詢時按 QUERY_BUDGET_MODE 處理
+
+    detached: 不計入外層跟蹤器，用於請求中按塊重複的獨立工作單元(如流式上傳時每塊一次提交)，
+    否則每塊相同的查詢會在外層被誤報為N+1。
+    """
+    tracker = QueryTracker(name, budget, parent=None if detached else _tracker.get())
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _tracker.reset(token)
+
+
+@contextmanager
+def count_queries():
+    """只統計SQL語句數和形狀，不檢查預算，供測試和檢查腳本使用"""
+    tracker = QueryTracker("count_queries", parent=_tracker.get(), report=False)
+    token = _tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _tracker.reset(token)
+
+
+def query_budget(max_queries: int):
+    """路由依賴：聲明該路由每個請求最多執行的SQL語句數
+
+    用法: @router.get("/", dependencies=[query_budget(3)])
+    """
+    async def declare():
+        tracker = _tracker.get()
+        if tracker is not None:
+            tracker.budget = max_queries
+    return Depends(declare)
+
+
+class QueryBudgetMiddleware:
+    """為每個請求創建語句跟蹤器；路由通過 query_budget 依賴聲明預算"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tracker = QueryTracker(
+            f"{scope['method']} {scope['path']}", QUERY_BUDGET_DEFAULT or None, parent=_tracker.get(), scope=scope
+        )
+        token = _tracker.set(tracker)
+
+        async def send_wrapper(message):
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                tracker.closed = True
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            tracker.closed = True
+            _tracker.reset(token)
+
+
+async def assert_constant_queries(
+    call: Callable[[], Awaitable[object]],
+    grow: Callable[[int], Awaitable[object]],
+    sizes: Iterable[int] = (1, 10, 50),
+) -> int:
+    """斷言 call 執行的SQL語句數不隨數據規模增長
+
+    依次調用 grow(n) 將數據增長到規模 n，每次之後運行 call 並統計語句數；
+    各規模下語句數不同時拋出 AssertionError(附上重複執行的查詢形狀)。返回語句數。
+    """
+    counts = {}
+    repeated = {}
+    for size in sizes:
+        await grow(size)
+        with count_queries() as tracker:
+            await call()
+        counts[size] = tracker.count
+        repeated[size] = tracker.repeated()
+    if len(set(counts.values())) > 1:
+        largest = max(counts)
+        raise AssertionError(f"SQL語句數隨數據規模變化: {counts}，重複的查詢: {repeated[largest]}")
+    return next(iter(counts.values()))
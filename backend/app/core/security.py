@@ -0,0 +1,20 @@
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+# 管理接口(剖析結果、慢查詢等)的令牌，通過 X-Admin-Token 請求頭傳入；未設置時管理接口不可用
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理接口的依賴：校驗 X-Admin-Token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="未配置 ADMIN_TOKEN，管理接口已停用")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="無效的管理員令牌")
@@ -1,28 +1,152 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 import getpass
 
+from app.core.metrics import instrument_engine
+from app.core.profiling import watch_slow_queries
+from app.core.query_budget import watch_engine
+
 # 獲取當前用戶名
 current_user = getpass.getuser()
 
+# 嵌入式模式：設置數據庫文件路徑且未設置 DATABASE_URL 時使用SQLite，無需啟動PostgreSQL
+EMBEDDED_DB_PATH = os.getenv("EMBEDDED_DB_PATH")
+
 # 數據庫URL(可通過環境變量配置)
-DATABASE_URL = os.getenv("DATABASE_URL", f"postgresql://{current_user}:@localhost/testmanagement")
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"sqlite:///{EMBEDDED_DB_PATH}" if EMBEDDED_DB_PATH else f"postgresql://{current_user}:@localhost/testmanagement",
+)
+
+# 連接池配置(可通過環境變量配置)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# 單條語句超時(毫秒)，0表示不限制
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+
+# SQLite 連接參數(每個新連接執行一次)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# 啟動時按模型創建缺失的表；未設置時僅SQLite啟用(PostgreSQL使用Alembic遷移)
+_create_all = os.getenv("DB_CREATE_ALL", "").lower()
+DB_CREATE_ALL = _create_all in ("1", "true", "yes") if _create_all else DATABASE_URL.startswith("sqlite")
+
+
+def to_async_url(url: str) -> str:
+    """將同步數據庫URL轉換為對應的異步驅動URL"""
+    if url.startswith("postgresql+asyncpg://") or url.startswith("sqlite+aiosqlite://"):
+        return url
+    if url.startswith("postgresql://") or url.startswith("postgresql+psycopg2://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url.split("://", 1)[1]
+    return url
+
+
+def _is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and make_url(url).database not in (None, "", ":memory:")
+
+
+def engine_options(url: str, is_async: bool) -> dict:
+    """根據數據庫類型構建引擎參數(連接池、語句超時)"""
+    if url.startswith("sqlite"):
+        # SQLite 不支持語句超時；aiosqlite 對文件數據庫默認每次會話新建連接，改用連接池複用
+        if not is_async:
+            return {"connect_args": {"check_same_thread": False}}
+        if _is_sqlite_file(url):
+            return {"poolclass": AsyncAdaptedQueuePool, "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+        return {}
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        if is_async:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
 
-# 創建SQLAlchemy引擎
-engine = create_engine(DATABASE_URL)
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """SQLite 連接調優：WAL允許讀寫並發，NORMAL同步級別在WAL下只在檢查點時刷盤"""
+    cursor = dbapi_connection.cursor()
+    for pragma in (
+        f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA temp_store=MEMORY",
+        # 外鍵約束(包括 ON DELETE CASCADE)在SQLite中默認關閉
+        "PRAGMA foreign_keys=ON",
+    ):
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def configure_sqlite(sync_engine) -> None:
+    """為SQLite引擎註冊連接參數"""
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+
+
+# 創建SQLAlchemy引擎(同步，供遷移、腳本使用)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, is_async=False))
+configure_sqlite(engine)
 
 # 創建會話工廠
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 異步引擎(asyncpg，本地可使用 aiosqlite)
+ASYNC_DATABASE_URL = to_async_url(os.getenv("ASYNC_DATABASE_URL", DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL, is_async=True))
+configure_sqlite(async_engine.sync_engine)
+instrument_engine(async_engine.sync_engine, "primary")
+watch_slow_queries(async_engine.sync_engine, "primary")
+watch_engine(async_engine.sync_engine)
+
+# 異步會話工廠；提交後不過期，避免序列化響應時觸發隱式IO
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 # 創建基礎模型類
 Base = declarative_base()
 
+
+async def create_schema():
+    """按模型創建缺失的表和索引(嵌入式SQLite啟動時使用，無需運行Alembic遷移)"""
+    from app.models import models  # noqa: F401 註冊所有模型
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
 # 獲取數據庫會話的依賴
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+# 獲取異步數據庫會話的依賴
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,132 @@
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.metrics import instrument_engine
+from app.core.profiling import watch_slow_queries
+from app.core.query_budget import watch_engine
+from app.db.database import AsyncSessionLocal, engine_options, to_async_url
+
+# 只讀副本URL列表(逗號分隔)，未配置時所有讀取都走主庫
+REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+# 允許的最大複製延遲(秒)，超過則回退到主庫
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+# 副本延遲檢測間隔(秒)
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "2"))
+# 寫入後在此時間窗口(秒)內的讀取走主庫，保證讀到自己的寫入
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+
+LAST_WRITE_COOKIE = "tm_last_write"
+CONSISTENCY_HEADER = "x-read-consistency"
+
+# PostgreSQL 副本延遲：WAL 已全部回放時視為無延遲，否則取最後回放事務距今的秒數
+_PG_LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class _Replica:
+    """單個只讀副本及其延遲狀態"""
+
+    def __init__(self, url: str, name: str):
+        self.url = to_async_url(url)
+        self.engine = create_async_engine(self.url, **engine_options(self.url, is_async=True))
+        instrument_engine(self.engine.sync_engine, name)
+        watch_slow_queries(self.engine.sync_engine, name)
+        watch_engine(self.engine.sync_engine)
+        self.session_factory = async_sessionmaker(
+            bind=self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+        )
+        self.lag: Optional[float] = None
+        self.checked_at = 0.0
+
+    async def refresh_lag(self):
+        """查詢副本的複製延遲，連接失敗時標記為不可用"""
+        self.checked_at = time.monotonic()
+        try:
+            async with self.engine.connect() as conn:
+                if self.engine.dialect.name == "postgresql":
+                    self.lag = float(await conn.scalar(_PG_LAG_QUERY) or 0)
+                else:
+                    # 其他數據庫(如本地 SQLite 測試)沒有複製延遲的概念，只檢測可用性
+                    await conn.execute(text("SELECT 1"))
+                    self.lag = 0.0
+        except Exception as e:
+            print(f"警告: 只讀副本 {self.engine.url.render_as_string(hide_password=True)} 不可用: {str(e)}")
+            self.lag = None
+
+    async def is_usable(self) -> bool:
+        if time.monotonic() - self.checked_at >= REPLICA_LAG_CHECK_INTERVAL:
+            await self.refresh_lag()
+        return self.lag is not None and self.lag <= REPLICA_MAX_LAG_SECONDS
+
+
+class ReplicaRouter:
+    """在多個只讀副本之間輪詢分配讀會話，副本延遲過大或不可用時回退到主庫"""
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [_Replica(url, f"replica{index}") for index, url in enumerate(urls, 1)]
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+
+    async def choose(self) -> async_sessionmaker:
+        for _ in range(len(self.replicas)):
+            replica = next(self._cycle)
+            if await replica.is_usable():
+                return replica.session_factory
+        return AsyncSessionLocal
+
+    def status(self) -> List[dict]:
+        return [
+            {
+                "url": replica.engine.url.render_as_string(hide_password=True),
+                "lag_seconds": replica.lag,
+                "usable": replica.lag is not None and replica.lag <= REPLICA_MAX_LAG_SECONDS,
+            }
+            for replica in self.replicas
+        ]
+
+
+replica_router = ReplicaRouter(REPLICA_DATABASE_URLS)
+
+
+def requires_primary(request: Request) -> bool:
+    """判斷讀請求是否必須走主庫(顯式要求強一致，或剛發生過寫入)"""
+    if request.headers.get(CONSISTENCY_HEADER, "").lower() == "strong":
+        return True
+    last_write = request.cookies.get(LAST_WRITE_COOKIE)
+    if last_write:
+        try:
+            return time.time() - float(last_write) < READ_YOUR_WRITES_WINDOW
+        except ValueError:
+            return False
+    return False
+
+
+def mark_write(response: Response):
+    """在寫請求的響應中記錄寫入時間，後續讀請求據此回到主庫"""
+    response.set_cookie(LAST_WRITE_COOKIE, f"{time.time():.3f}", max_age=int(READ_YOUR_WRITES_WINDOW) + 1, httponly=True)
+
+
+@asynccontextmanager
+async def read_session():
+    """為後台任務等非請求上下文打開一個讀會話"""
+    factory = await replica_router.choose() if replica_router.replicas else AsyncSessionLocal
+    async with factory() as db:
+        yield db
+
+
+# 獲取只讀數據庫會話的依賴(GET路由、報告數據加載)
+async def get_read_db(request: Request):
+    factory = AsyncSessionLocal
+    if replica_router.replicas and not requires_primary(request):
+        factory = await replica_router.choose()
+    async with factory() as db:
+        yield db
@@ -1,15 +1,29 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.docs import get_swagger_ui_html
+from fastapi.responses import Response
 from fastapi.staticfiles import StaticFiles
-
-# 導入路由模塊（暫時註釋掉）
-# from app.api.routes import test_plans, test_cases, test_executions, reports, jira_integration, api_integration
+from app.api.routes import admin, api_integration, artifacts, changes, execution_logs, jira_integration, reports, test_cases, test_executions, test_plans
+from app.api.serialization import NegotiatedResponse, ResponseEncodingMiddleware
+from app.core import metrics
+from app.core.profiling import ProfilingMiddleware
+from app.core.query_budget import QUERY_BUDGET_MODE, QueryBudgetMiddleware
+from app.db.database import DB_CREATE_ALL, async_engine, create_schema
+from app.db.routing import mark_write, replica_router
+from app.services.artifact_store import shutdown_thumbnail_pool
+from app.services.change_feed import change_log_prune_loop
+from app.services.jira_outbox_service import jira_outbox_loop
+from app.services.live_feed import live_feed
+from app.services.partition_service import partition_maintenance_loop
+from app.services.purge_service import purge_loop
 
 app = FastAPI(
     title="測試管理平台 API",
     description="企業級測試案例管理系統的API接口",
     version="0.1.0",
+    # 默認使用 orjson 編碼，Accept: application/msgpack 時返回MessagePack
+    default_response_class=NegotiatedResponse,
 )
 
 # CORS設置
@@ -21,13 +35,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 註冊API路由（暫時註釋掉）
-# app.include_router(test_plans.router, prefix="/api/test-plans", tags=["測試計劃"])
-# app.include_router(test_cases.router, prefix="/api/test-cases", tags=["測試案例"])
-# app.include_router(test_executions.router, prefix="/api/test-executions", tags=["測試執行"])
-# app.include_router(reports.router, prefix="/api/reports", tags=["測試報告"])
-# app.include_router(jira_integration.router, prefix="/api/jira", tags=["Jira整合"])
-# app.include_router(api_integration.router, prefix="/api/integration", tags=["API整合"])
+# 響應協商與壓縮(br/gzip，超過 COMPRESSION_MIN_SIZE 字節時)
+app.add_middleware(ResponseEncodingMiddleware)
+
+# 按需剖析(需在 read_your_writes 之內，後者在單獨的任務中調用下游)
+app.add_middleware(ProfilingMiddleware)
+
+# 寫請求成功後標記寫入時間，短時間內的讀請求走主庫(read-your-writes)
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    response = await call_next(request)
+    if request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400:
+        mark_write(response)
+    return response
+
+# 每個請求的SQL語句預算與N+1檢測(路由通過 query_budget 依賴聲明預算)
+if QUERY_BUDGET_MODE != "off":
+    app.add_middleware(QueryBudgetMiddleware)
+
+# 請求指標(最外層，耗時包括其他中間件)
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# 註冊API路由
+app.include_router(test_plans.router, prefix="/api/test-plans", tags=["測試計劃"])
+app.include_router(test_cases.router, prefix="/api/test-cases", tags=["測試案例"])
+app.include_router(test_executions.router, prefix="/api/test-executions", tags=["測試執行"])
+app.include_router(execution_logs.router, prefix="/api/test-executions", tags=["執行日誌"])
+app.include_router(reports.router, prefix="/api/reports", tags=["測試報告"])
+app.include_router(jira_integration.router, prefix="/api/jira", tags=["Jira整合"])
+app.include_router(api_integration.router, prefix="/api/integration", tags=["API整合"])
+app.include_router(changes.router, prefix="/api/changes", tags=["變更訂閱"])
+app.include_router(artifacts.router, prefix="/api/artifacts", tags=["附件"])
+app.include_router(admin.router, prefix="/api/admin", tags=["管理"])
+
+# 後台維護任務
+_background_tasks = []
+
+@app.on_event("startup")
+async def init_database():
+    # 嵌入式SQLite：啟動時直接按模型建表，無需運行遷移
+    if DB_CREATE_ALL:
+        await create_schema()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # 分區維護(創建未來分區、按保留策略清理)僅適用於PostgreSQL
+    if async_engine.dialect.name == "postgresql":
+        _background_tasks.append(asyncio.create_task(partition_maintenance_loop()))
+    # 清理已軟刪除的測試計劃和測試案例(包括重啟前未完成的清理)
+    _background_tasks.append(asyncio.create_task(purge_loop()))
+    # 合併發送執行狀態變更產生的Jira同步(未配置Jira時空轉)
+    _background_tasks.append(asyncio.create_task(jira_outbox_loop()))
+    # 按保留策略清理變更日誌
+    _background_tasks.append(asyncio.create_task(change_log_prune_loop()))
+
+@app.on_event("startup")
+async def start_live_feed():
+    # 測試計劃實時進度推送的事件總線(PostgreSQL時使用LISTEN/NOTIFY)
+    await live_feed.start(async_engine.dialect.name)
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    # 等待任務退出後再關閉連接池，否則正在執行的查詢在連接關閉時會阻塞事件循環的退出
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    await live_feed.stop()
+    # 縮略圖工作進程
+    shutdown_thumbnail_pool()
+
+@app.on_event("shutdown")
+async def close_database():
+    # 關閉連接池；aiosqlite 的每個連接都有一個工作線程，不關閉會阻止進程退出
+    await async_engine.dispose()
 
 @app.get("/", include_in_schema=False)
 async def root():
@@ -35,7 +117,14 @@ async def root():
 
 @app.get("/ping", include_in_schema=False)
 async def ping():
-    return {"status": "ok", "message": "服務正常運行"}
+    result = {"status": "ok", "message": "服務正常運行"}
+    if replica_router.replicas:
+        result["replicas"] = replica_router.status()
+    return result
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/docs", include_in_schema=False)
 async def custom_swagger_ui_html():
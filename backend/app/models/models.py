@@ -1,10 +1,10 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, Integer, LargeBinary, String, Text, DateTime, ForeignKey, Boolean, Enum, JSON, Index, event, select, update
+from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
 import enum
 from app.db.database import Base
 import uuid
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB
 
 # 測試執行狀態枚舉
 class TestStatus(str, enum.Enum):
@@ -39,9 +39,24 @@ class TestPlan(Base):
     start_date = Column(DateTime, nullable=True)
     end_date = Column(DateTime, nullable=True)
     is_active = Column(Boolean, default=True)
+    # 版本號：計劃自身字段變更時遞增(ETag)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # 數據版本號：計劃下的執行記錄或步驟結果變更時遞增(摘要、執行列表的ETag)
+    data_version = Column(Integer, nullable=False, default=1, server_default="1")
+    # 軟刪除時間：非空時計劃對所有接口不可見，數據由後台清理任務分批刪除
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
     
-    # 關聯
-    test_executions = relationship("TestExecution", back_populates="test_plan", cascade="all, delete-orphan")
+    # 關聯(passive_deletes：刪除時不加載子記錄，由數據庫 ON DELETE CASCADE 級聯)
+    test_executions = relationship("TestExecution", back_populates="test_plan", cascade="all, delete-orphan", passive_deletes=True)
+    archive_segments = relationship("ArchiveSegment", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # 覆蓋索引：條件請求只需索引即可取得版本號
+        Index("ix_test_plans_id_versions", "id", "version", "data_version"),
+        # 部分索引：只包含等待清理的計劃
+        Index("ix_test_plans_deleted_at", "deleted_at",
+              postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+    )
 
 # 測試案例模型
 class TestCase(Base):
@@ -58,9 +73,18 @@ class TestCase(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     created_by = Column(String(255), nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # 軟刪除時間：非空時案例對所有接口不可見，數據由後台清理任務分批刪除
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
     
     # 關聯
-    test_executions = relationship("TestExecution", back_populates="test_case", cascade="all, delete-orphan")
+    test_executions = relationship("TestExecution", back_populates="test_case", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_test_cases_id_version", "id", "version"),
+        Index("ix_test_cases_deleted_at", "deleted_at",
+              postgresql_where=deleted_at.isnot(None), sqlite_where=deleted_at.isnot(None)),
+    )
     
 # 測試執行模型
 class TestExecution(Base):
@@ -72,13 +96,25 @@ class TestExecution(Base):
     executed_by = Column(String(255), nullable=True)
     duration = Column(Integer, nullable=True)  # 執行持續時間(秒)
     notes = Column(Text, nullable=True)
-    test_plan_id = Column(Integer, ForeignKey("test_plans.id"))
-    test_case_id = Column(Integer, ForeignKey("test_cases.id"))
+    test_plan_id = Column(Integer, ForeignKey("test_plans.id", ondelete="CASCADE"))  # 由 ix_test_executions_plan_case 覆蓋
+    test_case_id = Column(Integer, ForeignKey("test_cases.id", ondelete="CASCADE"), index=True)
+    # 分區鍵：執行記錄的創建時間不早於所屬測試計劃的創建時間，查詢可據此裁剪分區
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # 緊湊存儲模式下的步驟結果：[[步驟號, 描述哈希, 狀態, 截圖URL, 備註], ...]
+    packed_results = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True)
+    # 版本號：執行記錄或其步驟結果變更時遞增
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     # 關聯
     test_plan = relationship("TestPlan", back_populates="test_executions")
     test_case = relationship("TestCase", back_populates="test_executions")
-    test_results = relationship("TestResult", back_populates="test_execution", cascade="all, delete-orphan")
+    test_results = relationship("TestResult", back_populates="test_execution", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_test_executions_id_version", "id", "version"),
+        # 計劃實例化時按 (計劃, 案例) 判斷執行記錄是否已存在
+        Index("ix_test_executions_plan_case", "test_plan_id", "test_case_id"),
+    )
 
 # 測試結果模型(詳細的測試步驟結果)
 class TestResult(Base):
@@ -90,11 +126,20 @@ class TestResult(Base):
     status = Column(Enum(TestStatus), nullable=False)
     screenshot_url = Column(String(255), nullable=True)
     notes = Column(Text, nullable=True)
-    test_execution_id = Column(Integer, ForeignKey("test_executions.id"))
+    test_execution_id = Column(Integer, ForeignKey("test_executions.id", ondelete="CASCADE"), index=True)
+    # 分區鍵：步驟結果的創建時間不早於所屬執行記錄的創建時間
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     
     # 關聯
     test_execution = relationship("TestExecution", back_populates="test_results")
 
+# 步驟描述字典(緊湊存儲模式下按哈希共享重複的步驟描述)
+class StepDescription(Base):
+    __tablename__ = "step_descriptions"
+    
+    hash = Column(String(64), primary_key=True)  # 描述文本的SHA-256
+    text = Column(Text, nullable=False)
+
 # Jira整合模型
 class JiraIntegration(Base):
     __tablename__ = "jira_integrations"
@@ -102,11 +147,38 @@ class JiraIntegration(Base):
     id = Column(Integer, primary_key=True, index=True)
     jira_project_key = Column(String(50), nullable=False)
     jira_issue_key = Column(String(50), nullable=False)
-    test_case_id = Column(Integer, ForeignKey("test_cases.id"), nullable=True)
-    test_execution_id = Column(Integer, ForeignKey("test_executions.id"), nullable=True)
+    test_case_id = Column(Integer, ForeignKey("test_cases.id", ondelete="CASCADE"), nullable=True)
+    test_execution_id = Column(Integer, ForeignKey("test_executions.id", ondelete="CASCADE"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+# Jira問題元數據緩存：關聯校驗和覆蓋率視圖讀取本地緩存，過期後按JQL批量刷新
+class JiraIssueCache(Base):
+    __tablename__ = "jira_issue_cache"
+    
+    jira_issue_key = Column(String(50), primary_key=True)
+    project_key = Column(String(50), nullable=False, index=True)
+    summary = Column(Text, nullable=True)
+    status = Column(String(100), nullable=True)
+    issue_type = Column(String(100), nullable=True)
+    fetched_at = Column(DateTime(timezone=True), nullable=False)
+
+# Jira同步發件箱：每個問題一行，同一問題在發送前的多次狀態變更合併為最新的一次
+class JiraOutbox(Base):
+    __tablename__ = "jira_outbox"
+    
+    jira_issue_key = Column(String(50), primary_key=True)
+    # 觸發同步的執行記錄(僅用於評論內容，執行記錄可能已被刪除，因此不設外鍵)
+    test_execution_id = Column(Integer, nullable=False)
+    status = Column(Enum(TestStatus), nullable=False)
+    revision = Column(Integer, nullable=False, default=1)  # 每次合併新事件時遞增
+    event_count = Column(Integer, nullable=False, default=1)  # 已合併的狀態變更數
+    queued_at = Column(DateTime(timezone=True), nullable=False)
+    available_at = Column(DateTime(timezone=True), nullable=False, index=True)  # 合併窗口結束、重試或租約到期的時間
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    failed_at = Column(DateTime(timezone=True), nullable=True)  # 超過重試次數或問題不存在，不再發送
+
 # API密鑰模型(用於外部系統集成)
 class ApiKey(Base):
     __tablename__ = "api_keys"
@@ -116,4 +188,176 @@ class ApiKey(Base):
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now()) 
+
+# 歸檔分段模型(冷存儲中Parquet文件的清單)
+class ArchiveSegment(Base):
+    __tablename__ = "archive_segments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    test_plan_id = Column(Integer, ForeignKey("test_plans.id", ondelete="CASCADE"), nullable=False, index=True)
+    uri = Column(String(1024), nullable=False)  # 分段目錄(本地路徑或對象存儲URI)
+    execution_count = Column(Integer, nullable=False)
+    result_count = Column(Integer, nullable=False)
+    status_counts = Column(JSON, nullable=False)  # 各狀態的執行數量，摘要無需讀取文件
+    min_created_at = Column(DateTime(timezone=True), nullable=True)
+    max_created_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# 執行日誌分塊：日誌按固定大小切分後分別壓縮，每塊記錄在解壓後日誌中的位置，讀取範圍、尾部或搜索時只解壓需要的塊
+class ExecutionLogChunk(Base):
+    __tablename__ = "execution_log_chunks"
+    
+    # 分區佈局下執行記錄沒有可引用的主鍵，因此不設外鍵，刪除執行記錄時顯式清理
+    test_execution_id = Column(Integer, primary_key=True)
+    seq = Column(Integer, primary_key=True)  # 塊序號，從0開始
+    raw_offset = Column(BigInteger, nullable=False)  # 塊在解壓後日誌中的起始字節
+    raw_length = Column(Integer, nullable=False)  # 解壓後的字節數
+    first_line = Column(BigInteger, nullable=False)  # 塊之前的換行數
+    line_count = Column(Integer, nullable=False)  # 塊內的換行數
+    codec = Column(String(10), nullable=False)  # zlib / zstd
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# 附件模型(截圖等上傳文件)：按內容的SHA-256尋址，相同內容只存一份
+class Artifact(Base):
+    __tablename__ = "artifacts"
+    
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(255), nullable=False)
+    filename = Column(String(255), nullable=True)  # 首次上傳時的文件名
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# 變更日誌：執行記錄和測試案例的每次寫入由數據庫觸發器追加一行，供增量同步按序號讀取
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    __table_args__ = {"sqlite_autoincrement": True}  # 序號不復用
+    
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    entity = Column(String(20), nullable=False)  # test_execution / test_case
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String(10), nullable=False)  # insert / update / delete(測試案例的軟刪除也記為delete)
+    changed_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+
+# 變更日誌觸發器(PostgreSQL上與遷移 e1a7c3b5d9f2 一致)；SQLite只支持行級觸發器，PostgreSQL使用帶轉換表的語句級觸發器，批量寫入只追加一次
+CHANGE_LOG_TRIGGERS = {
+    "sqlite": [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_change_{op} AFTER {op.upper()} ON {table} BEGIN "
+        f"INSERT INTO change_log (entity, entity_id, op) VALUES ('{entity}', {row}.id, {value}); END"
+        for table, entity in (("test_executions", "test_execution"), ("test_cases", "test_case"))
+        for op, row, value in (
+            ("insert", "NEW", "'insert'"),
+            ("update", "NEW", "CASE WHEN NEW.deleted_at IS NOT NULL AND OLD.deleted_at IS NULL THEN 'delete' ELSE 'update' END"
+                if table == "test_cases" else "'update'"),
+            ("delete", "OLD", "'delete'"),
+        )
+    ],
+    # CREATE TRIGGER 不支持 IF NOT EXISTS，先刪除同名觸發器
+    "postgresql": [
+        """CREATE OR REPLACE FUNCTION change_log_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO change_log (entity, entity_id, op) SELECT TG_ARGV[0], id, 'insert' FROM new_rows ORDER BY id;
+            RETURN NULL;
+        END $$""",
+        """CREATE OR REPLACE FUNCTION change_log_update() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO change_log (entity, entity_id, op) SELECT TG_ARGV[0], id, 'update' FROM new_rows ORDER BY id;
+            RETURN NULL;
+        END $$""",
+        """CREATE OR REPLACE FUNCTION change_log_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO change_log (entity, entity_id, op) SELECT TG_ARGV[0], id, 'delete' FROM old_rows ORDER BY id;
+            RETURN NULL;
+        END $$""",
+        """CREATE OR REPLACE FUNCTION change_log_case_update() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO change_log (entity, entity_id, op)
+            SELECT 'test_case', n.id,
+                   CASE WHEN n.deleted_at IS NOT NULL AND o.deleted_at IS NULL THEN 'delete' ELSE 'update' END
+            FROM new_rows n JOIN old_rows o ON o.id = n.id ORDER BY n.id;
+            RETURN NULL;
+        END $$""",
+    ] + [
+        statement
+        for table, op, referencing, function in (
+            ("test_executions", "insert", "NEW TABLE AS new_rows", "change_log_insert('test_execution')"),
+            ("test_executions", "update", "NEW TABLE AS new_rows", "change_log_update('test_execution')"),
+            ("test_executions", "delete", "OLD TABLE AS old_rows", "change_log_delete('test_execution')"),
+            ("test_cases", "insert", "NEW TABLE AS new_rows", "change_log_insert('test_case')"),
+            ("test_cases", "update", "OLD TABLE AS old_rows NEW TABLE AS new_rows", "change_log_case_update()"),
+            ("test_cases", "delete", "OLD TABLE AS old_rows", "change_log_delete('test_case')"),
+        )
+        for statement in (
+            f"DROP TRIGGER IF EXISTS {table}_change_{op} ON {table}",
+            f"CREATE TRIGGER {table}_change_{op} AFTER {op.upper()} ON {table} REFERENCING {referencing} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION {function}",
+        )
+    ],
+}
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_change_log_triggers(target, connection, **kw):
+    """按模型建表時(嵌入式SQLite)一併創建變更日誌觸發器"""
+    for statement in CHANGE_LOG_TRIGGERS.get(connection.dialect.name, []):
+        connection.exec_driver_sql(statement)
+
+
+def bump_plan_data_versions(session, plan_ids=None):
+    """遞增測試計劃的數據版本號；plan_ids 為可迭代ID、子查詢，或 None 表示全部計劃"""
+    stmt = update(TestPlan).values(data_version=TestPlan.data_version + 1)
+    if plan_ids is not None:
+        stmt = stmt.where(TestPlan.id.in_(plan_ids))
+    return session.execute(stmt.execution_options(synchronize_session=False))
+
+
+# 版本號維護：ORM寫入時自動遞增相關實體的版本號，供ETag使用
+@event.listens_for(Session, "before_flush")
+def _bump_versions(session, flush_context, instances):
+    plan_ids = set()
+    execution_ids = set()
+    case_ids = set()
+
+    for obj in session.dirty:
+        if not isinstance(obj, (TestPlan, TestCase, TestExecution, TestResult)):
+            continue
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, TestResult):
+            execution_ids.add(obj.test_execution_id)
+            continue
+        # 使用SQL表達式遞增，避免並發寫入時基於過期值計算
+        obj.version = type(obj).version + 1
+        if isinstance(obj, TestExecution):
+            plan_ids.add(obj.test_plan_id)
+
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, TestExecution):
+            plan_ids.add(obj.test_plan_id)
+        elif isinstance(obj, TestResult):
+            execution_ids.add(obj.test_execution_id)
+
+    for obj in session.deleted:
+        # 刪除測試案例會級聯刪除其執行記錄
+        if isinstance(obj, TestCase):
+            case_ids.add(obj.id)
+
+    execution_ids.discard(None)
+    plan_ids.discard(None)
+    if execution_ids:
+        session.execute(
+            update(TestExecution)
+            .where(TestExecution.id.in_(execution_ids))
+            .values(version=TestExecution.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        bump_plan_data_versions(
+            session, select(TestExecution.test_plan_id).where(TestExecution.id.in_(execution_ids))
+        )
+    if case_ids:
+        bump_plan_data_versions(
+            session, select(TestExecution.test_plan_id).where(TestExecution.test_case_id.in_(case_ids))
+        )
+    if plan_ids:
+        bump_plan_data_versions(session, plan_ids)
@@ -1,14 +1,16 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from app.models.models import TestStatus, TestCaseType, Priority
 
 # 基礎模式
 class BaseSchema(BaseModel):
-    class Config:
-        orm_mode = True
-        populate_by_name = True
-        arbitrary_types_allowed = True
+    # Pydantic v2 配置：可直接從ORM對象屬性校驗
+    model_config = ConfigDict(
+        from_attributes=True,
+        populate_by_name=True,
+        arbitrary_types_allowed=True,
+    )
 
 # 測試計劃模式
 class TestPlanBase(BaseSchema):
@@ -33,6 +35,37 @@ class TestPlanResponse(TestPlanBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
 
+# 測試計劃實例化請求：從測試案例篩選條件或已有計劃批量創建待執行記錄
+class PlanInstantiateRequest(BaseSchema):
+    # 拼錯的篩選字段會被當作未篩選而實例化全部案例，因此拒絕未知字段
+    model_config = ConfigDict(extra="forbid")
+
+    test_case_ids: Optional[List[int]] = None
+    priorities: Optional[List[Priority]] = None
+    test_types: Optional[List[TestCaseType]] = None
+    title_contains: Optional[str] = None
+    clone_from_plan_id: Optional[int] = None  # 複製該計劃包含的測試案例
+    skip_existing: bool = True  # 跳過計劃中已有執行記錄的測試案例
+    all_cases: bool = False  # 未指定任何篩選條件時，需顯式設置才實例化所有測試案例
+
+    @model_validator(mode="after")
+    def require_filter(self):
+        has_filter = (
+            self.test_case_ids is not None
+            or self.priorities
+            or self.test_types
+            or self.title_contains
+            or self.clone_from_plan_id is not None
+        )
+        if not has_filter and not self.all_cases:
+            raise ValueError("請指定篩選條件，或設置 all_cases=true 實例化所有測試案例")
+        return self
+
+class PlanInstantiateResponse(BaseSchema):
+    test_plan_id: int
+    created: int
+    total_executions: int
+
 # 測試案例模式
 class TestCaseBase(BaseSchema):
     title: str
@@ -78,7 +111,7 @@ class TestResultUpdate(BaseSchema):
     notes: Optional[str] = None
 
 class TestResultResponse(TestResultBase):
-    id: int
+    id: Optional[int] = None  # 緊湊存儲的步驟沒有獨立的行ID
     test_execution_id: int
 
 # 測試執行模式
@@ -120,6 +153,43 @@ class JiraIntegrationResponse(JiraIntegrationBase):
     created_at: datetime
     updated_at: Optional[datetime] = None
 
+# Jira問題覆蓋率(問題元數據取自本地緩存，未緩存時為空)
+class JiraCoverageItem(BaseSchema):
+    jira_issue_key: str
+    project_key: Optional[str] = None
+    summary: Optional[str] = None
+    issue_status: Optional[str] = None
+    issue_type: Optional[str] = None
+    cached_at: Optional[datetime] = None
+    test_case_count: int
+    execution_counts: Dict[str, int]
+
+# Jira同步發件箱條目
+class JiraOutboxResponse(BaseSchema):
+    jira_issue_key: str
+    test_execution_id: int
+    status: TestStatus
+    event_count: int
+    queued_at: datetime
+    available_at: datetime
+    attempts: int
+    last_error: Optional[str] = None
+    failed_at: Optional[datetime] = None
+
+# 變更日誌條目；插入和更新附帶實體的當前數據
+class ChangeEntry(BaseSchema):
+    seq: int
+    entity: str
+    id: int
+    op: str
+    changed_at: datetime
+    data: Optional[Dict[str, Any]] = None
+
+class ChangeFeedResponse(BaseSchema):
+    changes: List[ChangeEntry]
+    cursor: int
+    has_more: bool
+
 # API密鑰模式
 class ApiKeyBase(BaseSchema):
     name: str
@@ -134,6 +204,36 @@ class ApiKeyResponse(ApiKeyBase):
     key: str
     created_at: datetime
 
+# 執行日誌模式
+class ExecutionLogInfo(BaseSchema):
+    size: int  # 解壓後的字節數
+    lines: int  # 換行數
+    chunks: int
+    compressed_size: int
+
+class LogMatch(BaseSchema):
+    line: int  # 行號，從1開始
+    offset: int  # 行首在日誌中的字節位置
+    text: str
+
+class LogSearchResponse(BaseSchema):
+    matches: List[LogMatch]
+    truncated: bool  # 達到 max_matches 或單次掃描上限，可從 next_offset 繼續搜索
+    next_offset: Optional[int] = None
+    scanned_bytes: int  # 實際解壓的字節數
+    size: int
+
+# 附件模式
+class ArtifactResponse(BaseSchema):
+    sha256: str
+    size: int
+    content_type: str
+    filename: Optional[str] = None
+    created_at: Optional[datetime] = None
+    url: str  # 可直接作為 screenshot_url
+    thumbnail_url: Optional[str] = None  # 僅圖片
+    deduplicated: bool = False  # 相同內容已存在，本次未重複存儲
+
 # 報告請求模式
 class ReportRequest(BaseSchema):
     test_plan_id: int
@@ -145,4 +245,16 @@ class PaginatedResponse(BaseSchema):
     total: int
     page: int
     page_size: int
-    pages: int 
\ No newline at end of file
+    pages: int
+
+# 批量操作響應模式
+class BulkItemResult(BaseSchema):
+    index: int  # 條目在請求中的位置
+    id: Optional[int] = None
+    status: str  # created, updated, unchanged, deleted, not_found, error
+    error: Optional[str] = None
+
+class BulkResponse(BaseSchema):
+    total: int
+    counts: Dict[str, int]
+    items: List[BulkItemResult]
@@ -0,0 +1,253 @@
+import json
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, distinct, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core.profiling import run_in_threadpool
+from app.models.models import (
+    ArchiveSegment, ExecutionLogChunk, JiraIntegration, TestCase, TestExecution, TestPlan, TestResult, TestStatus,
+    bump_plan_data_versions,
+)
+from app.services.result_store import expand_packed_results
+
+# 歸檔存儲位置：本地目錄，或 pyarrow 支持的對象存儲URI(如 s3://bucket/prefix)
+ARCHIVE_URI = os.getenv("ARCHIVE_URI", os.path.join(os.getcwd(), "archive"))
+# 創建超過該天數的執行記錄會被歸檔
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+# 每個歸檔分段包含的最大執行記錄數
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "10000"))
+# Parquet 壓縮算法
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+EXECUTIONS_FILE = "executions.parquet"
+RESULTS_FILE = "results.parquet"
+MANIFEST_FILE = "manifest.json"
+
+
+def _filesystem(uri: str):
+    """解析歸檔URI，返回 (pyarrow文件系統, 路徑)"""
+    import pyarrow.fs as pafs
+
+    if "://" in uri:
+        return pafs.FileSystem.from_uri(uri)
+    return pafs.LocalFileSystem(), os.path.abspath(uri)
+
+
+def _segment_uri(test_plan_id: int) -> str:
+    return f"{ARCHIVE_URI.rstrip('/')}/plan_{test_plan_id}/{uuid.uuid4().hex}"
+
+
+def _write_segment(uri: str, executions: Dict[str, list], results: Dict[str, list], manifest: Dict[str, Any]):
+    """將一個分段寫入Parquet文件及清單(在線程池中執行)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    fs, path = _filesystem(uri)
+    fs.create_dir(path, recursive=True)
+    pq.write_table(pa.Table.from_pydict(executions), f"{path}/{EXECUTIONS_FILE}", filesystem=fs, compression=ARCHIVE_COMPRESSION)
+    pq.write_table(pa.Table.from_pydict(results), f"{path}/{RESULTS_FILE}", filesystem=fs, compression=ARCHIVE_COMPRESSION)
+    with fs.open_output_stream(f"{path}/{MANIFEST_FILE}") as f:
+        f.write(json.dumps(manifest, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _read_segment(uri: str) -> Tuple[List[dict], List[dict]]:
+    """讀取一個分段的執行記錄和步驟結果(在線程池中執行)"""
+    import pyarrow.parquet as pq
+
+    fs, path = _filesystem(uri)
+    executions = pq.read_table(f"{path}/{EXECUTIONS_FILE}", filesystem=fs).to_pylist()
+    results = pq.read_table(f"{path}/{RESULTS_FILE}", filesystem=fs).to_pylist()
+    return executions, results
+
+
+def _delete_segment(uri: str):
+    """刪除一個分段的目錄(在線程池中執行)"""
+    fs, path = _filesystem(uri)
+    fs.delete_dir(path)
+
+
+async def delete_segment_files(uris: Iterable[str]) -> None:
+    """刪除歸檔分段的文件；應在清單記錄的刪除提交後調用，失敗只記錄警告，最多留下無清單記錄的孤立文件"""
+    for uri in uris:
+        try:
+            await run_in_threadpool(_delete_segment, uri)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"警告: 刪除歸檔分段 {uri} 失敗: {str(e)}")
+
+
+def _status_value(status) -> Optional[str]:
+    return status.value if isinstance(status, TestStatus) else status
+
+
+async def _archive_batch(db: AsyncSession, test_plan_id: int, executions: List[TestExecution]) -> ArchiveSegment:
+    """將一批執行記錄寫入冷存儲並從熱表中刪除"""
+    execution_ids = [e.id for e in executions]
+    case_ids = {e.test_case_id for e in executions if e.test_case_id}
+    test_cases = {
+        c.id: c for c in (await db.scalars(select(TestCase).where(TestCase.id.in_(case_ids)))).all()
+    } if case_ids else {}
+    issue_keys: Dict[int, List[str]] = {}
+    for execution_id, issue_key in await db.execute(
+        select(JiraIntegration.test_execution_id, JiraIntegration.jira_issue_key)
+        .where(JiraIntegration.test_execution_id.in_(execution_ids))
+    ):
+        issue_keys.setdefault(execution_id, []).append(issue_key)
+
+    execution_columns = {name: [] for name in (
+        "id", "test_plan_id", "test_case_id", "status", "executed_at", "executed_by", "duration", "notes",
+        "created_at", "test_case_title", "test_case_priority", "test_case_type", "jira_issue_keys",
+    )}
+    result_columns = {name: [] for name in (
+        "id", "test_execution_id", "step_number", "step_description", "status", "screenshot_url", "notes", "created_at",
+    )}
+    for e in executions:
+        test_case = test_cases.get(e.test_case_id)
+        row = {
+            "id": e.id,
+            "test_plan_id": e.test_plan_id,
+            "test_case_id": e.test_case_id,
+            "status": _status_value(e.status),
+            "executed_at": e.executed_at,
+            "executed_by": e.executed_by,
+            "duration": e.duration,
+            "notes": e.notes,
+            "created_at": e.created_at,
+            "test_case_title": test_case.title if test_case else None,
+            "test_case_priority": _status_value(test_case.priority) if test_case else None,
+            "test_case_type": _status_value(test_case.test_type) if test_case else None,
+            "jira_issue_keys": issue_keys.get(e.id, []),
+        }
+        for name, value in row.items():
+            execution_columns[name].append(value)
+        for r in e.test_results:
+            row = {
+                "id": r.id,
+                "test_execution_id": e.id,
+                "step_number": r.step_number,
+                "step_description": r.step_description,
+                "status": _status_value(r.status),
+                "screenshot_url": r.screenshot_url,
+                "notes": r.notes,
+                "created_at": r.created_at,
+            }
+            for name, value in row.items():
+                result_columns[name].append(value)
+
+    created = [e.created_at for e in executions if e.created_at]
+    segment = ArchiveSegment(
+        test_plan_id=test_plan_id,
+        uri=_segment_uri(test_plan_id),
+        execution_count=len(executions),
+        result_count=len(result_columns["id"]),
+        status_counts=dict(Counter(_status_value(e.status) or "pending" for e in executions)),
+        min_created_at=min(created) if created else None,
+        max_created_at=max(created) if created else None,
+    )
+    manifest = {
+        "test_plan_id": test_plan_id,
+        "execution_count": segment.execution_count,
+        "result_count": segment.result_count,
+        "status_counts": segment.status_counts,
+        "min_created_at": segment.min_created_at,
+        "max_created_at": segment.max_created_at,
+        "files": [EXECUTIONS_FILE, RESULTS_FILE],
+        "compression": ARCHIVE_COMPRESSION,
+        "archived_at": datetime.now(timezone.utc),
+    }
+
+    # 先寫文件再刪除熱數據；提交失敗時只會留下無清單記錄的孤立文件
+    await run_in_threadpool(_write_segment, segment.uri, execution_columns, result_columns, manifest)
+    db.add(segment)
+    await db.execute(delete(JiraIntegration).where(JiraIntegration.test_execution_id.in_(execution_ids)))
+    await db.execute(delete(TestResult).where(TestResult.test_execution_id.in_(execution_ids)))
+    # 日誌塊沒有外鍵，不隨執行記錄級聯刪除；SQLite會重用被刪除的最大ID，遺留的塊會被新執行記錄繼承
+    await db.execute(delete(ExecutionLogChunk).where(ExecutionLogChunk.test_execution_id.in_(execution_ids)))
+    await db.execute(delete(TestExecution).where(TestExecution.id.in_(execution_ids)))
+    await bump_plan_data_versions(db, [test_plan_id])
+    await db.commit()
+    return segment
+
+
+async def archive_executions(
+    db: AsyncSession,
+    older_than: Optional[datetime] = None,
+    include_inactive_plans: bool = False,
+) -> Dict[str, Any]:
+    """將早於指定時間或屬於非活動測試計劃的執行記錄歸檔到冷存儲"""
+    criteria = []
+    if older_than is not None:
+        criteria.append(TestExecution.created_at < older_than)
+    if include_inactive_plans:
+        criteria.append(TestExecution.test_plan_id.in_(select(TestPlan.id).where(TestPlan.is_active == False)))
+    if not criteria:
+        return {"segments": 0, "executions": 0}
+
+    plan_ids = (await db.scalars(
+        select(distinct(TestExecution.test_plan_id))
+        .where(or_(*criteria), TestExecution.test_plan_id.isnot(None))
+    )).all()
+
+    segments = 0
+    archived = 0
+    for test_plan_id in plan_ids:
+        while True:
+            executions = (await db.scalars(
+                select(TestExecution)
+                .options(selectinload(TestExecution.test_results))
+                .where(TestExecution.test_plan_id == test_plan_id, or_(*criteria))
+                .order_by(TestExecution.id)
+                .limit(ARCHIVE_BATCH_SIZE)
+            )).all()
+            if not executions:
+                break
+            await expand_packed_results(db, executions)
+            segment = await _archive_batch(db, test_plan_id, executions)
+            db.expunge_all()
+            segments += 1
+            archived += segment.execution_count
+    return {"segments": segments, "executions": archived}
+
+
+async def archived_status_counts(db: AsyncSession, test_plan_id: int) -> Dict[str, int]:
+    """從歸檔清單匯總測試計劃的各狀態執行數量(無需讀取Parquet文件)"""
+    counts: Counter = Counter()
+    for status_counts in (await db.scalars(
+        select(ArchiveSegment.status_counts).where(ArchiveSegment.test_plan_id == test_plan_id)
+    )).all():
+        counts.update(status_counts)
+    return dict(counts)
+
+
+async def load_archived_executions(db: AsyncSession, test_plan_id: int) -> List[Tuple[Any, Any]]:
+    """讀取測試計劃已歸檔的執行記錄，返回與熱數據相同結構的 (執行記錄, 測試案例) 列表"""
+    uris = (await db.scalars(
+        select(ArchiveSegment.uri).where(ArchiveSegment.test_plan_id == test_plan_id).order_by(ArchiveSegment.id)
+    )).all()
+
+    rows = []
+    for uri in uris:
+        executions, results = await run_in_threadpool(_read_segment, uri)
+        results_by_execution: Dict[int, list] = {}
+        for r in results:
+            r["status"] = TestStatus(r["status"]) if r["status"] else None
+            results_by_execution.setdefault(r["test_execution_id"], []).append(SimpleNamespace(**r))
+        for e in executions:
+            title = e.pop("test_case_title")
+            priority = e.pop("test_case_priority")
+            test_type = e.pop("test_case_type")
+            test_case = SimpleNamespace(
+                id=e["test_case_id"], title=title, priority=priority, test_type=test_type
+            ) if title is not None else None
+            e["status"] = TestStatus(e["status"]) if e["status"] else None
+            e["test_results"] = results_by_execution.get(e["id"], [])
+            rows.append((SimpleNamespace(archived=True, **e), test_case))
+    return rows
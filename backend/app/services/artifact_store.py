@@ -0,0 +1,406 @@
+import asyncio
+import hashlib
+import io
+import mimetypes
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import record_cache
+from app.core.profiling import run_in_threadpool
+from app.models.models import Artifact
+
+# 附件存儲位置：本地目錄，或 pyarrow 支持的對象存儲URI(如 s3://bucket/prefix)
+ARTIFACT_URI = os.getenv("ARTIFACT_URI", os.path.join(os.getcwd(), "artifacts"))
+# 上傳暫存目錄；默認本地存儲時位於存儲目錄下(完成後直接重命名)，對象存儲時為系統臨時目錄
+ARTIFACT_TMP_DIR = os.getenv("ARTIFACT_TMP_DIR", "")
+# 單個附件的最大字節數
+ARTIFACT_MAX_SIZE = int(os.getenv("ARTIFACT_MAX_SIZE", str(100 * 1024 * 1024)))
+# 上傳寫入和下載讀取的塊大小；每個上傳佔用的內存不超過約兩個塊
+ARTIFACT_CHUNK_SIZE = int(os.getenv("ARTIFACT_CHUNK_SIZE", str(1024 * 1024)))
+# 縮略圖生成進程數，默認邊長，及允許請求的最大邊長
+ARTIFACT_THUMBNAIL_WORKERS = int(os.getenv("ARTIFACT_THUMBNAIL_WORKERS", "2"))
+ARTIFACT_THUMBNAIL_SIZE = int(os.getenv("ARTIFACT_THUMBNAIL_SIZE", "256"))
+ARTIFACT_THUMBNAIL_MAX_SIZE = int(os.getenv("ARTIFACT_THUMBNAIL_MAX_SIZE", "1024"))
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+# 單個multipart部分的頭部上限，防止無限累積
+_MAX_PART_HEADER_BYTES = 16 * 1024
+
+
+class ArtifactTooLargeError(Exception):
+    pass
+
+
+class InvalidUploadError(Exception):
+    pass
+
+
+@lru_cache(maxsize=1)
+def _storage():
+    """解析 ARTIFACT_URI，返回 (pyarrow文件系統, 根路徑)"""
+    import pyarrow.fs as pafs
+
+    if "://" in ARTIFACT_URI:
+        fs, root = pafs.FileSystem.from_uri(ARTIFACT_URI)
+    else:
+        fs, root = pafs.LocalFileSystem(), os.path.abspath(ARTIFACT_URI)
+    return fs, root.rstrip("/")
+
+
+def _is_local(fs) -> bool:
+    import pyarrow.fs as pafs
+
+    return isinstance(fs, pafs.LocalFileSystem)
+
+
+def object_path(sha256: str) -> str:
+    fs, root = _storage()
+    return f"{root}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def thumbnail_path(sha256: str, size: int) -> str:
+    fs, root = _storage()
+    return f"{root}/thumbnails/{size}/{sha256[:2]}/{sha256}.jpg"
+
+
+def _exists(path: str) -> bool:
+    import pyarrow.fs as pafs
+
+    fs, _ = _storage()
+    return fs.get_file_info(path).type != pafs.FileType.NotFound
+
+
+def _tmp_dir() -> str:
+    if ARTIFACT_TMP_DIR:
+        path = ARTIFACT_TMP_DIR
+    else:
+        fs, root = _storage()
+        # 暫存文件與正式文件在同一文件系統上才能原子重命名
+        path = os.path.join(root, ".tmp") if _is_local(fs) else tempfile.gettempdir()
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _store(tmp_path: str, sha256: str):
+    """將暫存文件移入存儲(在線程池中執行)；並發上傳相同內容時結果一致，後寫入者覆蓋即可"""
+    import pyarrow.fs as pafs
+
+    fs, _ = _storage()
+    dest = object_path(sha256)
+    fs.create_dir(dest.rsplit("/", 1)[0], recursive=True)
+    if _is_local(fs):
+        try:
+            os.replace(tmp_path, dest)
+            return
+        except OSError:
+            # 暫存目錄在其他設備上，退回複製
+            pass
+    pafs.copy_files(tmp_path, dest, source_filesystem=pafs.LocalFileSystem(), destination_filesystem=fs)
+    os.remove(tmp_path)
+
+
+class ArtifactWriter:
+    """將上傳內容分塊寫入暫存文件，同時計算SHA-256"""
+
+    def __init__(self):
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._path = os.path.join(_tmp_dir(), f"{uuid.uuid4().hex}.part")
+        self._file = open(self._path, "wb")
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > ARTIFACT_MAX_SIZE:
+            raise ArtifactTooLargeError(f"附件超過大小上限 {ARTIFACT_MAX_SIZE} 字節")
+        self._buffer += data
+        if len(self._buffer) >= ARTIFACT_CHUNK_SIZE:
+            await self._flush()
+
+    async def _flush(self):
+        if self._buffer:
+            chunk, self._buffer = self._buffer, bytearray()
+            await run_in_threadpool(self._write_chunk, chunk)
+
+    def _write_chunk(self, chunk: bytearray):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    async def finish(self) -> str:
+        """寫完剩餘數據並關閉暫存文件，返回內容的SHA-256"""
+        await self._flush()
+        self._file.close()
+        return self._hash.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            pass
+
+    async def commit(self, db: AsyncSession, content_type: str, filename: Optional[str]) -> Tuple[Artifact, bool]:
+        """保存附件，返回 (附件記錄, 是否為重複內容)"""
+        sha256 = await self.finish()
+        deduplicated = await run_in_threadpool(_exists, object_path(sha256))
+        record_cache("artifact_upload", int(deduplicated), int(not deduplicated))
+        if deduplicated:
+            self.discard()
+        else:
+            await run_in_threadpool(_store, self._path, sha256)
+
+        artifact = await db.get(Artifact, sha256)
+        if artifact is None:
+            if db.bind.dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            # 並發上傳相同內容時忽略衝突，以先寫入的記錄為準
+            await db.execute(insert(Artifact).values(
+                sha256=sha256, size=self.size, content_type=content_type[:255], filename=filename and filename[:255],
+            ).on_conflict_do_nothing(index_elements=["sha256"]))
+            await db.commit()
+            artifact = await db.get(Artifact, sha256)
+        return artifact, deduplicated
+
+
+def _content_type(declared: Optional[str], filename: Optional[str]) -> str:
+    if declared and declared.split(";")[0].strip() not in ("", DEFAULT_CONTENT_TYPE):
+        return declared.strip()
+    if filename:
+        guessed, _ = mimetypes.guess_type(filename)
+        if guessed:
+            return guessed
+    return DEFAULT_CONTENT_TYPE
+
+
+class _MultipartUpload:
+    """流式解析multipart請求體，只保存第一個文件部分，其他字段忽略
+
+    python-multipart 的回調是同步的：回調中只記錄數據片段，每喂入一塊請求體後再異步寫出，
+    待寫出的數據不超過一塊請求體的大小。
+    """
+
+    def __init__(self, boundary: bytes, writer: ArtifactWriter):
+        from multipart.multipart import MultipartParser
+
+        self.writer = writer
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.found = False
+        self._pending = []
+        self._in_file = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._header_bytes = 0
+        self._parser = MultipartParser(boundary, callbacks={
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._header_bytes = 0
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+        self._count_header(end - start)
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+        self._count_header(end - start)
+
+    def _count_header(self, length: int):
+        self._header_bytes += length
+        if self._header_bytes > _MAX_PART_HEADER_BYTES:
+            raise InvalidUploadError("multipart部分的頭部過長")
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        from multipart.multipart import parse_options_header
+
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._in_file = not self.found and b"filename" in options
+        if self._in_file:
+            self.found = True
+            self.filename = os.path.basename(options[b"filename"].decode("utf-8", "replace").replace("\\", "/")) or None
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._pending.append(data[start:end])
+
+    def _on_part_end(self):
+        self._in_file = False
+
+    async def feed(self, chunk: bytes):
+        self._parser.write(chunk)
+        pending, self._pending = self._pending, []
+        for data in pending:
+            await self.writer.write(data)
+
+    def close(self):
+        self._parser.finalize()
+
+
+async def receive_upload(
+    db: AsyncSession,
+    stream: AsyncIterator[bytes],
+    content_type: str,
+    filename: Optional[str] = None,
+) -> Tuple[Artifact, bool]:
+    """接收上傳：multipart/form-data 時保存第一個文件部分，否則整個請求體即文件內容
+
+    數據邊接收邊寫入暫存文件並計算哈希，內存佔用與文件大小無關。
+    """
+    from multipart.multipart import parse_options_header
+
+    media_type, options = parse_options_header(content_type or "")
+    writer = ArtifactWriter()
+    try:
+        if media_type == b"multipart/form-data":
+            if b"boundary" not in options:
+                raise InvalidUploadError("缺少multipart邊界")
+            upload = _MultipartUpload(options[b"boundary"], writer)
+            async for chunk in stream:
+                await upload.feed(chunk)
+            upload.close()
+            if not upload.found:
+                raise InvalidUploadError("請求中沒有文件")
+            filename, declared = upload.filename, upload.content_type
+        else:
+            async for chunk in stream:
+                await writer.write(chunk)
+            declared = content_type
+        if writer.size == 0:
+            raise InvalidUploadError("文件內容為空")
+        return await writer.commit(db, _content_type(declared, filename), filename)
+    except BaseException:
+        writer.discard()
+        raise
+
+
+async def iter_object(sha256: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+    """分塊讀取附件內容 [start, end]，end 包含在內"""
+    fs, _ = _storage()
+    source = await run_in_threadpool(fs.open_input_file, object_path(sha256))
+    try:
+        remaining = (end + 1 - start) if end is not None else None
+        await run_in_threadpool(source.seek, start)
+        while remaining is None or remaining > 0:
+            size = ARTIFACT_CHUNK_SIZE if remaining is None else min(ARTIFACT_CHUNK_SIZE, remaining)
+            chunk = await run_in_threadpool(source.read, size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        source.close()
+
+
+async def read_thumbnail(sha256: str, size: int) -> bytes:
+    fs, _ = _storage()
+
+    def read():
+        with fs.open_input_file(thumbnail_path(sha256, size)) as f:
+            return f.read()
+
+    return await run_in_threadpool(read)
+
+
+def _render_thumbnail(sha256: str, size: int) -> bool:
+    """在工作進程中生成縮略圖(JPEG)，無法識別的圖片返回 False"""
+    from PIL import Image
+
+    fs, _ = _storage()
+    dest = thumbnail_path(sha256, size)
+    if _exists(dest):
+        return True
+    with fs.open_input_file(object_path(sha256)) as source:
+        try:
+            with Image.open(source) as image:
+                # JPEG 可在解碼時直接縮小，大圖無需完整解碼
+                image.draft("RGB", (size, size))
+                image.thumbnail((size, size))
+                if image.mode in ("RGBA", "LA", "P"):
+                    image = image.convert("RGBA")
+                    background = Image.new("RGB", image.size, "white")
+                    background.paste(image, mask=image.getchannel("A"))
+                    image = background
+                elif image.mode != "RGB":
+                    image = image.convert("RGB")
+                output = io.BytesIO()
+                image.save(output, "JPEG", quality=85, optimize=True)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return False
+
+    fs.create_dir(dest.rsplit("/", 1)[0], recursive=True)
+    # 先寫臨時名再重命名，並發生成時不會讀到不完整的文件
+    tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+    with fs.open_output_stream(tmp) as f:
+        f.write(output.getvalue())
+    fs.move(tmp, dest)
+    return True
+
+
+_thumbnail_pool: Optional[ProcessPoolExecutor] = None
+# 正在生成的縮略圖，同一縮略圖的並發請求共用一個任務
+_thumbnail_jobs: Dict[Tuple[str, int], asyncio.Future] = {}
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _thumbnail_pool
+    if _thumbnail_pool is None:
+        # spawn：不繼承事件循環和連接池所在進程的線程狀態
+        _thumbnail_pool = ProcessPoolExecutor(
+            max_workers=ARTIFACT_THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _thumbnail_pool
+
+
+def is_image(content_type: str) -> bool:
+    # SVG 需要矢量渲染，不生成縮略圖
+    return content_type.startswith("image/") and not content_type.startswith("image/svg")
+
+
+async def ensure_thumbnail(artifact: Artifact, size: int = ARTIFACT_THUMBNAIL_SIZE) -> bool:
+    """確保縮略圖已生成；非圖片或無法解碼時返回 False"""
+    if not is_image(artifact.content_type):
+        return False
+    if await run_in_threadpool(_exists, thumbnail_path(artifact.sha256, size)):
+        record_cache("artifact_thumbnail", 1, 0)
+        return True
+    record_cache("artifact_thumbnail", 0, 1)
+
+    key = (artifact.sha256, size)
+    job = _thumbnail_jobs.get(key)
+    if job is None:
+        job = asyncio.get_running_loop().run_in_executor(_pool(), _render_thumbnail, artifact.sha256, size)
+        _thumbnail_jobs[key] = job
+        job.add_done_callback(lambda _: _thumbnail_jobs.pop(key, None))
+    return await asyncio.shield(job)
+
+
+def shutdown_thumbnail_pool():
+    global _thumbnail_pool
+    if _thumbnail_pool is not None:
+        _thumbnail_pool.shutdown(wait=False, cancel_futures=True)
+        _thumbnail_pool = None
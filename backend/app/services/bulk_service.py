@@ -0,0 +1,183 @@
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import Integer, any_, bindparam, insert, select, update, values, column
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.purge_service import mark_deleted, not_deleted
+
+# 每個事務處理的最大條目數
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+# 單個請求允許的最大條目數
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "100000"))
+
+
+def _item(index: int, status: str, id: Optional[int] = None, error: Optional[str] = None) -> Dict[str, Any]:
+    return {"index": index, "id": id, "status": status, "error": error}
+
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+def _id_in(db: AsyncSession, id_column, ids: List[int]):
+    """id 匹配條件：PostgreSQL 上綁定為單個數組參數(= ANY)，語句可被緩存複用"""
+    if db.bind.dialect.name == "postgresql":
+        return id_column == any_(bindparam("ids", list(ids), type_=ARRAY(Integer)))
+    return id_column.in_(list(ids))
+
+
+def _batches(items: list):
+    for start in range(0, len(items), BULK_BATCH_SIZE):
+        yield items[start:start + BULK_BATCH_SIZE]
+
+
+async def _run_batch(db: AsyncSession, results: List[Dict[str, Any]], batch: List[tuple], operation) -> None:
+    """在單獨事務中執行一批寫入；失敗時回滾並將該批條目標記為錯誤"""
+    try:
+        await operation(batch)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        cause = e.__cause__ or e
+        # 只取第一行(數據庫錯誤後面附帶SQL語句)；消息為空時使用異常類型名
+        error = (str(cause).splitlines() or [type(cause).__name__])[0]
+        for index, *_ in batch:
+            results[index] = _item(index, "error", error=error)
+
+
+async def bulk_create(
+    db: AsyncSession,
+    model,
+    create_schema: Type[BaseModel],
+    payload: List[Any],
+    check: Optional[Callable[[List[Tuple[int, Dict[str, Any]]]], Awaitable[Dict[int, str]]]] = None,
+) -> List[Dict[str, Any]]:
+    """批量創建：多行 INSERT ... RETURNING id
+
+    check 對所有通過模式校驗的條目做一次整體檢查(例如引用是否存在)，返回 {條目位置: 錯誤信息}。
+    """
+    results: List[Dict[str, Any]] = [None] * len(payload)
+    valid = []
+    for index, raw in enumerate(payload):
+        try:
+            valid.append((index, create_schema.model_validate(raw).model_dump()))
+        except ValidationError as e:
+            results[index] = _item(index, "error", error=_validation_message(e))
+
+    if check is not None and valid:
+        errors = await check(valid)
+        for index, error in errors.items():
+            results[index] = _item(index, "error", error=error)
+        valid = [(index, row) for index, row in valid if index not in errors]
+
+    async def operation(batch):
+        ids = (await db.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            [row for _, row in batch],
+        )).all()
+        for (index, _), new_id in zip(batch, ids):
+            results[index] = _item(index, "created", id=new_id)
+
+    for batch in _batches(valid):
+        await _run_batch(db, results, batch, operation)
+    return results
+
+
+async def _update_rows(db: AsyncSession, model, rows: List[Dict[str, Any]]) -> None:
+    """更新一組字段集合相同的行，並遞增版本號"""
+    table = model.__table__
+    keys = [key for key in rows[0] if key != "id"]
+    if db.bind.dialect.name == "postgresql":
+        # UPDATE ... FROM (VALUES ...)：一條語句更新整批
+        source = values(
+            *(column(key, table.c[key].type) for key in ["id"] + keys), name="v"
+        ).data([tuple(row[key] for key in ["id"] + keys) for row in rows])
+        await db.execute(
+            update(table)
+            .where(table.c.id == source.c.id)
+            .values({**{key: source.c[key] for key in keys}, "version": table.c.version + 1})
+        )
+    else:
+        # SQLite 的 VALUES 不支持列別名，使用 executemany
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("_id"))
+            .values({**{key: bindparam(key) for key in keys}, "version": table.c.version + 1}),
+            [{"_id": row["id"], **{key: row[key] for key in keys}} for row in rows],
+        )
+
+
+async def bulk_update(db: AsyncSession, model, update_schema: Type[BaseModel], payload: List[Any]) -> List[Dict[str, Any]]:
+    """批量更新：每個條目必須包含 id，只更新提供的字段"""
+    results: List[Dict[str, Any]] = [None] * len(payload)
+    valid = []
+    for index, raw in enumerate(payload):
+        item_id = raw.get("id") if isinstance(raw, dict) else None
+        if not isinstance(item_id, int) or isinstance(item_id, bool):
+            results[index] = _item(index, "error", error="缺少整數類型的 id")
+            continue
+        try:
+            data = update_schema.model_validate(raw).model_dump(exclude_unset=True)
+        except ValidationError as e:
+            results[index] = _item(index, "error", id=item_id, error=_validation_message(e))
+            continue
+        valid.append((index, {"id": item_id, **data}))
+
+    async def operation(batch):
+        existing = set((await db.scalars(
+            select(model.id).where(_id_in(db, model.id, [row["id"] for _, row in batch]), not_deleted(model))
+        )).all())
+        # 按字段集合分組，每組一條語句
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        for index, row in batch:
+            if row["id"] not in existing:
+                results[index] = _item(index, "not_found", id=row["id"])
+                continue
+            if len(row) == 1:
+                # 只有 id 的條目沒有可更新的字段，不寫入也不遞增版本號
+                results[index] = _item(index, "unchanged", id=row["id"])
+                continue
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+            results[index] = _item(index, "updated", id=row["id"])
+        for rows in groups.values():
+            await _update_rows(db, model, rows)
+
+    for batch in _batches(valid):
+        await _run_batch(db, results, batch, operation)
+    return results
+
+
+async def bulk_delete(db: AsyncSession, model, payload: List[Any]) -> List[Dict[str, Any]]:
+    """批量軟刪除：UPDATE ... SET deleted_at WHERE id = ANY(...) RETURNING id；條目可以是ID或包含 id 的對象
+
+    執行記錄等關聯數據由後台清理任務分批刪除。
+    """
+    results: List[Dict[str, Any]] = [None] * len(payload)
+    valid = []
+    for index, raw in enumerate(payload):
+        item_id = raw.get("id") if isinstance(raw, dict) else raw
+        if not isinstance(item_id, int) or isinstance(item_id, bool):
+            results[index] = _item(index, "error", error="缺少整數類型的 id")
+            continue
+        valid.append((index, item_id))
+
+    async def operation(batch):
+        ids = [item_id for _, item_id in batch]
+        deleted = set(await mark_deleted(db, model, _id_in(db, model.__table__.c.id, ids)))
+        for index, item_id in batch:
+            results[index] = _item(index, "deleted" if item_id in deleted else "not_found", id=item_id)
+
+    for batch in _batches(valid):
+        await _run_batch(db, results, batch, operation)
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """匯總各狀態數量"""
+    counts: Dict[str, int] = {}
+    for item in results:
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+    return {"total": len(results), "counts": counts, "items": results}
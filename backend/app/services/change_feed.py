@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import AsyncSessionLocal
+from app.db.routing import read_session
+from app.models.models import ChangeLog, TestCase, TestExecution
+from app.services.partition_service import PURGE_BATCH_SIZE
+
+# 序號空洞(未提交或已回滾的事務佔用的序號)等待多少秒後視為已回滾並跳過
+CHANGE_FEED_GAP_TIMEOUT = float(os.getenv("CHANGE_FEED_GAP_TIMEOUT", "10"))
+# 長輪詢期間檢查新變更的間隔(秒)；每個進程只有一個查詢，與等待中的客戶端數量無關
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv("CHANGE_FEED_POLL_INTERVAL", "0.5"))
+# 長輪詢的最長等待秒數
+CHANGE_FEED_MAX_WAIT = float(os.getenv("CHANGE_FEED_MAX_WAIT", "30"))
+# 變更日誌保留天數，0表示不清理
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30"))
+CHANGE_LOG_PRUNE_INTERVAL = int(os.getenv("CHANGE_LOG_PRUNE_INTERVAL", "3600"))
+
+# 實體名到表的映射；執行記錄不返回緊湊存儲的步驟結果
+ENTITY_COLUMNS = {
+    "test_execution": (TestExecution, [c for c in TestExecution.__table__.c if c.name != "packed_results"]),
+    "test_case": (TestCase, list(TestCase.__table__.c)),
+}
+
+
+class CursorExpiredError(Exception):
+    """游標之後的變更已被保留策略清理，客戶端需要重新全量同步"""
+
+
+class GapTracker:
+    """記錄每個序號空洞首次被發現的時間
+
+    序號在事務內分配，提交順序可能與序號順序不同：空洞可能屬於仍未提交的事務。
+    讀取停在空洞之前，直到空洞被填上或超過 CHANGE_FEED_GAP_TIMEOUT(視為事務已回滾)。
+    """
+
+    def __init__(self):
+        self._first_seen: Dict[int, float] = {}
+
+    def expired(self, seq: int) -> bool:
+        now = time.monotonic()
+        first_seen = self._first_seen.setdefault(seq, now)
+        if len(self._first_seen) > 1024:
+            horizon = now - 10 * max(CHANGE_FEED_GAP_TIMEOUT, 1)
+            self._first_seen = {key: seen for key, seen in self._first_seen.items() if seen > horizon}
+        return now - first_seen >= CHANGE_FEED_GAP_TIMEOUT
+
+
+gap_tracker = GapTracker()
+
+
+def _deliverable(rows: List[Any], since: int) -> Tuple[List[Any], bool]:
+    """返回從 since 起連續的變更，以及是否被空洞阻塞"""
+    expected = since + 1
+    deliverable = []
+    for row in rows:
+        if row.seq != expected and not gap_tracker.expired(expected):
+            return deliverable, True
+        deliverable.append(row)
+        expected = row.seq + 1
+    return deliverable, False
+
+
+async def _load_entities(db: AsyncSession, changes: List[Dict[str, Any]]) -> None:
+    """為插入和更新附上實體的當前數據，每種實體一次查詢"""
+    for entity, (model, columns) in ENTITY_COLUMNS.items():
+        ids = {change["id"] for change in changes if change["entity"] == entity and change["op"] != "delete"}
+        if not ids:
+            continue
+        rows = {
+            row["id"]: dict(row)
+            for row in (await db.execute(select(*columns).where(model.id.in_(ids)))).mappings()
+        }
+        for change in changes:
+            if change["entity"] == entity and change["op"] != "delete":
+                # 已被之後的變更刪除時為空，對應的刪除記錄隨後返回
+                change["data"] = rows.get(change["id"])
+
+
+async def read_changes(db: AsyncSession, since: int, limit: int) -> Dict[str, Any]:
+    """讀取 since 之後按序號排列的變更
+
+    返回 changes、cursor(下次請求的 since)、has_more，以及 head(已讀到的最大序號)和 stalled(是否被空洞阻塞)。
+    """
+    rows = (await db.execute(
+        select(ChangeLog).where(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(limit + 1)
+    )).scalars().all()
+    if rows and rows[0].seq != since + 1:
+        # 游標之後緊接的序號不存在：可能是空洞，也可能已被保留策略清理
+        oldest = await db.scalar(select(func.min(ChangeLog.seq)))
+        if since < oldest - 1:
+            if since > 0:
+                raise CursorExpiredError(f"游標 {since} 之後的變更已被清理，請重新全量同步")
+            # 從保留的最早變更開始
+            since = oldest - 1
+
+    deliverable, stalled = _deliverable(rows[:limit], since)
+    changes = [
+        {
+            "seq": row.seq,
+            "entity": row.entity,
+            "id": row.entity_id,
+            "op": row.op,
+            "changed_at": row.changed_at,
+            "data": None,
+        }
+        for row in deliverable
+    ]
+    await _load_entities(db, changes)
+    return {
+        "changes": changes,
+        "cursor": deliverable[-1].seq if deliverable else since,
+        "has_more": not stalled and len(rows) > limit,
+        "head": rows[-1].seq if rows else since,
+        "stalled": stalled,
+    }
+
+
+class ChangeWatcher:
+    """進程級的變更日誌頭部輪詢：有長輪詢請求等待時每 CHANGE_FEED_POLL_INTERVAL 查詢一次最大序號並喚醒等待者"""
+
+    def __init__(self):
+        self.head = 0
+        self._advanced = asyncio.Event()
+        self._waiters = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _poll(self) -> None:
+        while self._waiters:
+            try:
+                async with read_session() as db:
+                    head = await db.scalar(select(func.max(ChangeLog.seq))) or 0
+                if head != self.head:
+                    self.head = head
+                    self._advanced.set()
+                    self._advanced = asyncio.Event()
+            except Exception as e:
+                print(f"檢查變更日誌出錯: {str(e)}")
+            await asyncio.sleep(CHANGE_FEED_POLL_INTERVAL)
+
+    async def wait(self, after: int, timeout: float) -> None:
+        """等待日誌頭部超過 after，最多 timeout 秒"""
+        self._waiters += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        try:
+            deadline = time.monotonic() + timeout
+            while self.head <= after:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    await asyncio.wait_for(self._advanced.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return
+        finally:
+            self._waiters -= 1
+
+
+change_watcher = ChangeWatcher()
+
+
+async def wait_for_changes(since: int, limit: int, wait: float) -> Dict[str, Any]:
+    """長輪詢：沒有可返回的變更時最多等待 wait 秒；等待期間不佔用數據庫連接"""
+    deadline = time.monotonic() + min(wait, CHANGE_FEED_MAX_WAIT)
+    while True:
+        async with read_session() as db:
+            page = await read_changes(db, since, limit)
+        remaining = deadline - time.monotonic()
+        if page["changes"] or remaining <= 0:
+            return page
+        if page["stalled"]:
+            # 被未提交事務的序號阻塞：按輪詢間隔重試，期間有新提交時提前重試
+            await change_watcher.wait(page["head"], min(remaining, CHANGE_FEED_POLL_INTERVAL))
+        else:
+            await change_watcher.wait(page["head"], remaining)
+
+
+async def prune_change_log(db: AsyncSession) -> int:
+    """按保留策略分批刪除過期的變更記錄"""
+    if CHANGE_LOG_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = datetime.now(timezone.utc) - timedelta(days=CHANGE_LOG_RETENTION_DAYS)
+    pruned = 0
+    while True:
+        seqs = (await db.scalars(
+            select(ChangeLog.seq).where(ChangeLog.changed_at < cutoff).order_by(ChangeLog.seq).limit(PURGE_BATCH_SIZE)
+        )).all()
+        if not seqs:
+            return pruned
+        await db.execute(delete(ChangeLog).where(ChangeLog.seq.in_(seqs)))
+        await db.commit()
+        pruned += len(seqs)
+
+
+async def change_log_prune_loop():
+    """後台循環：定期清理過期的變更日誌"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                pruned = await prune_change_log(db)
+            if pruned:
+                print(f"已清理變更日誌: {pruned} 條")
+        except Exception as e:
+            print(f"清理變更日誌時出錯: {str(e)}")
+        await asyncio.sleep(CHANGE_LOG_PRUNE_INTERVAL)
@@ -0,0 +1,338 @@
+import asyncio
+import os
+import re
+import time
+import weakref
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.profiling import run_in_threadpool
+from app.core.query_budget import track_queries
+from app.models.models import ExecutionLogChunk, TestExecution
+
+# 每個日誌塊解壓後的字節數；讀取任意位置最多只需解壓一個塊的冗餘數據
+EXECUTION_LOG_CHUNK_SIZE = int(os.getenv("EXECUTION_LOG_CHUNK_SIZE", str(256 * 1024)))
+# 壓縮算法：zlib(默認) 或 zstd(需安裝 zstandard)；已寫入的塊各自記錄算法，切換後舊塊仍可讀取
+EXECUTION_LOG_CODEC = os.getenv("EXECUTION_LOG_CODEC", "zlib").lower()
+# 壓縮級別，未設置時使用算法的默認值
+EXECUTION_LOG_COMPRESSION_LEVEL = os.getenv("EXECUTION_LOG_COMPRESSION_LEVEL", "")
+# 單個執行記錄日誌的最大字節數(解壓後)
+EXECUTION_LOG_MAX_SIZE = int(os.getenv("EXECUTION_LOG_MAX_SIZE", str(512 * 1024 * 1024)))
+# 流式追加時，數據停頓超過該秒數即寫入已收到的部分，供其他客戶端實時讀取
+EXECUTION_LOG_FLUSH_INTERVAL = float(os.getenv("EXECUTION_LOG_FLUSH_INTERVAL", "2"))
+# 單次搜索最多解壓掃描的字節數和秒數，超過後返回已找到的匹配，可從 next_offset 繼續
+EXECUTION_LOG_SEARCH_MAX_BYTES = int(os.getenv("EXECUTION_LOG_SEARCH_MAX_BYTES", str(64 * 1024 * 1024)))
+EXECUTION_LOG_SEARCH_TIMEOUT = float(os.getenv("EXECUTION_LOG_SEARCH_TIMEOUT", "10"))
+
+# 一次查詢加載的塊數
+_READ_BATCH = 8
+# tail 最多讀取的塊數(行很長時返回的行數可能少於請求)
+_TAIL_MAX_CHUNKS = 32
+# 搜索結果中單行文本的最大字符數
+_MAX_MATCH_TEXT = 1000
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if EXECUTION_LOG_CODEC == "zstd" and zstandard is None:
+    print("警告: EXECUTION_LOG_CODEC=zstd 但未安裝 zstandard，日誌將使用zlib壓縮")
+
+
+# 同一日誌在進程內的追加按順序進行(SQLite不支持 FOR UPDATE 行鎖，嵌入式SQLite為單進程部署)
+_append_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+class ExecutionNotFoundError(LookupError):
+    pass
+
+
+class LogTooLargeError(Exception):
+    pass
+
+
+def _compress(data: bytes) -> Tuple[str, bytes]:
+    level = int(EXECUTION_LOG_COMPRESSION_LEVEL) if EXECUTION_LOG_COMPRESSION_LEVEL else None
+    if EXECUTION_LOG_CODEC == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+    return "zlib", zlib.compress(data, 6 if level is None else level)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("日誌塊使用zstd壓縮，但未安裝 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+async def append_log(db: AsyncSession, execution_id: int, data: bytes) -> int:
+    """追加日誌內容並提交，返回日誌的總字節數
+
+    最後一個未寫滿的塊與新內容合併後重新壓縮，頻繁的小追加不會產生大量碎塊。
+    """
+    lock = _append_locks.get(execution_id)
+    if lock is None:
+        lock = _append_locks[execution_id] = asyncio.Lock()
+    async with lock:
+        return await _append_locked(db, execution_id, data)
+
+
+async def _append_locked(db: AsyncSession, execution_id: int, data: bytes) -> int:
+    # 鎖定執行記錄，多個進程並發追加同一日誌時按順序進行(PostgreSQL)
+    locked = await db.scalar(select(TestExecution.id).where(TestExecution.id == execution_id).with_for_update())
+    if locked is None:
+        raise ExecutionNotFoundError(f"測試執行記錄 {execution_id} 不存在")
+
+    last = await db.scalar(
+        select(ExecutionLogChunk).where(ExecutionLogChunk.test_execution_id == execution_id)
+        .order_by(ExecutionLogChunk.seq.desc()).limit(1)
+    )
+    reuse = None
+    if last is None:
+        seq, offset, first_line = 0, 0, 0
+    elif last.raw_length < EXECUTION_LOG_CHUNK_SIZE and data:
+        reuse = last
+        seq, offset, first_line = last.seq, last.raw_offset, last.first_line
+        data = await run_in_threadpool(_decompress, last.codec, last.data) + data
+    else:
+        seq, offset, first_line = last.seq + 1, last.raw_offset + last.raw_length, last.first_line + last.line_count
+    if not data:
+        await db.rollback()
+        return offset
+    if offset + len(data) > EXECUTION_LOG_MAX_SIZE:
+        await db.rollback()
+        raise LogTooLargeError(f"日誌超過大小上限 {EXECUTION_LOG_MAX_SIZE} 字節")
+
+    pieces = [data[i:i + EXECUTION_LOG_CHUNK_SIZE] for i in range(0, len(data), EXECUTION_LOG_CHUNK_SIZE)]
+    compressed = await run_in_threadpool(lambda: [_compress(piece) for piece in pieces])
+    for piece, (codec, blob) in zip(pieces, compressed):
+        values = {
+            "raw_offset": offset, "raw_length": len(piece), "first_line": first_line,
+            "line_count": piece.count(b"\n"), "codec": codec, "data": blob,
+        }
+        if reuse is not None:
+            # 原位更新：同一次刷新中刪除再插入相同主鍵會衝突
+            for key, value in values.items():
+                setattr(reuse, key, value)
+            reuse = None
+        else:
+            db.add(ExecutionLogChunk(test_execution_id=execution_id, seq=seq, **values))
+        seq += 1
+        offset += len(piece)
+        first_line += values["line_count"]
+    await db.commit()
+    return offset
+
+
+async def append_stream(db: AsyncSession, execution_id: int, stream: AsyncIterator[bytes]) -> int:
+    """將請求體流式追加到日誌，返回日誌的總字節數
+
+    每積累一個塊的數據，或數據停頓超過 EXECUTION_LOG_FLUSH_INTERVAL 秒，即寫入已收到的部分，
+    測試運行期間其他客戶端可通過 tail 或 Range 讀取最新輸出；內存佔用不超過約兩個塊。
+    """
+    async def flush() -> int:
+        # 每次寫入是獨立的事務，語句數與日誌大小無關
+        with track_queries("execution_log.append", budget=4, detached=True):
+            size = await append_log(db, execution_id, bytes(buffer))
+        buffer.clear()
+        return size
+
+    buffer = bytearray()
+    size = None
+    iterator = stream.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                # 在單獨的任務中等待下一塊數據：超時後不能取消讀取，否則請求體流會被關閉
+                pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=EXECUTION_LOG_FLUSH_INTERVAL if buffer else None)
+            if not done:
+                size = await flush()
+                continue
+            task, pending = pending, None
+            try:
+                buffer += task.result()
+            except StopAsyncIteration:
+                break
+            if len(buffer) >= EXECUTION_LOG_CHUNK_SIZE:
+                size = await flush()
+    finally:
+        if pending is not None:
+            pending.cancel()
+    if buffer or size is None:
+        size = await flush()
+    return size
+
+
+async def delete_log(db: AsyncSession, execution_id: int) -> int:
+    result = await db.execute(delete(ExecutionLogChunk).where(ExecutionLogChunk.test_execution_id == execution_id))
+    await db.commit()
+    return result.rowcount
+
+
+async def log_index(db: AsyncSession, execution_id: int) -> List[Any]:
+    """日誌的塊索引(不含數據)，按位置排序"""
+    return (await db.execute(
+        select(
+            ExecutionLogChunk.seq, ExecutionLogChunk.raw_offset, ExecutionLogChunk.raw_length,
+            ExecutionLogChunk.first_line, ExecutionLogChunk.line_count,
+        )
+        .where(ExecutionLogChunk.test_execution_id == execution_id)
+        .order_by(ExecutionLogChunk.seq)
+    )).all()
+
+
+def log_size(index: Sequence[Any]) -> int:
+    return index[-1].raw_offset + index[-1].raw_length if index else 0
+
+
+async def log_info(db: AsyncSession, execution_id: int) -> Dict[str, int]:
+    row = (await db.execute(
+        select(
+            func.count(), func.coalesce(func.sum(ExecutionLogChunk.raw_length), 0),
+            func.coalesce(func.sum(ExecutionLogChunk.line_count), 0),
+            func.coalesce(func.sum(func.length(ExecutionLogChunk.data)), 0),
+        ).where(ExecutionLogChunk.test_execution_id == execution_id)
+    )).one()
+    return {"chunks": row[0], "size": row[1], "lines": row[2], "compressed_size": row[3]}
+
+
+async def _load_chunks(db: AsyncSession, execution_id: int, seqs: List[int]) -> AsyncIterator[Tuple[Any, bytes]]:
+    """按序加載並解壓指定的塊，每次查詢 _READ_BATCH 個"""
+    for i in range(0, len(seqs), _READ_BATCH):
+        rows = (await db.execute(
+            select(ExecutionLogChunk.seq, ExecutionLogChunk.raw_offset, ExecutionLogChunk.codec, ExecutionLogChunk.data)
+            .where(ExecutionLogChunk.test_execution_id == execution_id, ExecutionLogChunk.seq.in_(seqs[i:i + _READ_BATCH]))
+            .order_by(ExecutionLogChunk.seq)
+        )).all()
+        for row in rows:
+            yield row, await run_in_threadpool(_decompress, row.codec, row.data)
+
+
+async def iter_range(db: AsyncSession, execution_id: int, index: Sequence[Any], start: int, end: int) -> AsyncIterator[bytes]:
+    """讀取日誌的 [start, end] 字節(end 包含在內)，只解壓與範圍重疊的塊"""
+    seqs = [chunk.seq for chunk in index if chunk.raw_offset <= end and chunk.raw_offset + chunk.raw_length > start]
+    async for chunk, data in _load_chunks(db, execution_id, seqs):
+        piece = data[max(start - chunk.raw_offset, 0):end + 1 - chunk.raw_offset]
+        if piece:
+            yield piece
+
+
+async def tail(db: AsyncSession, execution_id: int, lines: int, index: Sequence[Any]) -> Tuple[bytes, int, int]:
+    """日誌的最後若干行，返回 (內容, 內容的起始字節, 起始行號)"""
+    if not index:
+        return b"", 0, 1
+    # 根據索引中的換行數從末尾向前選取塊，末尾的換行不算作一行
+    chosen = []
+    newlines = 0
+    for chunk in reversed(index):
+        chosen.append(chunk)
+        newlines += chunk.line_count
+        if newlines > lines or len(chosen) >= _TAIL_MAX_CHUNKS:
+            break
+    chosen.reverse()
+    data = b"".join([piece async for _, piece in _load_chunks(db, execution_id, [chunk.seq for chunk in chosen])])
+
+    position = len(data) - 1 if data.endswith(b"\n") else len(data)
+    for _ in range(lines):
+        position = data.rfind(b"\n", 0, position)
+        if position < 0:
+            break
+    start = position + 1
+    first_line = chosen[0].first_line + data.count(b"\n", 0, start) + 1
+    return data[start:], chosen[0].raw_offset + start, first_line
+
+
+async def search(
+    db: AsyncSession,
+    execution_id: int,
+    pattern: str,
+    index: Sequence[Any],
+    regex: bool = False,
+    ignore_case: bool = False,
+    max_matches: int = 100,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Dict[str, Any]:
+    """逐塊搜索匹配的行(類似 grep)，找到 max_matches 行即停止，不再解壓後面的塊
+
+    解碼和匹配在線程池中進行，不阻塞事件循環；掃描超過 EXECUTION_LOG_SEARCH_MAX_BYTES
+    或 EXECUTION_LOG_SEARCH_TIMEOUT 時同樣提前返回。拋出 re.error 表示正則表達式無效。
+    """
+    compiled = re.compile(pattern if regex else re.escape(pattern), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    # 區分大小寫的普通文本搜索可先在字節上判斷塊內是否存在，不存在則無需解碼
+    literal = pattern.encode("utf-8") if not regex and not ignore_case else None
+    size = log_size(index)
+    end = size - 1 if end is None else min(end, size - 1)
+    chunks = [chunk for chunk in index if chunk.raw_offset <= end and chunk.raw_offset + chunk.raw_length > start]
+
+    matches: List[Dict[str, Any]] = []
+    result = {"matches": matches, "truncated": False, "next_offset": None, "scanned_bytes": 0, "size": size}
+    if not chunks:
+        return result
+
+    carry = b""
+    carry_offset = chunks[0].raw_offset
+    line_base = chunks[0].first_line
+
+    def scan(block: bytes, block_offset: int, block_line: int) -> bool:
+        """在完整的行中查找，返回是否已達到匹配數上限"""
+        if literal is not None and literal not in block:
+            return False
+        # surrogateescape 可無損還原原始字節，用於計算字節偏移
+        text = block.decode("utf-8", "surrogateescape")
+        previous_start, line_no, byte_offset = 0, block_line + 1, block_offset
+        reported = -1
+        for match in compiled.finditer(text):
+            line_start = text.rfind("\n", 0, match.start()) + 1
+            # 同一行的多個匹配只報告一次
+            if line_start == reported:
+                continue
+            reported = line_start
+            line_no += text.count("\n", previous_start, line_start)
+            byte_offset += len(text[previous_start:line_start].encode("utf-8", "surrogateescape"))
+            previous_start = line_start
+            line_end = text.find("\n", line_start)
+            line = text[line_start:line_end if line_end >= 0 else len(text)]
+            line_bytes = line.encode("utf-8", "surrogateescape")
+            if byte_offset > end or byte_offset + len(line_bytes) < start:
+                continue
+            matches.append({
+                "line": line_no,
+                "offset": byte_offset,
+                "text": line_bytes.decode("utf-8", "replace").rstrip("\r")[:_MAX_MATCH_TEXT],
+            })
+            if len(matches) >= max_matches:
+                result["truncated"] = True
+                result["next_offset"] = byte_offset + len(line_bytes) + 1
+                return True
+        return False
+
+    deadline = time.monotonic() + EXECUTION_LOG_SEARCH_TIMEOUT
+    async for chunk, data in _load_chunks(db, execution_id, [chunk.seq for chunk in chunks]):
+        result["scanned_bytes"] += len(data)
+        buffer = carry + data
+        cut = buffer.rfind(b"\n") + 1
+        if cut == 0 and len(buffer) > EXECUTION_LOG_CHUNK_SIZE:
+            # 超長的行分段搜索，避免無限累積
+            cut = len(buffer)
+        block, carry = buffer[:cut], buffer[cut:]
+        if await run_in_threadpool(scan, block, carry_offset, line_base):
+            return result
+        carry_offset += cut
+        line_base += block.count(b"\n")
+        if result["scanned_bytes"] >= EXECUTION_LOG_SEARCH_MAX_BYTES or time.monotonic() >= deadline:
+            # 未掃描的部分從當前行首繼續
+            if carry_offset <= end:
+                result["truncated"] = True
+                result["next_offset"] = carry_offset
+            return result
+    if carry:
+        await run_in_threadpool(scan, carry, carry_offset, line_base)
+    return result
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from app.core.profiling import run_in_threadpool
+
+if TYPE_CHECKING:
+    from jira import JIRA
+
+# 客戶端池大小(同時進行的Jira請求數上限)
+JIRA_POOL_SIZE = int(os.getenv("JIRA_POOL_SIZE", "4"))
+# 連接超時與讀取超時(秒)
+JIRA_CONNECT_TIMEOUT = float(os.getenv("JIRA_CONNECT_TIMEOUT", "5"))
+JIRA_READ_TIMEOUT = float(os.getenv("JIRA_READ_TIMEOUT", "30"))
+# 單個請求失敗後的重試次數
+JIRA_MAX_RETRIES = int(os.getenv("JIRA_MAX_RETRIES", "2"))
+# 空閒超過該秒數的客戶端在使用前先探測服務器是否可用
+JIRA_HEALTH_CHECK_INTERVAL = float(os.getenv("JIRA_HEALTH_CHECK_INTERVAL", "60"))
+# 等待空閒客戶端的最長秒數
+JIRA_ACQUIRE_TIMEOUT = float(os.getenv("JIRA_ACQUIRE_TIMEOUT", "30"))
+
+
+class JiraUnavailableError(Exception):
+    """Jira未配置或無法連接"""
+
+
+# jira(連同 requests)導入約需0.2秒，在第一次創建客戶端時才加載。
+# 其他模塊通過 jira_client.JIRAError / jira_client.RequestException 引用異常類型，在 except 子句求值時才解析。
+_LAZY_ERRORS = {"JIRAError": ("jira.exceptions", "JIRAError"), "RequestException": ("requests", "RequestException")}
+
+
+class _NotLoaded(Exception):
+    """jira / requests 尚未導入時的佔位異常類型：此時不可能有它們的異常實例"""
+
+
+def _error_type(name: str) -> type:
+    module_name, attr = _LAZY_ERRORS[name]
+    module = sys.modules.get(module_name)
+    return _NotLoaded if module is None else getattr(module, attr)
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ERRORS:
+        return _error_type(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _settings() -> Tuple[str, str, str]:
+    jira_url = os.getenv("JIRA_URL")
+    jira_username = os.getenv("JIRA_USERNAME")
+    jira_api_token = os.getenv("JIRA_API_TOKEN")
+    if not jira_url or not jira_username or not jira_api_token:
+        raise JiraUnavailableError("Jira整合未配置，請設置JIRA_URL、JIRA_USERNAME和JIRA_API_TOKEN環境變量")
+    return jira_url, jira_username, jira_api_token
+
+
+def ensure_configured() -> None:
+    """檢查Jira連接參數是否已配置"""
+    _settings()
+
+
+def is_configured() -> bool:
+    try:
+        _settings()
+        return True
+    except JiraUnavailableError:
+        return False
+
+
+class _PooledClient:
+    __slots__ = ("jira", "last_checked")
+
+    def __init__(self, jira: "JIRA"):
+        self.jira = jira
+        self.last_checked = time.monotonic()
+
+
+class JiraClientPool:
+    """進程級Jira客戶端池
+
+    每個客戶端持有一個保持連接(keep-alive)的HTTP會話，首次使用時才創建並探測服務器；
+    歸還後供後續請求複用，空閒過久的客戶端在下次使用前重新探測，失效則重建。
+    requests 會話不保證線程安全，因此每個客戶端同一時間只借給一個請求。
+    """
+
+    def __init__(self, size: int = JIRA_POOL_SIZE, max_retries: int = JIRA_MAX_RETRIES):
+        self.size = size
+        self.max_retries = max_retries
+        self._slots = asyncio.Semaphore(size)
+        # 後進先出：優先複用最近使用過的客戶端，其連接最可能仍然有效
+        self._idle: List[_PooledClient] = []
+        self._settings: Optional[Tuple[str, str, str]] = None
+        self.created = 0
+
+    def _create(self, settings: Tuple[str, str, str]) -> "JIRA":
+        import requests
+        from jira import JIRA
+        from jira.exceptions import JIRAError
+
+        jira_url, jira_username, jira_api_token = settings
+        try:
+            jira = JIRA(
+                server=jira_url,
+                basic_auth=(jira_username, jira_api_token),
+                get_server_info=False,
+                max_retries=self.max_retries,
+                timeout=(JIRA_CONNECT_TIMEOUT, JIRA_READ_TIMEOUT),
+            )
+            jira.server_info()
+        except (JIRAError, requests.RequestException) as e:
+            raise JiraUnavailableError(f"Jira連接失敗: {str(e)}") from e
+        self.created += 1
+        return jira
+
+    @staticmethod
+    def _healthy(jira: "JIRA") -> bool:
+        try:
+            jira.server_info()
+            return True
+        except (_error_type("JIRAError"), _error_type("RequestException")):
+            return False
+
+    async def _checkout(self) -> _PooledClient:
+        settings = _settings()
+        if settings != self._settings:
+            # 配置變更後舊的客戶端不再使用
+            self._close_idle()
+            self._settings = settings
+        while self._idle:
+            pooled = self._idle.pop()
+            if time.monotonic() - pooled.last_checked < JIRA_HEALTH_CHECK_INTERVAL:
+                return pooled
+            if await run_in_threadpool(self._healthy, pooled.jira):
+                pooled.last_checked = time.monotonic()
+                return pooled
+            pooled.jira.close()
+        return _PooledClient(await run_in_threadpool(self._create, settings))
+
+    @asynccontextmanager
+    async def client(self):
+        """借用一個客戶端，退出上下文時歸還；連接層異常的客戶端直接丟棄"""
+        try:
+            await asyncio.wait_for(self._slots.acquire(), JIRA_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise JiraUnavailableError("等待可用的Jira連接超時")
+        pooled = None
+        try:
+            pooled = await self._checkout()
+            yield pooled.jira
+        except _error_type("RequestException"):
+            if pooled is not None:
+                pooled.jira.close()
+                pooled = None
+            raise
+        except asyncio.CancelledError:
+            # 線程池中的請求可能仍在使用該客戶端，不能再借給其他請求
+            pooled = None
+            raise
+        finally:
+            if pooled is not None:
+                self._idle.append(pooled)
+            self._slots.release()
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """借用客戶端在線程池中執行一次Jira API調用"""
+        async with self.client() as jira:
+            return await run_in_threadpool(getattr(jira, method), *args, **kwargs)
+
+    def _close_idle(self) -> None:
+        while self._idle:
+            self._idle.pop().jira.close()
+
+    def close(self) -> None:
+        """關閉所有空閒客戶端的HTTP會話"""
+        self._close_idle()
+        self._settings = None
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self.size, "created": self.created, "idle": len(self._idle)}
+
+
+# 進程級客戶端池
+jira_pool = JiraClientPool()
@@ -0,0 +1,124 @@
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import record_cache
+from app.models.models import JiraIssueCache, TestCase, TestExecution
+from app.services.jira_client import jira_pool
+from app.services.purge_service import not_deleted, visible_executions
+
+# 緩存的問題元數據的有效期(秒)，過期後下次使用時重新查詢
+JIRA_ISSUE_CACHE_TTL = float(os.getenv("JIRA_ISSUE_CACHE_TTL", "3600"))
+# 每個JQL搜索包含的問題鍵數(受URL長度和Jira單頁上限限制)
+JIRA_ISSUE_PREFETCH_CHUNK = int(os.getenv("JIRA_ISSUE_PREFETCH_CHUNK", "100"))
+
+ISSUE_FIELDS = "summary,status,project,issuetype"
+# 只有格式合法的問題鍵才拼入JQL
+ISSUE_KEY = re.compile(r"^[A-Z][A-Z0-9_]*-[1-9][0-9]*$")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _cache_row(raw: Dict[str, Any], fetched_at: datetime) -> Dict[str, Any]:
+    fields = raw.get("fields") or {}
+    return {
+        "jira_issue_key": raw["key"],
+        "project_key": (fields.get("project") or {}).get("key") or raw["key"].rsplit("-", 1)[0],
+        "summary": fields.get("summary"),
+        "status": (fields.get("status") or {}).get("name"),
+        "issue_type": (fields.get("issuetype") or {}).get("name"),
+        "fetched_at": fetched_at,
+    }
+
+
+async def _search(keys: List[str]) -> List[Dict[str, Any]]:
+    """用一個 key in (...) JQL 查詢一組問題；不存在的鍵被忽略而不是使整個查詢失敗"""
+    jql = f"key in ({', '.join(keys)})"
+    issues: List[Dict[str, Any]] = []
+    while True:
+        page = await jira_pool.call(
+            "search_issues", jql, startAt=len(issues), maxResults=len(keys),
+            fields=ISSUE_FIELDS, validate_query=False, json_result=True,
+        )
+        issues.extend(page.get("issues", []))
+        if not page.get("issues") or len(issues) >= page.get("total", 0):
+            return issues
+
+
+async def _store(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(JiraIssueCache.__table__).values(rows)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=["jira_issue_key"],
+        set_={column: stmt.excluded[column] for column in ("project_key", "summary", "status", "issue_type", "fetched_at")},
+    ))
+
+
+async def prefetch_issues(db: AsyncSession, issue_keys: Iterable[str], refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+    """返回問題鍵(大寫)到緩存元數據的映射，不存在的問題不在結果中
+
+    未緩存或已過期的問題按 JIRA_ISSUE_PREFETCH_CHUNK 分組，每組一次JQL搜索，結果寫入緩存並立即提交。
+    Jira不可用時拋出 JiraUnavailableError 或 JIRAError。
+    """
+    keys = list(dict.fromkeys(key.strip().upper() for key in issue_keys))
+    found: Dict[str, Dict[str, Any]] = {}
+    if not keys:
+        return found
+
+    if not refresh:
+        cutoff = _now() - timedelta(seconds=JIRA_ISSUE_CACHE_TTL)
+        for row in (await db.execute(
+            select(JiraIssueCache.__table__)
+            .where(JiraIssueCache.jira_issue_key.in_(keys), JiraIssueCache.fetched_at >= cutoff)
+        )).mappings():
+            found[row["jira_issue_key"]] = dict(row)
+
+    missing = [key for key in keys if key not in found and ISSUE_KEY.match(key)]
+    if not refresh:
+        record_cache("jira_issue", len(found), len(missing))
+    if not missing:
+        return found
+
+    fetched_at = _now()
+    rows = []
+    for start in range(0, len(missing), JIRA_ISSUE_PREFETCH_CHUNK):
+        rows.extend(_cache_row(raw, fetched_at) for raw in await _search(missing[start:start + JIRA_ISSUE_PREFETCH_CHUNK]))
+    if rows:
+        await _store(db, rows)
+        await db.commit()
+    requested = set(missing)
+    # 已移動的問題會以新鍵返回，只保留請求的鍵
+    found.update((row["jira_issue_key"], row) for row in rows if row["jira_issue_key"] in requested)
+    return found
+
+
+async def check_links(db: AsyncSession, items: List[Tuple[int, Dict[str, Any]]]) -> Dict[int, str]:
+    """批量校驗Jira關聯：一次預取所有問題，一次查詢所有引用的測試案例和執行記錄，返回 {條目位置: 錯誤信息}"""
+    issues = await prefetch_issues(db, (row["jira_issue_key"] for _, row in items))
+    case_ids = {row["test_case_id"] for _, row in items if row.get("test_case_id")}
+    execution_ids = {row["test_execution_id"] for _, row in items if row.get("test_execution_id")}
+    existing_cases = set((await db.scalars(
+        select(TestCase.id).where(TestCase.id.in_(case_ids), not_deleted(TestCase))
+    )).all()) if case_ids else set()
+    existing_executions = set((await db.scalars(
+        select(TestExecution.id).where(TestExecution.id.in_(execution_ids), visible_executions())
+    )).all()) if execution_ids else set()
+
+    errors: Dict[int, str] = {}
+    for index, row in items:
+        if row["jira_issue_key"].strip().upper() not in issues:
+            errors[index] = f"Jira問題 {row['jira_issue_key']} 不存在"
+        elif row.get("test_case_id") and row["test_case_id"] not in existing_cases:
+            errors[index] = f"測試案例 ID {row['test_case_id']} 不存在"
+        elif row.get("test_execution_id") and row["test_execution_id"] not in existing_executions:
+            errors[index] = f"測試執行 ID {row['test_execution_id']} 不存在"
+    return errors
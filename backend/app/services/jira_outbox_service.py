@@ -0,0 +1,299 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.profiling import run_in_threadpool
+from app.db.database import AsyncSessionLocal
+from app.models.models import JiraIntegration, JiraOutbox, TestStatus
+from app.services import jira_client
+from app.services.jira_client import JiraClientPool, JiraUnavailableError, is_configured
+from app.services.jira_sync_service import status_update_plan, transition_id
+
+# 合併窗口(秒)：問題的第一個狀態變更到達後等待該時間再發送，期間的變更只發送最新狀態
+JIRA_OUTBOX_WINDOW = float(os.getenv("JIRA_OUTBOX_WINDOW", "30"))
+# 分發器檢查到期條目的間隔(秒)
+JIRA_OUTBOX_POLL_INTERVAL = float(os.getenv("JIRA_OUTBOX_POLL_INTERVAL", "2"))
+# 每輪認領並發送的問題數
+JIRA_OUTBOX_BATCH_SIZE = int(os.getenv("JIRA_OUTBOX_BATCH_SIZE", "50"))
+# 分發器同時處理的問題數(獨立的客戶端池大小)
+JIRA_OUTBOX_CONCURRENCY = int(os.getenv("JIRA_OUTBOX_CONCURRENCY", "4"))
+# 分發器每秒發出的Jira請求數上限(0表示不限)
+JIRA_OUTBOX_RATE_LIMIT = float(os.getenv("JIRA_OUTBOX_RATE_LIMIT", "10"))
+# 重試：第 n 次失敗後等待 BACKOFF_BASE * 2^(n-1) 秒，最長 BACKOFF_MAX 秒；超過 MAX_ATTEMPTS 次後放棄
+JIRA_OUTBOX_MAX_ATTEMPTS = int(os.getenv("JIRA_OUTBOX_MAX_ATTEMPTS", "8"))
+JIRA_OUTBOX_BACKOFF_BASE = float(os.getenv("JIRA_OUTBOX_BACKOFF_BASE", "5"))
+JIRA_OUTBOX_BACKOFF_MAX = float(os.getenv("JIRA_OUTBOX_BACKOFF_MAX", "600"))
+# 單個請求收到429後原地等待並重試的次數，超過後整個條目延後到 Retry-After 之後再認領
+JIRA_OUTBOX_THROTTLE_RETRIES = int(os.getenv("JIRA_OUTBOX_THROTTLE_RETRIES", "3"))
+# 認領條目的租約(秒)：進程在發送中途退出時，條目在租約到期後由其他進程重新認領
+JIRA_OUTBOX_LEASE = float(os.getenv("JIRA_OUTBOX_LEASE", "300"))
+
+# 同一進程內同時只運行一個分發循環
+_dispatch_lock = asyncio.Lock()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue_status_changes(db: AsyncSession, changes: Iterable[Tuple[int, Optional[int], Any]]) -> int:
+    """將執行記錄的狀態變更寫入發件箱(不提交，與狀態變更處於同一事務)
+
+    changes 為 (執行記錄ID, 測試案例ID, 新狀態)。關聯到執行記錄本身或其測試案例(未指定執行記錄)的
+    每個Jira問題合併為一個條目；條目已存在時只更新為最新狀態，合併窗口不延長。返回涉及的問題數。
+    """
+    changes = [
+        (execution_id, case_id, TestStatus(status))
+        for execution_id, case_id, status in changes
+        if status is not None and TestStatus(status) != TestStatus.PENDING
+    ]
+    if not changes:
+        return 0
+
+    execution_ids = {execution_id for execution_id, _, _ in changes}
+    case_ids = {case_id for _, case_id, _ in changes if case_id is not None}
+    links = (await db.execute(
+        select(JiraIntegration.jira_issue_key, JiraIntegration.test_execution_id, JiraIntegration.test_case_id)
+        .where(or_(
+            JiraIntegration.test_execution_id.in_(execution_ids),
+            and_(JiraIntegration.test_execution_id.is_(None), JiraIntegration.test_case_id.in_(case_ids)),
+        ))
+    )).all()
+    if not links:
+        return 0
+
+    by_execution: Dict[int, List[str]] = {}
+    by_case: Dict[int, List[str]] = {}
+    for issue_key, execution_id, case_id in links:
+        if execution_id is not None:
+            by_execution.setdefault(execution_id, []).append(issue_key)
+        else:
+            by_case.setdefault(case_id, []).append(issue_key)
+
+    # 同一批內同一問題只保留最後一次變更(同一語句不能多次更新同一行)
+    latest: Dict[str, Tuple[int, TestStatus]] = {}
+    counts: Dict[str, int] = {}
+    for execution_id, case_id, status in changes:
+        for issue_key in by_execution.get(execution_id, []) + by_case.get(case_id, []):
+            latest[issue_key] = (execution_id, status)
+            counts[issue_key] = counts.get(issue_key, 0) + 1
+    if not latest:
+        return 0
+
+    now = _now()
+    window_end = now + timedelta(seconds=JIRA_OUTBOX_WINDOW)
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = JiraOutbox.__table__
+    stmt = insert(table).values([
+        {
+            "jira_issue_key": issue_key, "test_execution_id": execution_id, "status": status,
+            "revision": 1, "event_count": counts[issue_key], "queued_at": now, "available_at": window_end, "attempts": 0,
+        }
+        for issue_key, (execution_id, status) in latest.items()
+    ])
+    # 已放棄的條目收到新的狀態變更時重新開始計數
+    revived = table.c.failed_at.isnot(None)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.jira_issue_key],
+        set_={
+            "test_execution_id": stmt.excluded.test_execution_id,
+            "status": stmt.excluded.status,
+            "revision": table.c.revision + 1,
+            "event_count": table.c.event_count + stmt.excluded.event_count,
+            "queued_at": case((revived, stmt.excluded.queued_at), else_=table.c.queued_at),
+            "available_at": case((revived, stmt.excluded.available_at), else_=table.c.available_at),
+            "attempts": case((revived, 0), else_=table.c.attempts),
+            "last_error": case((revived, None), else_=table.c.last_error),
+            "failed_at": None,
+        },
+    )
+    await db.execute(stmt)
+    return len(latest)
+
+
+class RateLimiter:
+    """按固定間隔放行請求；收到429後暫停所有請求直至 Retry-After 到期"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._paused_until = 0.0
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        start = max(now, self._next)
+        self._next = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+        while self._paused_until > time.monotonic():
+            await asyncio.sleep(self._paused_until - time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# 分發器使用獨立的客戶端池，不與交互請求爭用連接；關閉客戶端內置的重試，
+# 限流和失敗由分發器按 Retry-After 和退避策略處理，不在線程中阻塞等待
+outbox_pool = JiraClientPool(JIRA_OUTBOX_CONCURRENCY, max_retries=0)
+outbox_limiter = RateLimiter(JIRA_OUTBOX_RATE_LIMIT)
+
+
+def _retry_after(e: Exception) -> float:
+    try:
+        return float(e.response.headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        return JIRA_OUTBOX_BACKOFF_BASE
+
+
+async def _call(method, *args, **kwargs):
+    """限速調用Jira API；收到429時所有請求暫停到 Retry-After，本請求隨後重試，已完成的請求不必重做"""
+    for attempt in range(JIRA_OUTBOX_THROTTLE_RETRIES + 1):
+        await outbox_limiter.acquire()
+        try:
+            return await run_in_threadpool(method, *args, **kwargs)
+        except jira_client.JIRAError as e:
+            if e.status_code != 429 or attempt == JIRA_OUTBOX_THROTTLE_RETRIES:
+                raise
+            outbox_limiter.pause(_retry_after(e))
+
+
+async def _deliver(jira, issue_key: str, execution_id: int, status: TestStatus) -> None:
+    """發送一個問題的最新狀態：評論隨工作流轉換一起提交，沒有可用轉換時只添加評論"""
+    comment, transition_name = status_update_plan(execution_id, status)
+    if transition_name:
+        issue = await _call(jira.issue, issue_key, fields="project,issuetype")
+        for refresh in (False, True):
+            found = await transition_id(jira, issue, transition_name, refresh)
+            if found is None:
+                continue
+            try:
+                await _call(jira.transition_issue, issue_key, found, comment=comment)
+                return
+            except jira_client.JIRAError as e:
+                # 400：緩存的轉換在當前狀態下不可用，刷新後重試，仍不可用則只添加評論
+                if e.status_code != 400:
+                    raise
+    await _call(jira.add_comment, issue_key, comment)
+
+
+async def _dispatch_entry(semaphore: asyncio.Semaphore, entry) -> Tuple[str, Optional[str], float]:
+    """返回 (結果, 錯誤信息, 重新發送前的等待秒數)"""
+    try:
+        async with semaphore:
+            async with outbox_pool.client() as jira:
+                await _deliver(jira, entry.jira_issue_key, entry.test_execution_id, entry.status)
+        return "sent", None, 0
+    except JiraUnavailableError as e:
+        # 創建客戶端時探測服務器被限流，按限流處理而不計入失敗
+        if isinstance(e.__cause__, jira_client.JIRAError) and e.__cause__.status_code == 429:
+            delay = _retry_after(e.__cause__)
+            outbox_limiter.pause(delay)
+            return "throttled", str(e), delay
+        return "retry", str(e), 0
+    except jira_client.JIRAError as e:
+        if e.status_code == 429:
+            delay = _retry_after(e)
+            outbox_limiter.pause(delay)
+            return "throttled", str(e), delay
+        if e.status_code == 404:
+            # 問題不存在或無權訪問，重試沒有意義
+            return "failed", str(e), 0
+        return "retry", str(e), 0
+    except jira_client.RequestException as e:
+        return "retry", str(e), 0
+
+
+async def _claim(db: AsyncSession, now: datetime) -> list:
+    """認領到期條目：將可用時間推遲一個租約，多個進程同時分發時每個條目只被一個進程認領"""
+    table = JiraOutbox.__table__
+    due = (
+        select(table.c.jira_issue_key)
+        .where(table.c.failed_at.is_(None), table.c.available_at <= now)
+        .order_by(table.c.available_at)
+        .limit(JIRA_OUTBOX_BATCH_SIZE)
+    )
+    claimed = (await db.execute(
+        update(table)
+        .where(table.c.jira_issue_key.in_(due), table.c.failed_at.is_(None), table.c.available_at <= now)
+        .values(available_at=now + timedelta(seconds=JIRA_OUTBOX_LEASE))
+        .returning(table.c.jira_issue_key, table.c.test_execution_id, table.c.status,
+                   table.c.revision, table.c.attempts)
+    )).all()
+    await db.commit()
+    return claimed
+
+
+async def _record(db: AsyncSession, entry, outcome: str, error: Optional[str], delay: float) -> None:
+    table = JiraOutbox.__table__
+    now = _now()
+    row = table.c.jira_issue_key == entry.jira_issue_key
+    if outcome == "sent":
+        await db.execute(delete(table).where(row, table.c.revision == entry.revision))
+        # 發送期間合併了新的狀態變更：保留條目，在下一個合併窗口後發送
+        await db.execute(update(table).where(row).values(
+            available_at=now + timedelta(seconds=JIRA_OUTBOX_WINDOW), attempts=0, last_error=None,
+        ))
+        return
+
+    values: Dict[str, Any] = {"last_error": error[:2000] if error else None}
+    attempts = entry.attempts + 1
+    if outcome == "throttled":
+        # 限流不計入失敗次數
+        values["available_at"] = now + timedelta(seconds=delay)
+    elif outcome == "failed" or attempts >= JIRA_OUTBOX_MAX_ATTEMPTS:
+        values.update(attempts=attempts, failed_at=now)
+    else:
+        backoff = min(JIRA_OUTBOX_BACKOFF_MAX, JIRA_OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+        values.update(attempts=attempts, available_at=now + timedelta(seconds=backoff))
+    await db.execute(update(table).where(row).values(**values))
+
+
+async def dispatch_due() -> Dict[str, int]:
+    """認領並發送一批到期的條目，返回各結果的數量"""
+    result = {"claimed": 0, "sent": 0, "retry": 0, "throttled": 0, "failed": 0}
+    async with AsyncSessionLocal() as db:
+        claimed = await _claim(db, _now())
+        if not claimed:
+            return result
+        result["claimed"] = len(claimed)
+
+        semaphore = asyncio.Semaphore(JIRA_OUTBOX_CONCURRENCY)
+        outcomes = await asyncio.gather(*(_dispatch_entry(semaphore, entry) for entry in claimed))
+        for entry, (outcome, error, delay) in zip(claimed, outcomes):
+            await _record(db, entry, outcome, error, delay)
+            result[outcome] += 1
+        await db.commit()
+    return result
+
+
+async def run_outbox_dispatch() -> Dict[str, int]:
+    """發送所有到期的條目(一批認領滿時繼續下一批)"""
+    total = {"claimed": 0, "sent": 0, "retry": 0, "throttled": 0, "failed": 0}
+    async with _dispatch_lock:
+        while True:
+            result = await dispatch_due()
+            for key, count in result.items():
+                total[key] += count
+            if result["claimed"] < JIRA_OUTBOX_BATCH_SIZE or result["throttled"]:
+                return total
+
+
+async def jira_outbox_loop():
+    """後台循環：定期發送到期的Jira狀態同步"""
+    while True:
+        if is_configured():
+            try:
+                result = await run_outbox_dispatch()
+                if result["retry"] or result["failed"]:
+                    print(f"Jira同步發件箱: {result}")
+            except Exception as e:
+                print(f"發送Jira同步時出錯: {str(e)}")
+        await asyncio.sleep(JIRA_OUTBOX_POLL_INTERVAL)
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.profiling import run_in_threadpool
+from app.services import jira_client
+from app.services.jira_client import jira_pool
+
+# 一次狀態同步中並發處理的問題數上限(實際並發還受客戶端池大小限制)
+JIRA_FANOUT_CONCURRENCY = int(os.getenv("JIRA_FANOUT_CONCURRENCY", "8"))
+# 工作流轉換(名稱到ID)緩存的有效期(秒)
+JIRA_TRANSITION_CACHE_TTL = float(os.getenv("JIRA_TRANSITION_CACHE_TTL", "600"))
+
+
+class TransitionCache:
+    """按 (項目, 問題類型) 緩存工作流轉換的名稱到ID映射
+
+    同一項目和問題類型通常共用一個工作流，轉換ID在工作流內不變，
+    因此同步多個問題時只需查詢一次可用轉換。
+    """
+
+    def __init__(self, ttl: float = JIRA_TRANSITION_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, str], Tuple[float, Dict[str, str]]] = {}
+
+    def get(self, key: Tuple[str, str]) -> Optional[Dict[str, str]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, key: Tuple[str, str], transitions: List[Dict[str, Any]]) -> Dict[str, str]:
+        mapping = {t["name"].lower(): t["id"] for t in transitions}
+        self._entries[key] = (time.monotonic() + self.ttl, mapping)
+        return mapping
+
+    def invalidate(self, key: Tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+transition_cache = TransitionCache()
+
+
+def status_update_plan(execution_id: int, status) -> Tuple[str, Optional[str]]:
+    """根據測試執行狀態生成評論內容和目標轉換名稱"""
+    if status == "passed":
+        return f"✅ 測試通過: 執行ID {execution_id} 已成功通過測試。", "Done"  # 假設的工作流轉換名稱
+    if status == "failed":
+        return f"❌ 測試失敗: 執行ID {execution_id} 未通過測試。請檢查詳細結果。", "Reopen"  # 假設的工作流轉換名稱
+    status_value = getattr(status, "value", status)
+    return f"⚠️ 測試狀態: 執行ID {execution_id} 的狀態為 {status_value}。", None
+
+
+async def transition_id(jira, issue, transition_name: str, refresh: bool = False) -> Optional[str]:
+    """按名稱查找轉換ID；優先使用 (項目, 問題類型) 緩存，refresh 時重新查詢本問題的轉換列表"""
+    cache_key = (issue.fields.project.key, issue.fields.issuetype.name)
+    transitions = None if refresh else transition_cache.get(cache_key)
+    if transitions is None:
+        transitions = transition_cache.put(cache_key, await run_in_threadpool(jira.transitions, issue.key))
+    return transitions.get(transition_name.lower())
+
+
+async def _transition(jira, issue, transition_name: str) -> Optional[str]:
+    """按名稱轉換問題狀態，返回錯誤信息；轉換ID取自緩存，失效時刷新後重試一次"""
+    for refresh in (False, True):
+        found = await transition_id(jira, issue, transition_name, refresh)
+        if found is None:
+            # 當前狀態下可能沒有該轉換；緩存來自其他問題時再用本問題的轉換列表確認一次
+            continue
+        try:
+            await run_in_threadpool(jira.transition_issue, issue.key, found)
+            return None
+        except jira_client.JIRAError as e:
+            if refresh or e.status_code != 400:
+                return str(e)
+    return f"無法找到名為 '{transition_name}' 的轉換"
+
+
+async def update_issue_status(issue_key: str, execution_id: int, status) -> Dict[str, Any]:
+    """同步單個Jira問題：添加評論並嘗試轉換狀態"""
+    comment, transition_name = status_update_plan(execution_id, status)
+    result: Dict[str, Any] = {"issue_key": issue_key, "comment_added": False, "status_updated": False}
+    try:
+        async with jira_pool.client() as jira:
+            issue = await run_in_threadpool(jira.issue, issue_key, fields="project,issuetype")
+            await run_in_threadpool(jira.add_comment, issue_key, comment)
+            result["comment_added"] = True
+            if transition_name:
+                error = await _transition(jira, issue, transition_name)
+                if error:
+                    result["error"] = error
+                else:
+                    result["status_updated"] = True
+                    result["new_status"] = transition_name
+    except (jira_client.JiraUnavailableError, jira_client.JIRAError, jira_client.RequestException) as e:
+        # 連接失敗也記入該問題的結果，不中斷其他問題的同步
+        result["error"] = str(e)
+    return result
+
+
+async def sync_issue_statuses(execution_id: int, status, issue_keys: List[str]) -> AsyncIterator[Dict[str, Any]]:
+    """並發同步多個問題，按完成順序逐個產出結果
+
+    每個結果包含 index(在 issue_keys 中的位置)，調用方可據此恢復原始順序。
+    """
+    semaphore = asyncio.Semaphore(JIRA_FANOUT_CONCURRENCY)
+
+    async def run(index: int, issue_key: str) -> Dict[str, Any]:
+        async with semaphore:
+            return {"index": index, **await update_issue_status(issue_key, execution_id, status)}
+
+    tasks = [asyncio.ensure_future(run(index, key)) for index, key in enumerate(issue_keys)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # 客戶端斷開或調用方提前退出時取消未完成的請求
+        for task in tasks:
+            task.cancel()
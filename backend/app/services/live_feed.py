@@ -0,0 +1,441 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+import orjson
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from app.db.database import ASYNC_DATABASE_URL, AsyncSessionLocal
+from app.models.models import TestExecution, TestStatus
+
+# 事件總線：auto(PostgreSQL時使用LISTEN/NOTIFY，否則進程內)、memory、postgres
+LIVE_FEED_BUS = os.getenv("LIVE_FEED_BUS", "auto").lower()
+# 合併窗口(秒)：窗口內同一計劃的變更合併為一條推送
+LIVE_FEED_WINDOW = float(os.getenv("LIVE_FEED_WINDOW", "0.25"))
+# 每個連接的待發送消息上限，超出時丟棄積壓並改發快照
+LIVE_FEED_QUEUE_SIZE = int(os.getenv("LIVE_FEED_QUEUE_SIZE", "32"))
+# 一條推送中列出的執行記錄上限，超出部分只體現在計數中
+LIVE_FEED_MAX_EXECUTIONS = int(os.getenv("LIVE_FEED_MAX_EXECUTIONS", "200"))
+# 定期與數據庫核對有訂閱者的計劃的計數(秒)，修正事件丟失或重複造成的偏差
+LIVE_FEED_RESYNC_INTERVAL = float(os.getenv("LIVE_FEED_RESYNC_INTERVAL", "60"))
+
+NOTIFY_CHANNEL = "test_plan_events"
+# 每條NOTIFY攜帶的執行記錄數，保證負載低於PostgreSQL的8000字節上限
+NOTIFY_CHUNK = 100
+
+_SESSION_KEY = "live_feed_changes"
+
+
+def _status_value(status) -> Optional[str]:
+    return TestStatus(status).value if status is not None else None
+
+
+class LiveFeedLoadError(Exception):
+    """訂閱時無法加載測試計劃的狀態計數"""
+
+
+class PlanChanges:
+    """一個測試計劃的待發佈變更：狀態計數增量、變更的執行記錄，以及是否需要整體重算"""
+
+    __slots__ = ("counts", "executions", "resync")
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.executions: Dict[int, List[Any]] = {}
+        self.resync = False
+
+    def add(self, status: Optional[str], delta: int) -> None:
+        if status is not None:
+            self.counts[status] = self.counts.get(status, 0) + delta
+
+    def changed(self, execution_id: int, test_case_id: Optional[int], status: Optional[str]) -> None:
+        self.executions[execution_id] = [execution_id, test_case_id, status]
+
+    def merge_event(self, event_: Dict[str, Any]) -> None:
+        for status, delta in event_.get("counts", {}).items():
+            self.add(status, delta)
+        for row in event_.get("executions", ()):
+            self.executions[row[0]] = row
+        self.resync = self.resync or event_.get("resync", False)
+
+    def events(self, test_plan_id: int) -> List[Dict[str, Any]]:
+        """拆分為總線消息；計數只放在第一條中"""
+        counts = {status: delta for status, delta in self.counts.items() if delta}
+        rows = list(self.executions.values())
+        events = []
+        for start in range(0, max(len(rows), 1), NOTIFY_CHUNK):
+            event_: Dict[str, Any] = {"plan": test_plan_id, "executions": rows[start:start + NOTIFY_CHUNK]}
+            if start == 0:
+                event_["counts"] = counts
+                if self.resync:
+                    event_["resync"] = True
+            events.append(event_)
+        return events
+
+
+def _session_changes(session, test_plan_id: int) -> PlanChanges:
+    changes = session.info.setdefault(_SESSION_KEY, {})
+    if test_plan_id not in changes:
+        changes[test_plan_id] = PlanChanges()
+    return changes[test_plan_id]
+
+
+def record_resync(session, test_plan_ids: Iterable[int]) -> None:
+    """批量SQL寫入(不經過ORM)無法逐條跟蹤時調用：提交後訂閱者收到重新計算的快照"""
+    for test_plan_id in test_plan_ids:
+        _session_changes(session, test_plan_id).resync = True
+
+
+def record_removed(session, rows: Iterable[Any]) -> None:
+    """記錄批量刪除的執行記錄，rows 為 (id, test_plan_id, status)"""
+    for execution_id, test_plan_id, status in rows:
+        changes = _session_changes(session, test_plan_id)
+        changes.add(_status_value(status), -1)
+        changes.changed(execution_id, None, None)
+
+
+@event.listens_for(Session, "after_flush")
+def _capture_changes(session, flush_context):
+    """從ORM刷新中收集執行記錄的狀態變更，提交後再發佈"""
+    for obj in session.new:
+        if isinstance(obj, TestExecution):
+            # 未指定狀態時使用列默認值
+            status = _status_value(obj.status or TestStatus.PENDING)
+            changes = _session_changes(session, obj.test_plan_id)
+            changes.add(status, 1)
+            changes.changed(obj.id, obj.test_case_id, status)
+
+    for obj in session.dirty:
+        if not isinstance(obj, TestExecution):
+            continue
+        attrs = inspect(obj).attrs
+        status_history = attrs.status.history
+        plan_history = attrs.test_plan_id.history
+        if plan_history.has_changes():
+            record_resync(session, [plan_id for plan_id in (*plan_history.deleted, obj.test_plan_id) if plan_id])
+        elif status_history.has_changes():
+            changes = _session_changes(session, obj.test_plan_id)
+            status = _status_value(obj.status)
+            if status_history.deleted:
+                changes.add(_status_value(status_history.deleted[0]), -1)
+                changes.add(status, 1)
+            else:
+                # 舊值未加載，無法計算增量
+                changes.resync = True
+            changes.changed(obj.id, obj.test_case_id, status)
+
+    for obj in session.deleted:
+        if isinstance(obj, TestExecution):
+            changes = _session_changes(session, obj.test_plan_id)
+            changes.add(_status_value(obj.status), -1)
+            changes.changed(obj.id, obj.test_case_id, None)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    changes = session.info.pop(_SESSION_KEY, None)
+    if changes:
+        for test_plan_id, plan_changes in changes.items():
+            live_feed.publish(plan_changes.events(test_plan_id))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+class MemoryBus:
+    """進程內總線：適用於單進程部署(嵌入式SQLite等)"""
+
+    def __init__(self, deliver: Callable[[Dict[str, Any]], None]):
+        self.deliver = deliver
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    def publish(self, event_: Dict[str, Any]) -> None:
+        self.deliver(event_)
+
+
+class PostgresBus:
+    """基於 LISTEN/NOTIFY 的總線：每個進程一個專用連接，多進程部署時所有進程的訂閱者都能收到變更
+
+    NOTIFY 在提交後由該連接發出，因此消息本身不參與業務事務；連接斷開期間的消息會丟失，
+    重連後通知所有計劃重新計算快照。
+    """
+
+    def __init__(self, deliver: Callable[[Dict[str, Any]], None], on_reconnect: Callable[[], None]):
+        self.deliver = deliver
+        self.on_reconnect = on_reconnect
+        self.dsn = make_url(ASYNC_DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        self._outgoing: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._connected = asyncio.Event()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+        try:
+            await asyncio.wait_for(self._connected.wait(), 10)
+        except asyncio.TimeoutError:
+            print("實時推送總線連接超時，將在後台重試")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def publish(self, event_: Dict[str, Any]) -> None:
+        self._outgoing.put_nowait(orjson.dumps(event_).decode())
+
+    def _listener(self, connection, pid, channel, payload) -> None:
+        self.deliver(orjson.loads(payload))
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        reconnecting = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(NOTIFY_CHANNEL, self._listener)
+                self._connected.set()
+                if reconnecting:
+                    self.on_reconnect()
+                while True:
+                    payload = await self._outgoing.get()
+                    await connection.execute("SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"實時推送總線出錯: {str(e)}")
+                reconnecting = True
+                await asyncio.sleep(1)
+            finally:
+                if connection is not None:
+                    try:
+                        await asyncio.shield(connection.close(timeout=2))
+                    except Exception:
+                        connection.terminate()
+
+
+class _PlanChannel:
+    """一個測試計劃的訂閱者和當前計數"""
+
+    def __init__(self, test_plan_id: int):
+        self.test_plan_id = test_plan_id
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.counts: Optional[Dict[str, int]] = None
+        self.loading: Optional[asyncio.Task] = None
+        self.pending: Optional[PlanChanges] = None
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        # 加載快照期間收到的變更，加載後需要重新計算
+        self.stale = False
+
+
+class LiveFeed:
+    """實時執行進度推送
+
+    總線上的變更在 LIVE_FEED_WINDOW 內按計劃合併，每次推送只序列化一次，
+    然後把同一個字符串放入所有訂閱者的隊列；計數由服務器維護，新訂閱者直接獲得當前快照，無需查詢數據庫。
+    """
+
+    def __init__(self):
+        self.bus = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._plans: Dict[int, _PlanChannel] = {}
+        self._resync_task: Optional[asyncio.Task] = None
+
+    async def start(self, dialect_name: str) -> None:
+        use_postgres = LIVE_FEED_BUS == "postgres" or (LIVE_FEED_BUS == "auto" and dialect_name == "postgresql")
+        bus = PostgresBus(self.receive, self.resync_all) if use_postgres else MemoryBus(self.receive)
+        await bus.start()
+        self._loop = asyncio.get_running_loop()
+        self.bus = bus
+        self._resync_task = asyncio.create_task(self._resync_loop())
+
+    async def stop(self) -> None:
+        bus, self.bus = self.bus, None
+        if self._resync_task is not None:
+            self._resync_task.cancel()
+            self._resync_task = None
+        if bus is not None:
+            await bus.stop()
+        for channel in self._plans.values():
+            if channel.flush_handle is not None:
+                channel.flush_handle.cancel()
+            if channel.loading is not None:
+                channel.loading.cancel()
+        self._plans.clear()
+
+
+    def publish(self, events: List[Dict[str, Any]]) -> None:
+        """提交回調中調用：交給事件循環發佈，不在提交過程中處理(同步會話可能在其他線程提交)"""
+        if self.bus is None:
+            return
+        for event_ in events:
+            self._loop.call_soon_threadsafe(self._publish, event_)
+
+    def _publish(self, event_: Dict[str, Any]) -> None:
+        if self.bus is not None:
+            self.bus.publish(event_)
+
+    def receive(self, event_: Dict[str, Any]) -> None:
+        """總線消息入口：沒有本地訂閱者的計劃直接忽略"""
+        channel = self._plans.get(event_["plan"])
+        if channel is None:
+            return
+        if channel.counts is None or channel.loading is not None:
+            # 正在重新計算：該變更可能已包含在結果中，加載後再算一次
+            channel.stale = True
+            return
+        if channel.pending is None:
+            channel.pending = PlanChanges()
+            channel.flush_handle = asyncio.get_running_loop().call_later(
+                LIVE_FEED_WINDOW, self._flush, event_["plan"]
+            )
+        channel.pending.merge_event(event_)
+
+    def _flush(self, test_plan_id: int) -> None:
+        channel = self._plans.get(test_plan_id)
+        if channel is None or channel.pending is None:
+            return
+        pending, channel.pending, channel.flush_handle = channel.pending, None, None
+        if pending.resync:
+            self._start_load(channel)
+            return
+
+        counts = {status: delta for status, delta in pending.counts.items() if delta}
+        for status, delta in counts.items():
+            channel.counts[status] = channel.counts.get(status, 0) + delta
+        rows = list(pending.executions.values())
+        if not counts and not rows:
+            return
+        self._broadcast(channel, orjson.dumps({
+            "type": "delta",
+            "test_plan_id": test_plan_id,
+            "counts": counts,
+            "executions": [
+                {"id": execution_id, "test_case_id": test_case_id, "status": status}
+                for execution_id, test_case_id, status in rows[:LIVE_FEED_MAX_EXECUTIONS]
+            ],
+            "truncated": len(rows) > LIVE_FEED_MAX_EXECUTIONS,
+        }).decode())
+
+    @staticmethod
+    def _snapshot(channel: _PlanChannel) -> str:
+        return orjson.dumps({
+            "type": "snapshot",
+            "test_plan_id": channel.test_plan_id,
+            "counts": channel.counts,
+            "total": sum(channel.counts.values()),
+        }).decode()
+
+    def _broadcast(self, channel: _PlanChannel, message: str) -> None:
+        snapshot = None
+        for queue in channel.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # 慢速客戶端：丟棄積壓的增量，用一份快照代替
+                while not queue.empty():
+                    queue.get_nowait()
+                if snapshot is None:
+                    snapshot = self._snapshot(channel)
+                queue.put_nowait(snapshot)
+
+    async def _load(self, channel: _PlanChannel) -> None:
+        # 延遲導入：purge_service、plan_service 在寫入路徑中引用本模塊
+        from app.services.report_service import plan_status_counts
+
+        try:
+            while True:
+                channel.stale = False
+                # 使用主庫：只讀副本的延遲會使快照落後於隨後收到的增量
+                async with AsyncSessionLocal() as db:
+                    counts = await plan_status_counts(db, channel.test_plan_id)
+                if not channel.stale:
+                    break
+        finally:
+            channel.loading = None
+        changed = channel.counts is not None and channel.counts != counts
+        channel.counts = counts
+        if changed:
+            self._broadcast(channel, self._snapshot(channel))
+
+    def _start_load(self, channel: _PlanChannel) -> asyncio.Task:
+        if channel.loading is None:
+            channel.loading = asyncio.create_task(self._load(channel))
+            channel.loading.add_done_callback(self._load_done)
+        else:
+            channel.stale = True
+        return channel.loading
+
+    @staticmethod
+    def _load_done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"實時推送重新計算計數出錯: {str(task.exception())}")
+
+    def resync_all(self) -> None:
+        """重新計算所有有訂閱者的計劃的計數，有變化時發送快照"""
+        for channel in list(self._plans.values()):
+            if channel.counts is not None:
+                self._start_load(channel)
+
+    async def _resync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(LIVE_FEED_RESYNC_INTERVAL)
+            self.resync_all()
+
+    @asynccontextmanager
+    async def subscribe(self, test_plan_id: int):
+        """訂閱一個測試計劃，返回的隊列中第一條是快照，之後是合併後的增量
+
+        無法加載初始計數時拋出 LiveFeedLoadError。
+        """
+        if self.bus is None:
+            raise RuntimeError("實時推送未啟動")
+        channel = self._plans.get(test_plan_id)
+        if channel is None:
+            channel = self._plans[test_plan_id] = _PlanChannel(test_plan_id)
+        queue: asyncio.Queue = asyncio.Queue(LIVE_FEED_QUEUE_SIZE)
+        channel.subscribers.add(queue)
+        try:
+            if channel.counts is None:
+                try:
+                    await asyncio.shield(channel.loading or self._start_load(channel))
+                except Exception as e:
+                    # 加載任務結束時已清除 channel.loading，下一個訂閱者會重新加載
+                    raise LiveFeedLoadError(str(e)) from e
+            queue.put_nowait(self._snapshot(channel))
+            yield queue
+        finally:
+            channel.subscribers.discard(queue)
+            if not channel.subscribers and self._plans.get(test_plan_id) is channel:
+                # 最後一個訂閱者離開後不再跟蹤該計劃
+                del self._plans[test_plan_id]
+                if channel.flush_handle is not None:
+                    channel.flush_handle.cancel()
+                if channel.loading is not None:
+                    channel.loading.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "bus": type(self.bus).__name__ if self.bus else None,
+            "plans": len(self._plans),
+            "subscribers": sum(len(channel.subscribers) for channel in self._plans.values()),
+        }
+
+
+# 進程級實例
+live_feed = LiveFeed()
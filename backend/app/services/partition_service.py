@@ -0,0 +1,193 @@
+import asyncio
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import column, delete, func, literal, select, table as table_clause, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import AsyncSessionLocal
+from app.models.models import (
+    ExecutionLogChunk, JiraIntegration, TestExecution, TestPlan, TestResult, bump_plan_data_versions,
+)
+
+# 按 created_at 月度分區的表(分區佈局由遷移 b4a411dcb95e 可選啟用)
+PARTITIONED_TABLES = ("test_executions", "test_results")
+# 預先創建的未來月份分區數
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# 分區維護任務的執行間隔(秒)
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "3600"))
+# 執行記錄保留天數，0表示不自動清理
+EXECUTION_RETENTION_DAYS = int(os.getenv("EXECUTION_RETENTION_DAYS", "0"))
+# 未分區時逐批刪除的批大小
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "5000"))
+
+_PARTITION_NAME = re.compile(r"_p(\d{4})(\d{2})$")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def plan_pruning_clause(test_plan_id: int):
+    """計劃範圍查詢的分區裁剪條件
+
+    執行記錄不會早於所屬測試計劃創建，因此可以用計劃的創建時間作為
+    created_at 的下界，讓PostgreSQL在執行期跳過更早的分區。
+    """
+    plan_created = select(TestPlan.created_at).where(TestPlan.id == test_plan_id).scalar_subquery()
+    return TestExecution.created_at >= func.coalesce(plan_created, literal(_EPOCH))
+
+
+def execution_pruning_clause(execution_id: int):
+    """單個執行記錄步驟結果查詢的分區裁剪條件
+
+    在SQL中與執行記錄的 created_at 比較，避免使用Python端加載的值
+    (SQLite等佈局下精度截斷且不帶時區，會漏掉同一秒寫入的步驟)。
+    """
+    execution_created = select(TestExecution.created_at).where(TestExecution.id == execution_id).scalar_subquery()
+    return TestResult.created_at >= func.coalesce(execution_created, literal(_EPOCH))
+
+
+async def is_partitioned(db: AsyncSession) -> bool:
+    if db.bind.dialect.name != "postgresql":
+        return False
+    return bool(await db.scalar(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('test_executions')")
+    ))
+
+
+async def list_partitions(db: AsyncSession, table: str) -> List[Tuple[str, date]]:
+    """列出表的月度分區(名稱, 月份起始日)，不含默認分區"""
+    rows = await db.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": table})
+    partitions = []
+    for (name,) in rows:
+        match = _PARTITION_NAME.search(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+async def ensure_future_partitions(db: AsyncSession, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """確保從當前月份起的未來若干個月分區已存在，返回新建的分區名"""
+    created = []
+    current = date.today().replace(day=1)
+    for table in PARTITIONED_TABLES:
+        existing = {name for name, _ in await list_partitions(db, table)}
+        for n in range(months_ahead + 1):
+            month = _add_months(current, n)
+            name = f"{table}_p{month:%Y%m}"
+            if name in existing:
+                continue
+            try:
+                async with db.begin_nested():
+                    await db.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+                    ))
+                created.append(name)
+            except Exception as e:
+                # 默認分區中已有該範圍的數據時無法直接創建，需人工遷移
+                print(f"警告: 創建分區 {name} 失敗: {str(e)}")
+    await db.commit()
+    return created
+
+
+async def _drop_partitions_before(db: AsyncSession, cutoff: datetime) -> Dict[str, Any]:
+    """整分區刪除早於截止時間的月份(僅刪除上界不晚於截止時間的分區)"""
+    cutoff_month = cutoff.date().replace(day=1)
+    dropped = []
+    for name, month in await list_partitions(db, "test_executions"):
+        if _add_months(month, 1) > cutoff_month:
+            continue
+        upper = _add_months(month, 1).isoformat()
+        # 分區表上沒有外鍵，先清理引用這些執行記錄的關聯、日誌和跨月寫入的步驟結果
+        for table in ("jira_integrations", "execution_log_chunks"):
+            await db.execute(text(f"DELETE FROM {table} WHERE test_execution_id IN (SELECT id FROM {name})"))
+        await db.execute(text(
+            f"DELETE FROM test_results WHERE created_at >= '{upper}' "
+            f"AND test_execution_id IN (SELECT id FROM {name})"
+        ))
+        # DROP TABLE 不觸發變更日誌觸發器，顯式記錄刪除，增量同步的客戶端才能移除這些執行記錄
+        await db.execute(text(
+            f"INSERT INTO change_log (entity, entity_id, op) "
+            f"SELECT 'test_execution', id, 'delete' FROM {name} ORDER BY id"
+        ))
+        await db.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    for name, month in await list_partitions(db, "test_results"):
+        if _add_months(month, 1) <= cutoff_month:
+            await db.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    if dropped:
+        # 整分區刪除無法得知涉及哪些計劃，全部計劃的數據版本號遞增
+        await bump_plan_data_versions(db)
+    await db.commit()
+
+    # 啟用分區前的歷史數據都在默認分區中，只能逐批刪除
+    deleted = 0
+    if await db.scalar(text("SELECT to_regclass('test_executions_default') IS NOT NULL")):
+        deleted = await _delete_batches(db, cutoff, "test_executions_default")
+    return {"mode": "drop_partitions", "dropped": dropped, "deleted_executions": deleted}
+
+
+async def _delete_batches(db: AsyncSession, cutoff: datetime, source: str = "test_executions") -> int:
+    """按批刪除 source 表(執行記錄表或其某個分區)中早於截止時間的執行記錄及其子記錄，返回刪除數量"""
+    executions = table_clause(source, column("id"), column("created_at"))
+    deleted = 0
+    while True:
+        ids = (await db.scalars(
+            select(executions.c.id).where(executions.c.created_at < cutoff).limit(PURGE_BATCH_SIZE)
+        )).all()
+        if not ids:
+            break
+        await bump_plan_data_versions(db, select(TestExecution.test_plan_id).where(TestExecution.id.in_(ids)))
+        await db.execute(delete(JiraIntegration).where(JiraIntegration.test_execution_id.in_(ids)))
+        await db.execute(delete(TestResult).where(TestResult.test_execution_id.in_(ids)))
+        await db.execute(delete(ExecutionLogChunk).where(ExecutionLogChunk.test_execution_id.in_(ids)))
+        await db.execute(delete(TestExecution).where(TestExecution.id.in_(ids)))
+        await db.commit()
+        deleted += len(ids)
+    return deleted
+
+
+async def _delete_in_batches(db: AsyncSession, cutoff: datetime) -> Dict[str, Any]:
+    """未分區時按批刪除早於截止時間的執行記錄"""
+    return {"mode": "batched_delete", "deleted_executions": await _delete_batches(db, cutoff)}
+
+
+async def purge_executions_before(db: AsyncSession, cutoff: datetime) -> Dict[str, Any]:
+    """清理早於截止時間的執行記錄：分區佈局下整分區刪除，否則分批刪除"""
+    if await is_partitioned(db):
+        return await _drop_partitions_before(db, cutoff)
+    return await _delete_in_batches(db, cutoff)
+
+
+async def run_partition_maintenance() -> Dict[str, Any]:
+    """執行一次分區維護：創建未來分區，並按保留策略清理過期數據"""
+    result: Dict[str, Any] = {}
+    async with AsyncSessionLocal() as db:
+        if await is_partitioned(db):
+            result["created"] = await ensure_future_partitions(db)
+        if EXECUTION_RETENTION_DAYS > 0:
+            cutoff = datetime.now(timezone.utc) - timedelta(days=EXECUTION_RETENTION_DAYS)
+            result["purged"] = await purge_executions_before(db, cutoff)
+    return result
+
+
+async def partition_maintenance_loop():
+    """後台循環：定期執行分區維護"""
+    while True:
+        try:
+            result = await run_partition_maintenance()
+            if result.get("created") or result.get("purged"):
+                print(f"分區維護完成: {result}")
+        except Exception as e:
+            print(f"分區維護時出錯: {str(e)}")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
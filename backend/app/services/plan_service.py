@@ -0,0 +1,66 @@
+from typing import Any, Dict
+
+from sqlalchemy import exists, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import TestCase, TestExecution, TestStatus, bump_plan_data_versions
+from app.schemas.schemas import PlanInstantiateRequest
+from app.services.live_feed import record_resync
+from app.services.partition_service import plan_pruning_clause
+from app.services.purge_service import not_deleted, visible_executions
+
+
+def _case_selection(test_plan_id: int, request: PlanInstantiateRequest):
+    """構建待實例化測試案例ID的查詢"""
+    query = select(TestCase.id).where(not_deleted(TestCase))
+    if request.clone_from_plan_id is not None:
+        source_cases = (
+            select(TestExecution.test_case_id)
+            .where(
+                TestExecution.test_plan_id == request.clone_from_plan_id,
+                plan_pruning_clause(request.clone_from_plan_id),
+            )
+        )
+        query = query.where(TestCase.id.in_(source_cases))
+    if request.test_case_ids is not None:
+        query = query.where(TestCase.id.in_(request.test_case_ids))
+    if request.priorities:
+        query = query.where(TestCase.priority.in_(request.priorities))
+    if request.test_types:
+        query = query.where(TestCase.test_type.in_(request.test_types))
+    if request.title_contains:
+        query = query.where(TestCase.title.ilike(f"%{request.title_contains}%"))
+    if request.skip_existing:
+        # 已在計劃中的測試案例不重複創建
+        query = query.where(~exists().where(
+            TestExecution.test_plan_id == test_plan_id,
+            TestExecution.test_case_id == TestCase.id,
+            plan_pruning_clause(test_plan_id),
+        ))
+    return query
+
+
+async def instantiate_plan(db: AsyncSession, test_plan_id: int, request: PlanInstantiateRequest) -> Dict[str, Any]:
+    """以一條 INSERT ... SELECT 為測試計劃創建待執行記錄，返回創建數量"""
+    selection = _case_selection(test_plan_id, request)
+    rows = selection.with_only_columns(
+        literal(test_plan_id).label("test_plan_id"),
+        TestCase.id.label("test_case_id"),
+        literal(TestStatus.PENDING, TestExecution.status.type).label("status"),
+        maintain_column_froms=True,
+    )
+    result = await db.execute(
+        insert(TestExecution.__table__).from_select(["test_plan_id", "test_case_id", "status"], rows)
+    )
+    created = result.rowcount
+    if created:
+        await bump_plan_data_versions(db, [test_plan_id])
+        # INSERT ... SELECT 不經過ORM，提交後由實時推送重新計算該計劃的計數
+        record_resync(db, [test_plan_id])
+    await db.commit()
+
+    total = await db.scalar(
+        select(func.count()).select_from(TestExecution)
+        .where(TestExecution.test_plan_id == test_plan_id, plan_pruning_clause(test_plan_id), visible_executions())
+    )
+    return {"test_plan_id": test_plan_id, "created": created, "total_executions": total}
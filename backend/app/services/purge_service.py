@@ -0,0 +1,145 @@
+import asyncio
+import os
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import AsyncSessionLocal
+from app.models.models import (
+    ArchiveSegment, ExecutionLogChunk, JiraIntegration, TestCase, TestExecution, TestPlan, TestResult,
+    bump_plan_data_versions,
+)
+from app.services.archive_service import delete_segment_files
+from app.services.live_feed import record_removed
+from app.services.partition_service import PURGE_BATCH_SIZE
+
+# 後台清理已軟刪除數據的檢查間隔(秒)
+PURGE_INTERVAL = int(os.getenv("PURGE_INTERVAL", "60"))
+
+# 同一進程內同時只運行一個清理任務
+_purge_lock = asyncio.Lock()
+
+
+def not_deleted(model):
+    return model.deleted_at.is_(None)
+
+
+def visible_executions():
+    """所屬測試計劃和測試案例均未被軟刪除的執行記錄
+
+    等待清理的實體通常很少，NOT IN 子查詢的代價可以忽略。
+    """
+    deleted_plans = select(TestPlan.id).where(TestPlan.deleted_at.isnot(None))
+    deleted_cases = select(TestCase.id).where(TestCase.deleted_at.isnot(None))
+    return and_(
+        or_(TestExecution.test_plan_id.is_(None), TestExecution.test_plan_id.not_in(deleted_plans)),
+        or_(TestExecution.test_case_id.is_(None), TestExecution.test_case_id.not_in(deleted_cases)),
+    )
+
+
+async def get_active(db: AsyncSession, model, entity_id: int):
+    """按ID獲取未被軟刪除的測試計劃或測試案例"""
+    return (await db.scalars(select(model).where(model.id == entity_id, not_deleted(model)))).first()
+
+
+async def mark_deleted(db: AsyncSession, model, id_filter) -> List[int]:
+    """將匹配的測試計劃或測試案例標記為已刪除(不提交)，返回實際標記的ID"""
+    table = model.__table__
+    marked = (await db.scalars(
+        update(table)
+        .where(id_filter, table.c.deleted_at.is_(None))
+        .values(deleted_at=func.now(), version=table.c.version + 1)
+        .returning(table.c.id)
+    )).all()
+    if marked and model is TestCase:
+        # 含有這些案例執行記錄的計劃，其摘要立即發生變化
+        await bump_plan_data_versions(
+            db, select(TestExecution.test_plan_id).where(TestExecution.test_case_id.in_(marked))
+        )
+    return list(marked)
+
+
+async def soft_delete(db: AsyncSession, model, ids: Iterable[int]) -> List[int]:
+    """軟刪除測試計劃或測試案例：立即從所有讀取接口隱藏，數據由後台任務清理"""
+    marked = await mark_deleted(db, model, model.__table__.c.id.in_(list(ids)))
+    await db.commit()
+    return marked
+
+
+async def delete_executions(db: AsyncSession, execution_ids: List[int]) -> int:
+    """刪除執行記錄及其步驟結果、Jira關聯和日誌
+
+    分區佈局下指向執行記錄的外鍵不存在，數據庫無法級聯，因此總是顯式刪除子記錄。
+    """
+    if not execution_ids:
+        return 0
+    await bump_plan_data_versions(db, select(TestExecution.test_plan_id).where(TestExecution.id.in_(execution_ids)))
+    for statement in (
+        delete(JiraIntegration).where(JiraIntegration.test_execution_id.in_(execution_ids)),
+        delete(TestResult).where(TestResult.test_execution_id.in_(execution_ids)),
+        delete(ExecutionLogChunk).where(ExecutionLogChunk.test_execution_id.in_(execution_ids)),
+    ):
+        await db.execute(statement.execution_options(synchronize_session=False))
+    # 返回被刪除記錄的計劃和狀態，提交後推送給實時訂閱者
+    removed = (await db.execute(
+        delete(TestExecution).where(TestExecution.id.in_(execution_ids))
+        .returning(TestExecution.id, TestExecution.test_plan_id, TestExecution.status)
+        .execution_options(synchronize_session=False)
+    )).all()
+    record_removed(db, removed)
+    return len(removed)
+
+
+async def _purge_entity(db: AsyncSession, model, entity_id: int) -> int:
+    """分批刪除一個已軟刪除實體的執行記錄，最後刪除實體本身"""
+    column = TestExecution.test_plan_id if model is TestPlan else TestExecution.test_case_id
+    purged = 0
+    while True:
+        ids = (await db.scalars(select(TestExecution.id).where(column == entity_id).limit(PURGE_BATCH_SIZE))).all()
+        if not ids:
+            break
+        purged += await delete_executions(db, list(ids))
+        await db.commit()
+
+    segment_uris: List[str] = []
+    if model is TestPlan:
+        segment_uris = list((await db.scalars(
+            delete(ArchiveSegment).where(ArchiveSegment.test_plan_id == entity_id).returning(ArchiveSegment.uri)
+        )).all())
+    else:
+        await db.execute(delete(JiraIntegration).where(JiraIntegration.test_case_id == entity_id))
+    await db.execute(delete(model.__table__).where(model.__table__.c.id == entity_id))
+    await db.commit()
+    # 清單記錄刪除提交後再刪除歸檔文件，回滾時歸檔仍可讀取
+    await delete_segment_files(segment_uris)
+    return purged
+
+
+async def purge_deleted(db: AsyncSession) -> Dict[str, Any]:
+    """清理所有已軟刪除的測試計劃和測試案例"""
+    result = {"test_plans": 0, "test_cases": 0, "executions": 0}
+    async with _purge_lock:
+        for model, key in ((TestPlan, "test_plans"), (TestCase, "test_cases")):
+            for entity_id in (await db.scalars(select(model.id).where(model.deleted_at.isnot(None)))).all():
+                result["executions"] += await _purge_entity(db, model, entity_id)
+                result[key] += 1
+    return result
+
+
+async def run_purge():
+    """後台任務：在獨立會話中清理已軟刪除的數據"""
+    try:
+        async with AsyncSessionLocal() as db:
+            result = await purge_deleted(db)
+        if result["test_plans"] or result["test_cases"]:
+            print(f"已清理軟刪除數據: {result}")
+    except Exception as e:
+        print(f"清理軟刪除數據時出錯: {str(e)}")
+
+
+async def purge_loop():
+    """後台循環：定期清理中斷或遺留的軟刪除數據"""
+    while True:
+        await run_purge()
+        await asyncio.sleep(PURGE_INTERVAL)
@@ -1,22 +1,95 @@
 import os
-import tempfile
-from datetime import datetime
-from sqlalchemy.orm import Session
+from typing import Any, Dict, List
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from app.core.metrics import REPORT_RENDER_DURATION
+from app.core.profiling import run_in_threadpool
+from app.core.query_budget import track_queries
 from app.models.models import TestPlan, TestExecution, TestCase, TestResult
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from app.services.partition_service import plan_pruning_clause
+from app.services.archive_service import archived_status_counts, load_archived_executions
+from app.services.result_store import expand_packed_results
+from app.services.purge_service import get_active, visible_executions
 
-def generate_pdf_report(test_plan_id: int, db: Session) -> str:
-    """生成測試計劃的PDF報告"""
-    # 獲取測試計劃數據
-    test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
-    if not test_plan:
-        raise ValueError(f"測試計劃ID {test_plan_id} 不存在")
+async def plan_status_counts(db: AsyncSession, test_plan_id: int) -> Dict[str, int]:
+    """按狀態統計測試計劃下的執行數量(包括已歸檔的執行記錄)"""
+    rows = (await db.execute(
+        select(TestExecution.status, func.count())
+        .where(TestExecution.test_plan_id == test_plan_id, plan_pruning_clause(test_plan_id), visible_executions())
+        .group_by(TestExecution.status)
+    )).all()
+    counts = {(status.value if status else None): count for status, count in rows}
+    
+    # 合併已歸檔執行記錄的狀態統計
+    for status, count in (await archived_status_counts(db, test_plan_id)).items():
+        counts[status] = counts.get(status, 0) + count
+    return counts
+
+async def load_report_data(test_plan_id: int, db: AsyncSession) -> Dict[str, Any]:
+    """加載生成報告所需的數據(測試計劃、執行記錄及其測試案例)
+
+    每類數據一次查詢，語句數不隨執行記錄數增長。
+    """
+    with track_queries("load_report_data", budget=6):
+        # 獲取測試計劃數據
+        test_plan = await get_active(db, TestPlan, test_plan_id)
+        if not test_plan:
+            raise ValueError(f"測試計劃ID {test_plan_id} 不存在")
+        
+        # 獲取測試執行數據
+        plan_executions = (TestExecution.test_plan_id == test_plan_id, plan_pruning_clause(test_plan_id), visible_executions())
+        executions = (await db.scalars(select(TestExecution).where(*plan_executions))).all()
+        
+        # 逐行存儲的步驟結果按計劃一次查詢，緊湊存儲的步驟結果隨後解碼併入，渲染時不再訪問數據庫
+        results: Dict[int, List[TestResult]] = {}
+        for result in (await db.scalars(
+            select(TestResult)
+            .where(TestResult.test_execution_id.in_(select(TestExecution.id).where(*plan_executions)))
+            .order_by(TestResult.test_execution_id, TestResult.id)
+        )).all():
+            results.setdefault(result.test_execution_id, []).append(result)
+        for execution in executions:
+            set_committed_value(execution, "test_results", results.get(execution.id, []))
+        await expand_packed_results(db, executions)
+        
+        # 獲取測試案例信息
+        test_cases = {
+            test_case.id: test_case
+            for test_case in (await db.scalars(
+                select(TestCase).where(TestCase.id.in_(select(TestExecution.test_case_id).where(*plan_executions)))
+            )).all()
+        }
+        rows = [(execution, test_cases.get(execution.test_case_id)) for execution in executions]
+        
+        # 已歸檔到冷存儲的歷史執行記錄(步驟結果從歸檔文件讀取)
+        rows.extend(await load_archived_executions(db, test_plan_id))
     
-    # 獲取測試執行數據
-    executions = db.query(TestExecution).filter(TestExecution.test_plan_id == test_plan_id).all()
+    return {"test_plan": test_plan, "executions": rows}
+
+async def generate_pdf_report(test_plan_id: int, db: AsyncSession) -> str:
+    """生成測試計劃的PDF報告"""
+    data = await load_report_data(test_plan_id, db)
+    # ReportLab 渲染為CPU密集操作，放到線程池避免阻塞事件循環
+    return await run_in_threadpool(render_pdf_report, data)
+
+async def generate_html_report(test_plan_id: int, db: AsyncSession) -> str:
+    """生成測試計劃的HTML報告"""
+    data = await load_report_data(test_plan_id, db)
+    return await run_in_threadpool(render_html_report, data)
+
+@REPORT_RENDER_DURATION.time("pdf")
+def render_pdf_report(data: Dict[str, Any]) -> str:
+    """根據已加載的數據渲染PDF報告"""
+    # ReportLab 導入約需 0.2 秒和十幾MB內存，只在第一次生成PDF時加載
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib import colors
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    test_plan = data["test_plan"]
+    executions = [execution for execution, _ in data["executions"]]
+    test_plan_id = test_plan.id
     
     # 計算統計數據
     total = len(executions)
@@ -100,9 +173,7 @@ def generate_pdf_report(test_plan_id: int, db: Session) -> str:
         elements.append(Paragraph("詳細測試結果", heading2_style))
         elements.append(Spacer(1, 6))
         
-        for execution in executions:
-            # 獲取測試案例信息
-            test_case = db.query(TestCase).filter(TestCase.id == execution.test_case_id).first()
+        for execution, test_case in data["executions"]:
             if not test_case:
                 continue
             
@@ -159,15 +230,12 @@ def generate_pdf_report(test_plan_id: int, db: Session) -> str:
     
     return file_path
 
-def generate_html_report(test_plan_id: int, db: Session) -> str:
-    """生成測試計劃的HTML報告"""
-    # 獲取測試計劃數據
-    test_plan = db.query(TestPlan).filter(TestPlan.id == test_plan_id).first()
-    if not test_plan:
-        raise ValueError(f"測試計劃ID {test_plan_id} 不存在")
-    
-    # 獲取測試執行數據
-    executions = db.query(TestExecution).filter(TestExecution.test_plan_id == test_plan_id).all()
+@REPORT_RENDER_DURATION.time("html")
+def render_html_report(data: Dict[str, Any]) -> str:
+    """根據已加載的數據渲染HTML報告"""
+    test_plan = data["test_plan"]
+    executions = [execution for execution, _ in data["executions"]]
+    test_plan_id = test_plan.id
     
     # 計算統計數據
     total = len(executions)
@@ -279,8 +347,7 @@ def generate_html_report(test_plan_id: int, db: Session) -> str:
                 </tr>
         """
         
-        for execution in executions:
-            test_case = db.query(TestCase).filter(TestCase.id == execution.test_case_id).first()
+        for execution, test_case in data["executions"]:
             if not test_case:
                 continue
                 
@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import os
+import weakref
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.metrics import record_cache
+from app.models.models import StepDescription, TestExecution, TestResult, TestStatus
+
+# 步驟結果存儲模式：rows(每步驟一行) 或 packed(整個執行的步驟壓縮存於一列)
+RESULT_STORAGE = os.getenv("TEST_RESULT_STORAGE", "rows").lower()
+# 進程內步驟描述緩存的最大條目數(描述文本高度重複，緩存可省去大部分字典查詢)
+DESCRIPTION_CACHE_SIZE = int(os.getenv("STEP_DESCRIPTION_CACHE_SIZE", "50000"))
+
+_description_cache: Dict[str, str] = {}
+
+# 同一執行記錄的打包列在進程內按順序讀改寫(SQLite不支持 FOR UPDATE 行鎖，嵌入式SQLite為單進程部署)
+_pack_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def use_packed_storage() -> bool:
+    return RESULT_STORAGE == "packed"
+
+
+def description_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _remember(digest: str, text: str):
+    if len(_description_cache) >= DESCRIPTION_CACHE_SIZE:
+        _description_cache.clear()
+    _description_cache[digest] = text
+
+
+def _status_value(status) -> Optional[str]:
+    return status.value if isinstance(status, TestStatus) else status
+
+
+async def intern_descriptions(db: AsyncSession, texts: Iterable[str]) -> Dict[str, str]:
+    """將步驟描述寫入共享字典，返回 {描述文本: 哈希}"""
+    hashes = {text: description_hash(text) for text in set(texts)}
+    missing = {digest: text for text, digest in hashes.items() if digest not in _description_cache}
+    record_cache("step_description", len(hashes) - len(missing), len(missing))
+    if missing:
+        existing = set((await db.scalars(
+            select(StepDescription.hash).where(StepDescription.hash.in_(missing.keys()))
+        )).all())
+        new_rows = [{"hash": digest, "text": text} for digest, text in missing.items() if digest not in existing]
+        if new_rows:
+            if db.bind.dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            # 並發寫入相同描述時忽略衝突
+            await db.execute(insert(StepDescription).on_conflict_do_nothing(index_elements=["hash"]), new_rows)
+        for digest, text in missing.items():
+            _remember(digest, text)
+    return hashes
+
+
+async def pack_steps(db: AsyncSession, steps: List[Dict[str, Any]]) -> List[list]:
+    """將步驟結果字典列表打包為緊湊格式"""
+    hashes = await intern_descriptions(db, (step.get("step_description", "") for step in steps))
+    return [
+        [
+            step.get("step_number", 0),
+            hashes[step.get("step_description", "")],
+            _status_value(step.get("status", "pending")),
+            step.get("screenshot_url"),
+            step.get("notes"),
+        ]
+        for step in steps
+    ]
+
+
+def _pack_lock(execution_id: int) -> asyncio.Lock:
+    lock = _pack_locks.get(execution_id)
+    if lock is None:
+        lock = _pack_locks[execution_id] = asyncio.Lock()
+    return lock
+
+
+async def _lock_execution(db: AsyncSession, execution_id: int) -> Optional[TestExecution]:
+    # 鎖定執行記錄並重新讀取打包列，多個進程並發寫入同一執行記錄時按順序進行(PostgreSQL)
+    return (await db.scalars(
+        select(TestExecution).where(TestExecution.id == execution_id)
+        .with_for_update().execution_options(populate_existing=True)
+    )).first()
+
+
+async def append_packed_steps(db: AsyncSession, execution_id: int, steps: List[Dict[str, Any]]) -> bool:
+    """將步驟結果追加到執行記錄的打包列並提交，執行記錄不存在時返回False
+
+    先寫入描述字典再鎖定執行記錄，鎖只覆蓋讀改寫打包列本身。
+    """
+    packed = await pack_steps(db, steps)
+    async with _pack_lock(execution_id):
+        execution = await _lock_execution(db, execution_id)
+        if execution is None:
+            await db.rollback()
+            return False
+        execution.packed_results = (execution.packed_results or []) + packed
+        await db.commit()
+    return True
+
+
+async def _resolve_descriptions(db: AsyncSession, digests: Iterable[str]) -> Dict[str, str]:
+    digests = set(digests)
+    missing = [digest for digest in digests if digest not in _description_cache]
+    record_cache("step_description", len(digests) - len(missing), len(missing))
+    if missing:
+        for row in (await db.scalars(select(StepDescription).where(StepDescription.hash.in_(missing)))).all():
+            _remember(row.hash, row.text)
+    return {digest: _description_cache.get(digest, "") for digest in digests}
+
+
+async def unpack_results(db: AsyncSession, executions: Iterable[TestExecution]) -> Dict[int, List[TestResult]]:
+    """解碼緊湊存儲的步驟結果，返回 {執行ID: [未持久化的TestResult對象]}"""
+    packed = {e.id: e.packed_results for e in executions if e.packed_results}
+    if not packed:
+        return {}
+    descriptions = await _resolve_descriptions(db, (step[1] for steps in packed.values() for step in steps))
+    return {
+        execution_id: [
+            TestResult(
+                step_number=step_number,
+                step_description=descriptions[digest],
+                status=TestStatus(status),
+                screenshot_url=screenshot_url,
+                notes=notes,
+                test_execution_id=execution_id,
+            )
+            for step_number, digest, status, screenshot_url, notes in steps
+        ]
+        for execution_id, steps in packed.items()
+    }
+
+
+async def expand_packed_results(db: AsyncSession, executions: Iterable[TestExecution]):
+    """將緊湊存儲的步驟結果併入執行記錄的 test_results 集合(僅用於讀取，不會寫回)
+
+    調用前 test_results 必須已預加載(selectinload)，兩種存儲佈局因此可以混用。
+    """
+    executions = list(executions)
+    unpacked = await unpack_results(db, executions)
+    for execution in executions:
+        if execution.id in unpacked:
+            set_committed_value(
+                execution,
+                "test_results",
+                list(execution.test_results) + unpacked[execution.id],
+            )
+
+
+async def convert_execution(db: AsyncSession, execution: TestExecution, packed: bool):
+    """在兩種存儲佈局之間轉換一個執行記錄的步驟結果(test_results 需已預加載)
+
+    執行記錄被行鎖定到調用方提交為止，轉換期間並發追加的步驟不會被覆蓋。
+    """
+    rows = sorted(execution.test_results, key=lambda r: r.step_number)
+    if packed and not rows:
+        return
+    if await _lock_execution(db, execution.id) is None:
+        return
+    if packed:
+        steps = [
+            {
+                "step_number": r.step_number,
+                "step_description": r.step_description,
+                "status": r.status,
+                "screenshot_url": r.screenshot_url,
+                "notes": r.notes,
+            }
+            for r in rows
+        ]
+        execution.packed_results = (execution.packed_results or []) + await pack_steps(db, steps)
+        # 只刪除已打包的行，加載之後並發寫入的行留待下次轉換
+        await db.execute(delete(TestResult).where(TestResult.id.in_([r.id for r in rows])))
+    else:
+        unpacked = await unpack_results(db, [execution])
+        for result in unpacked.get(execution.id, []):
+            db.add(result)
+        execution.packed_results = None
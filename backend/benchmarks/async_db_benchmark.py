@@ -0,0 +1,115 @@
+"""異步數據庫路徑負載基準測試
+
+對比兩種處理方式在並發請求下的吞吐量：
+- sync-in-async: `async def` 路由中直接調用同步 SessionLocal(舊實現，阻塞事件循環)
+- async: 使用 AsyncSession(asyncpg / aiosqlite)
+
+用法:
+    DATABASE_URL=postgresql://user:@localhost/testmanagement \\
+        python -m benchmarks.async_db_benchmark --concurrency 50 --requests 200
+
+結果以JSON格式輸出到標準輸出，可通過 --output 寫入文件。
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import DATABASE_URL, SessionLocal, async_engine, get_async_db
+
+
+def _slow_query(seconds: float):
+    """構造一條耗時約為指定秒數的查詢"""
+    if DATABASE_URL.startswith("sqlite"):
+        # SQLite 沒有 sleep 函數，使用遞歸CTE消耗時間
+        rows = int(seconds * 2_000_000)
+        return text(
+            "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :n) SELECT count(*) FROM c"
+        ).bindparams(n=rows)
+    return text("SELECT pg_sleep(:s)").bindparams(s=seconds)
+
+
+def build_app(seconds: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sync-in-async")
+    async def sync_in_async():
+        db = SessionLocal()
+        try:
+            db.execute(_slow_query(seconds))
+        finally:
+            db.close()
+        return {"ok": True}
+
+    @app.get("/async")
+    async def fully_async(db: AsyncSession = Depends(get_async_db)):
+        await db.execute(_slow_query(seconds))
+        return {"ok": True}
+
+    return app
+
+
+async def _drive(app: FastAPI, path: str, concurrency: int, total: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "path": path,
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--query-seconds", type=float, default=0.05)
+    parser.add_argument("--output", help="結果JSON文件路徑")
+    args = parser.parse_args(argv)
+
+    app = build_app(args.query_seconds)
+    results = {
+        "benchmark": "async_db",
+        "database": DATABASE_URL.split("://", 1)[0],
+        "query_seconds": args.query_seconds,
+        "runs": [
+            await _drive(app, "/sync-in-async", args.concurrency, args.requests),
+            await _drive(app, "/async", args.concurrency, args.requests),
+        ],
+    }
+
+    # 關閉連接池(SQLite下連接的工作線程會阻止進程退出)
+    await async_engine.dispose()
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    print(payload)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,111 @@
+"""批量接口基準測試
+
+對比逐條調用 POST /api/test-cases/ 與批量接口(JSON數組、NDJSON)創建測試案例的吞吐量，
+並測量批量更新、批量刪除的耗時。
+
+用法:
+    DATABASE_URL=postgresql://user:@localhost/testmanagement \\
+        python -m benchmarks.bulk_benchmark --cases 40000 --single 1000
+
+逐條創建只執行 --single 條(按條/秒換算)，批量接口處理全部 --cases 條。
+結果以JSON格式輸出到標準輸出，可通過 --output 寫入文件。
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.api.routes import test_cases
+from app.api.serialization import NegotiatedResponse
+from app.db.database import Base, DATABASE_URL, async_engine, engine
+
+
+def build_app() -> FastAPI:
+    app = FastAPI(default_response_class=NegotiatedResponse)
+    app.include_router(test_cases.router, prefix="/api/test-cases")
+    return app
+
+
+def _case(n: int) -> dict:
+    return {
+        "title": f"批量基準案例 {n}",
+        "description": "由 bulk_benchmark 生成",
+        "steps": "1. 打開頁面\n2. 點擊按鈕\n3. 檢查結果",
+        "expected_result": "頁面顯示成功",
+        "priority": "medium",
+    }
+
+
+def _run(name: str, count: int, elapsed: float, **extra) -> dict:
+    return {"name": name, "items": count, "elapsed_s": round(elapsed, 4), "items_per_s": round(count / elapsed, 1), **extra}
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=40000)
+    parser.add_argument("--single", type=int, default=1000, help="逐條創建的條數")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--output", help="結果JSON文件路徑")
+    args = parser.parse_args(argv)
+
+    if DATABASE_URL.startswith("sqlite"):
+        Base.metadata.create_all(engine)
+    app = build_app()
+    runs = []
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def create_one(n):
+            async with semaphore:
+                (await client.post("/api/test-cases/", json=_case(n))).raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(create_one(n) for n in range(args.single)))
+        runs.append(_run("single_post", args.single, time.perf_counter() - started, concurrency=args.concurrency))
+
+        started = time.perf_counter()
+        response = await client.post("/api/test-cases/bulk", json=[_case(n) for n in range(args.cases)])
+        response.raise_for_status()
+        created = [item["id"] for item in response.json()["items"] if item["status"] == "created"]
+        runs.append(_run("bulk_json", args.cases, time.perf_counter() - started))
+
+        body = "\n".join(json.dumps(_case(n), ensure_ascii=False) for n in range(args.cases))
+        started = time.perf_counter()
+        response = await client.post("/api/test-cases/bulk", content=body, headers={"content-type": "application/x-ndjson"})
+        response.raise_for_status()
+        created += [item["id"] for item in response.json()["items"] if item["status"] == "created"]
+        runs.append(_run("bulk_ndjson", args.cases, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        response = await client.patch("/api/test-cases/bulk", json=[{"id": i, "priority": "high"} for i in created])
+        response.raise_for_status()
+        runs.append(_run("bulk_update", len(created), time.perf_counter() - started))
+
+        started = time.perf_counter()
+        response = await client.request("DELETE", "/api/test-cases/bulk", json=created)
+        response.raise_for_status()
+        runs.append(_run("bulk_delete", len(created), time.perf_counter() - started))
+
+    results = {
+        "benchmark": "bulk",
+        "database": DATABASE_URL.split("://", 1)[0],
+        "runs": runs,
+        "speedup_bulk_vs_single": round(runs[1]["items_per_s"] / runs[0]["items_per_s"], 1),
+    }
+
+    # 關閉連接池(SQLite下連接的工作線程會阻止進程退出)
+    await async_engine.dispose()
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    print(payload)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,103 @@
+"""對比兩次基準測試結果
+
+展開兩個結果JSON中的數值指標並逐項對比：以 _ms / _s / _mb 結尾或名為 ms 的指標越小越好，
+以 _rps / _per_s 結尾的指標越大越好，其他字段(行數、請求數等)只用於核對兩次運行的條件。
+任一指標變差超過閾值時以非零狀態退出，可在CI或提交前檢查中使用。
+
+用法:
+    python -m benchmarks.compare results/base.json results/HEAD.json --threshold 10
+
+對比結果以JSON格式輸出到標準輸出，可通過 --output 寫入文件。
+"""
+import argparse
+import json
+import sys
+
+# 不參與對比的字段(運行環境和時間戳)
+SKIP_KEYS = {"meta"}
+
+
+def _direction(key: str) -> int:
+    """1 表示越大越好，-1 表示越小越好，0 表示不是性能指標"""
+    if key.endswith(("_rps", "_per_s")):
+        return 1
+    if key == "ms" or key.endswith(("_ms", "_s", "_mb")):
+        return -1
+    return 0
+
+
+def flatten(results, prefix: str = "") -> dict:
+    metrics = {}
+    for key, value in results.items():
+        if not prefix and key in SKIP_KEYS:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{name}."))
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                if isinstance(item, dict):
+                    # 列表項優先以 name / path 標識，避免順序變化導致錯配
+                    label = item.get("name") or item.get("path") or index
+                    metrics.update(flatten(item, f"{name}.{label}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and _direction(key):
+            metrics[name] = (value, _direction(key))
+    return metrics
+
+
+def compare(base: dict, head: dict, threshold: float) -> dict:
+    base_metrics, head_metrics = flatten(base), flatten(head)
+    rows = []
+    for name in sorted(base_metrics.keys() & head_metrics.keys()):
+        (before, direction), (after, _) = base_metrics[name], head_metrics[name]
+        if before == 0:
+            continue
+        # 正數表示變好，負數表示變差
+        change = (after - before) / before * 100 * direction
+        rows.append({
+            "metric": name,
+            "base": before,
+            "head": after,
+            "change_pct": round(change, 2),
+            "status": "regressed" if change < -threshold else "improved" if change > threshold else "unchanged",
+        })
+    return {
+        "base": base.get("meta", {}).get("git"),
+        "head": head.get("meta", {}).get("git"),
+        "threshold_pct": threshold,
+        # 數據規模不同時對比沒有意義
+        "same_dataset": base.get("meta", {}).get("rows") == head.get("meta", {}).get("rows"),
+        "regressions": [row["metric"] for row in rows if row["status"] == "regressed"],
+        "metrics": rows,
+        "only_in_base": sorted(base_metrics.keys() - head_metrics.keys()),
+        "only_in_head": sorted(head_metrics.keys() - base_metrics.keys()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base", help="基準結果JSON(通常是目標分支的提交)")
+    parser.add_argument("head", help="待比較的結果JSON")
+    parser.add_argument("--threshold", type=float, default=10.0, help="視為回歸的變差百分比")
+    parser.add_argument("--output", help="對比結果JSON文件路徑")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.head, encoding="utf-8") as f:
+        head = json.load(f)
+    result = compare(base, head, args.threshold)
+
+    payload = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    print(payload)
+    for row in result["metrics"]:
+        if row["status"] != "unchanged":
+            print(f"{row['status']:>10} {row['change_pct']:+8.2f}%  {row['metric']}: {row['base']} -> {row['head']}", file=sys.stderr)
+    return 1 if result["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+"""合成測試數據生成器
+
+按固定隨機種子批量生成測試計劃、測試案例、執行記錄和步驟結果，規模從 10^4 到 10^7 行，
+供 benchmarks.suite 在同一份數據上對比不同提交的性能：
+- PostgreSQL: COPY 流式寫入
+- SQLite: 大事務內 executemany
+
+ID 從各表當前最大值之後連續分配，可以在已有數據上追加。寫入期間停用變更日誌觸發器(生成的數據不進入 /api/changes)，
+TEST_RESULT_STORAGE=packed 時步驟結果以緊湊格式寫入執行記錄。
+
+用法:
+    DATABASE_URL=postgresql://user:@localhost/testmanagement \\
+        python -m benchmarks.datagen --executions 1000000 --steps 5 --plan-size 1000
+
+結果(各表行數、耗時、每秒行數、生成的計劃ID範圍)以JSON格式輸出到標準輸出，可通過 --output 寫入文件。
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import orjson
+from sqlalchemy import func, select
+
+from app.db.database import DB_CREATE_ALL, Base, engine
+from app.models.models import CHANGE_LOG_TRIGGERS, StepDescription, TestCase, TestExecution, TestPlan, TestResult
+from app.services.result_store import description_hash, use_packed_storage
+
+# 每次COPY / executemany 的行數
+CHUNK_SIZE = 50_000
+
+# 執行狀態分布(狀態, 權重)
+STATUS_WEIGHTS = (("PASSED", 70), ("FAILED", 10), ("SKIPPED", 5), ("BLOCKED", 5), ("PENDING", 10))
+STEP_ACTIONS = ("打開", "填寫", "點擊", "校驗", "上傳", "刷新", "切換到", "關閉")
+STEP_TARGETS = ("登錄頁面", "用戶名輸入框", "提交按鈕", "搜索結果列表", "附件對話框", "設置頁面", "報表視圖", "通知面板")
+
+TABLE_COLUMNS = {
+    "test_plans": ("id", "name", "description", "created_at", "is_active", "version", "data_version"),
+    "test_cases": ("id", "title", "steps", "expected_result", "test_type", "priority", "created_at", "created_by", "version"),
+    "test_executions": ("id", "status", "executed_at", "executed_by", "duration", "notes", "test_plan_id",
+                        "test_case_id", "created_at", "packed_results", "version"),
+    "test_results": ("id", "step_number", "step_description", "status", "notes", "test_execution_id", "created_at"),
+}
+
+
+class Writer:
+    """按方言選擇批量寫入方式，時間戳和JSON按目標數據庫的存儲格式轉換"""
+
+    def __init__(self, connection, dialect: str):
+        self.connection = connection
+        self.dialect = dialect
+
+    def timestamp(self, value: datetime) -> str:
+        if self.dialect == "postgresql":
+            return value.isoformat()
+        # 與SQLAlchemy在SQLite中的DateTime存儲格式一致
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    def json(self, value) -> str:
+        return orjson.dumps(value).decode()
+
+    def write(self, table: str, rows) -> int:
+        columns = TABLE_COLUMNS[table]
+        written = 0
+        cursor = self.connection.cursor()
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= CHUNK_SIZE:
+                self._flush(cursor, table, columns, chunk)
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            self._flush(cursor, table, columns, chunk)
+            written += len(chunk)
+        cursor.close()
+        return written
+
+    def _flush(self, cursor, table: str, columns, chunk):
+        if self.dialect == "postgresql":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(chunk)
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, ENCODING 'UTF8')",
+                io.BytesIO(buffer.getvalue().encode("utf-8")),
+            )
+        else:
+            placeholders = ", ".join("?" for _ in columns)
+            cursor.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", chunk)
+
+
+def _next_ids(connection) -> dict:
+    return {
+        model.__tablename__: (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+        for model in (TestPlan, TestCase, TestExecution, TestResult)
+    }
+
+
+def _set_triggers(connection, dialect: str, enabled: bool):
+    """停用或恢復變更日誌觸發器"""
+    if dialect == "postgresql":
+        for table in ("test_executions", "test_cases"):
+            connection.exec_driver_sql(f"ALTER TABLE {table} {'ENABLE' if enabled else 'DISABLE'} TRIGGER USER")
+    elif enabled:
+        for statement in CHANGE_LOG_TRIGGERS["sqlite"]:
+            connection.exec_driver_sql(statement)
+    else:
+        for table in ("test_executions", "test_cases"):
+            for op in ("insert", "update", "delete"):
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {table}_change_{op}")
+
+
+def generate(args) -> dict:
+    if DB_CREATE_ALL:
+        Base.metadata.create_all(engine)
+    rng = random.Random(args.seed)
+    packed = use_packed_storage()
+    dialect = engine.dialect.name
+    plan_count = -(-args.executions // args.plan_size)
+    case_count = args.cases or args.plan_size
+    now = datetime.now(timezone.utc)
+    start = now - timedelta(days=args.days)
+    plan_spacing = timedelta(days=args.days) / max(plan_count, 1)
+    statuses, weights = zip(*STATUS_WEIGHTS)
+    descriptions = [f"{action}{target}" for action in STEP_ACTIONS for target in STEP_TARGETS]
+    description_hashes = [description_hash(text) for text in descriptions]
+
+    rows, elapsed = {}, {}
+    with engine.begin() as connection:
+        ids = _next_ids(connection)
+        writer = Writer(connection.connection.dbapi_connection, dialect)
+        _set_triggers(connection, dialect, enabled=False)
+        plan_ids = range(ids["test_plans"], ids["test_plans"] + plan_count)
+        case_ids = range(ids["test_cases"], ids["test_cases"] + case_count)
+
+        def timed(table, generator):
+            started = time.perf_counter()
+            rows[table] = writer.write(table, generator)
+            elapsed[table] = time.perf_counter() - started
+
+        timed("test_plans", (
+            (plan_id, f"基準測試計劃 {plan_id}", None, writer.timestamp(start + plan_spacing * n), True, 1, 1)
+            for n, plan_id in enumerate(plan_ids)
+        ))
+        timed("test_cases", (
+            (case_id, f"基準測試案例 {case_id}", "\n".join(f"{s}. {rng.choice(descriptions)}" for s in range(1, args.steps + 1)),
+             "結果符合預期", rng.choice(("MANUAL", "AUTOMATED", "HYBRID")),
+             rng.choice(("LOW", "MEDIUM", "HIGH", "CRITICAL")), writer.timestamp(start), "datagen", 1)
+            for case_id in case_ids
+        ))
+        if packed:
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            connection.execute(
+                insert(StepDescription).on_conflict_do_nothing(index_elements=["hash"]),
+                [{"hash": digest, "text": text} for digest, text in zip(description_hashes, descriptions)],
+            )
+
+        # 執行記錄和步驟結果一起生成，步驟結果先緩存在內存中按塊寫入
+        results = []
+        next_result_id = [ids["test_results"]]
+
+        def steps_for(execution_id, status, created_at):
+            if status == "PENDING":
+                return []
+            steps = []
+            for number in range(1, args.steps + 1):
+                step_status = status if number == args.steps else "PASSED"
+                index = rng.randrange(len(descriptions))
+                steps.append((number, index, step_status))
+            if not packed:
+                for number, index, step_status in steps:
+                    results.append((next_result_id[0], number, descriptions[index], step_status, None, execution_id, created_at))
+                    next_result_id[0] += 1
+            return steps
+
+        def executions():
+            execution_id = ids["test_executions"]
+            for n in range(args.executions):
+                plan_index = n // args.plan_size
+                plan_created = start + plan_spacing * plan_index
+                created = min(plan_created + timedelta(seconds=rng.randrange(7 * 86400)), now)
+                status = rng.choices(statuses, weights)[0]
+                created_at = writer.timestamp(created)
+                steps = steps_for(execution_id, status, created_at)
+                packed_results = writer.json([
+                    [number, description_hashes[index], step_status.lower(), None, None] for number, index, step_status in steps
+                ]) if packed else None
+                yield (
+                    execution_id, status,
+                    None if status == "PENDING" else writer.timestamp(created + timedelta(minutes=5)),
+                    f"runner-{n % 8}", None if status == "PENDING" else rng.randrange(1, 600),
+                    "失敗詳情見附件" if status == "FAILED" else None,
+                    plan_ids[plan_index], case_ids[(n % args.plan_size) % case_count], created_at, packed_results, 1,
+                )
+                execution_id += 1
+
+        started = time.perf_counter()
+        rows["test_executions"] = 0
+        rows["test_results"] = 0
+        result_time = 0.0
+        generator = executions()
+        while True:
+            chunk = [row for _, row in zip(range(CHUNK_SIZE), generator)]
+            if not chunk:
+                break
+            rows["test_executions"] += writer.write("test_executions", chunk)
+            result_started = time.perf_counter()
+            rows["test_results"] += writer.write("test_results", results)
+            result_time += time.perf_counter() - result_started
+            results.clear()
+        elapsed["test_executions"] = time.perf_counter() - started - result_time
+        elapsed["test_results"] = result_time
+
+        _set_triggers(connection, dialect, enabled=True)
+        if dialect == "postgresql":
+            for table in TABLE_COLUMNS:
+                connection.exec_driver_sql(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))")
+
+    started = time.perf_counter()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table in TABLE_COLUMNS:
+            connection.exec_driver_sql(f"ANALYZE {table}")
+    analyze_s = time.perf_counter() - started
+
+    total_rows = sum(rows.values())
+    total_s = sum(elapsed.values())
+    return {
+        "benchmark": "datagen",
+        "database": dialect,
+        "seed": args.seed,
+        "storage": "packed" if packed else "rows",
+        "plan_ids": [plan_ids[0], plan_ids[-1]] if plan_count else [],
+        "rows": rows,
+        "total_rows": total_rows,
+        "elapsed_s": {table: round(seconds, 3) for table, seconds in elapsed.items()},
+        "rows_per_s": {table: round(rows[table] / seconds) for table, seconds in elapsed.items() if seconds > 0},
+        "total_rows_per_s": round(total_rows / total_s) if total_s else None,
+        "analyze_s": round(analyze_s, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--executions", type=int, default=10_000, help="執行記錄數")
+    parser.add_argument("--steps", type=int, default=5, help="每個執行記錄的步驟數(待執行的記錄沒有步驟結果)")
+    parser.add_argument("--plan-size", type=int, default=1000, help="每個測試計劃的執行記錄數")
+    parser.add_argument("--cases", type=int, help="測試案例數，默認與 --plan-size 相同")
+    parser.add_argument("--days", type=int, default=180, help="數據覆蓋的天數(影響分區分布)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="結果JSON文件路徑")
+    args = parser.parse_args(argv)
+
+    result = generate(args)
+    payload = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    print(payload)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
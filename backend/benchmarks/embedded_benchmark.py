@@ -0,0 +1,164 @@
+"""嵌入式SQLite與PostgreSQL的啟動時間和吞吐量基準測試
+
+每個數據庫URL在獨立子進程中運行(數據庫URL在導入時確定)：
+- 啟動時間：從啟動子進程到應用完成啟動事件(SQLite按模型建表)並響應第一個查詢
+- 吞吐量：逐條創建測試案例、批量上傳測試結果(後台任務的批量寫入路徑)、並發讀取執行記錄列表和摘要
+
+用法:
+    python -m benchmarks.embedded_benchmark \\
+        --url sqlite:////tmp/tm-embedded.db \\
+        --url postgresql://user:@localhost/testmanagement --cases 2000 --results 5000
+
+SQLite文件會在每次運行前刪除，模擬全新的臨時實例；PostgreSQL數據庫需事先完成遷移。
+結果以JSON格式輸出到標準輸出，可通過 --output 寫入文件。
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from sqlalchemy.engine import make_url
+
+
+def _remove_sqlite_files(url: str) -> None:
+    database = make_url(url).database
+    if not database or database == ":memory:":
+        return
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+
+
+def _op(name: str, count: int, elapsed: float) -> dict:
+    return {"name": name, "items": count, "elapsed_s": round(elapsed, 4), "items_per_s": round(count / elapsed, 1)}
+
+
+async def worker(args) -> None:
+    """子進程：啟動應用並執行吞吐量測試，以JSON行報告進度"""
+    import httpx
+    from fastapi import FastAPI
+    from sqlalchemy import text
+
+    from app.api.routes import reports, test_cases, test_executions, test_plans
+    from app.api.routes.api_integration import process_test_results
+    from app.api.serialization import NegotiatedResponse
+    from app.db.database import AsyncSessionLocal
+    from app.main import app as main_app
+
+    await main_app.router.startup()
+    async with AsyncSessionLocal() as db:
+        await db.execute(text("SELECT count(*) FROM test_plans"))
+    print(json.dumps({"ready": True}), flush=True)
+
+    app = FastAPI(default_response_class=NegotiatedResponse)
+    for module, prefix in ((test_plans, "test-plans"), (test_cases, "test-cases"),
+                           (test_executions, "test-executions"), (reports, "reports")):
+        app.include_router(module.router, prefix=f"/api/{prefix}")
+
+    operations = []
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def create_case(n):
+            async with semaphore:
+                response = await client.post("/api/test-cases/", json={
+                    "title": f"嵌入式基準案例 {n}", "steps": "1. 打開頁面", "expected_result": "成功", "priority": "medium",
+                })
+                response.raise_for_status()
+                return response.json()["id"]
+
+        started = time.perf_counter()
+        case_ids = await asyncio.gather(*(create_case(n) for n in range(args.cases)))
+        operations.append(_op("single_post_case", args.cases, time.perf_counter() - started))
+
+        plan_id = (await client.post("/api/test-plans/", json={"name": "嵌入式基準計劃"})).json()["id"]
+        results = [
+            {
+                "test_case_id": case_ids[n % len(case_ids)],
+                "status": "passed" if n % 5 else "failed",
+                "duration": n % 60,
+                "steps": [{"step_number": s, "step_description": f"步驟 {s}", "status": "passed"} for s in range(1, 6)],
+            }
+            for n in range(args.results)
+        ]
+        started = time.perf_counter()
+        await process_test_results(plan_id, results)
+        operations.append(_op("upload_results", args.results, time.perf_counter() - started))
+
+        async def read(path):
+            async with semaphore:
+                (await client.get(path)).raise_for_status()
+
+        for name, path in (
+            ("list_executions", f"/api/test-executions/?test_plan_id={plan_id}&limit=100&fields=id,status,duration"),
+            ("plan_summary", f"/api/reports/summary/{plan_id}"),
+        ):
+            started = time.perf_counter()
+            await asyncio.gather(*(read(path) for _ in range(args.reads)))
+            operations.append(_op(name, args.reads, time.perf_counter() - started))
+
+    await main_app.router.shutdown()
+    print(json.dumps({"operations": operations}, ensure_ascii=False), flush=True)
+
+
+def run_backend(url: str, argv: list) -> dict:
+    """在子進程中運行一個數據庫後端，返回啟動時間和各項吞吐量"""
+    if url.startswith("sqlite"):
+        _remove_sqlite_files(url)
+    env = {**os.environ, "DATABASE_URL": url}
+    env.pop("ASYNC_DATABASE_URL", None)
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.embedded_benchmark", "--worker", *argv],
+        stdout=subprocess.PIPE, env=env, text=True,
+    )
+    result = {"database": url.split("://", 1)[0]}
+    for line in process.stdout:
+        # 應用自身的日誌輸出原樣轉發到標準錯誤
+        if not line.startswith("{"):
+            sys.stderr.write(line)
+            continue
+        message = json.loads(line)
+        if message.get("ready"):
+            result["startup_s"] = round(time.perf_counter() - started, 4)
+        else:
+            result.update(message)
+    if process.wait() != 0:
+        raise RuntimeError(f"{url} 基準測試失敗，退出碼 {process.returncode}")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", action="append", help="數據庫URL，可重複指定")
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--results", type=int, default=5000, help="批量上傳的測試結果數(每條5個步驟)")
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="結果JSON文件路徑")
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        asyncio.run(worker(args))
+        return
+
+    forwarded = ["--cases", str(args.cases), "--results", str(args.results),
+                 "--reads", str(args.reads), "--concurrency", str(args.concurrency)]
+    results = {
+        "benchmark": "embedded",
+        "runs": [run_backend(url, forwarded) for url in (args.url or ["sqlite:///./tm-embedded.db"])],
+    }
+
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    print(payload)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
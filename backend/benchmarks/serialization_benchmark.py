@@ -0,0 +1,188 @@
+"""列表接口序列化基準測試
+
+對比熱點列表數據的幾種序列化路徑：
+- legacy: 逐個 model_validate 後經 jsonable_encoder + json.dumps(FastAPI默認路徑)
+- orjson: TypeAdapter 批量校驗後用 orjson 編碼
+- trusted: 跳過校驗直接讀取ORM屬性後用 orjson 編碼
+- msgpack: 批量校驗後用 MessagePack 編碼
+
+並通過HTTP測量 /api/test-executions/ 和 /api/test-cases/ 在不同 Accept / Accept-Encoding 下的吞吐量與響應大小。
+
+用法:
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.serialization_benchmark --executions 2000 --steps 10
+
+會向數據庫寫入一個新的測試計劃及其測試數據。結果以JSON格式輸出到標準輸出，可通過 --output 寫入文件。
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+import orjson
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.api import serialization
+from app.api.routes import test_cases, test_executions
+from app.api.serialization import NegotiatedResponse, ResponseEncodingMiddleware, dump_models
+from app.db.database import AsyncSessionLocal, Base, DATABASE_URL, SessionLocal, async_engine, engine
+from app.models.models import TestCase, TestExecution, TestPlan, TestResult
+from app.schemas.schemas import TestExecutionResponse
+
+
+def seed(executions: int, steps: int) -> int:
+    """寫入測試數據，返回測試計劃ID"""
+    if DATABASE_URL.startswith("sqlite"):
+        Base.metadata.create_all(engine)
+    db = SessionLocal()
+    try:
+        plan = TestPlan(name="serialization benchmark")
+        case = TestCase(title="benchmark case", steps="步驟\n" * 20, expected_result="通過")
+        db.add_all([plan, case])
+        db.flush()
+        rows = [TestExecution(test_plan_id=plan.id, test_case_id=case.id, executed_by="bench") for _ in range(executions)]
+        db.add_all(rows)
+        db.flush()
+        db.add_all([
+            TestResult(test_execution_id=e.id, step_number=n, step_description=f"步驟 {n} 的描述", status="passed")
+            for e in rows for n in range(1, steps + 1)
+        ])
+        db.commit()
+        return plan.id
+    finally:
+        db.close()
+
+
+def _time(fn, repeat: int) -> dict:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        payload = fn()
+    elapsed = (time.perf_counter() - started) / repeat
+    return {"ms": round(elapsed * 1000, 3), "bytes": len(payload)}
+
+
+async def micro(test_plan_id: int, page_size: int, repeat: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.scalars(
+            select(TestExecution)
+            .options(selectinload(TestExecution.test_results))
+            .where(TestExecution.test_plan_id == test_plan_id)
+            .order_by(TestExecution.id)
+            .limit(page_size)
+        )).all()
+
+    def legacy():
+        items = [TestExecutionResponse.model_validate(e, from_attributes=True) for e in rows]
+        return json.dumps(jsonable_encoder(items), ensure_ascii=False).encode("utf-8")
+
+    def fast():
+        return orjson.dumps(dump_models(TestExecutionResponse, rows))
+
+    def trusted():
+        serialization.SERIALIZATION_TRUSTED_READS = True
+        try:
+            return orjson.dumps(dump_models(TestExecutionResponse, rows))
+        finally:
+            serialization.SERIALIZATION_TRUSTED_READS = False
+
+    def msgpack():
+        return serialization.msgpack.packb(
+            dump_models(TestExecutionResponse, rows), default=serialization._msgpack_default, use_bin_type=True
+        )
+
+    results = {"rows": len(rows), "legacy": _time(legacy, repeat), "orjson": _time(fast, repeat), "trusted": _time(trusted, repeat)}
+    if serialization.msgpack is not None:
+        results["msgpack"] = _time(msgpack, repeat)
+    return results
+
+
+def build_app() -> FastAPI:
+    app = FastAPI(default_response_class=NegotiatedResponse)
+    app.add_middleware(ResponseEncodingMiddleware)
+    app.include_router(test_executions.router, prefix="/api/test-executions")
+    app.include_router(test_cases.router, prefix="/api/test-cases")
+    return app
+
+
+async def _drive(app: FastAPI, path: str, headers: dict, concurrency: int, total: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    sizes = []
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+                sizes.append(int(response.headers.get("content-length", len(response.content))))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "path": path,
+        "headers": headers,
+        "requests": total,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "response_bytes": sizes[0],
+    }
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--executions", type=int, default=2000)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--output", help="結果JSON文件路徑")
+    args = parser.parse_args(argv)
+
+    test_plan_id = seed(args.executions, args.steps)
+    app = build_app()
+    executions_path = f"/api/test-executions/?test_plan_id={test_plan_id}&limit={args.page_size}"
+    cases_path = f"/api/test-cases/?limit={args.page_size}"
+    variants = [
+        {"accept-encoding": "identity"},
+        {"accept-encoding": "gzip"},
+        {"accept-encoding": "br"},
+        {"accept": "application/msgpack", "accept-encoding": "identity"},
+    ]
+    results = {
+        "benchmark": "serialization",
+        "database": DATABASE_URL.split("://", 1)[0],
+        "executions": args.executions,
+        "steps": args.steps,
+        "page_size": args.page_size,
+        "micro": await micro(test_plan_id, args.page_size, args.repeat),
+        "http": [
+            await _drive(app, path, headers, args.concurrency, args.requests)
+            for path in (executions_path, cases_path)
+            for headers in variants
+        ],
+    }
+
+    # 關閉連接池(SQLite下連接的工作線程會阻止進程退出)
+    await async_engine.dispose()
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    print(payload)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,197 @@
+"""API工作進程的啟動時間和內存基準測試
+
+每輪在全新的子進程中導入 app.main(相當於一個 uvicorn worker)，測量：
+- cold_start_s: 從啟動子進程到應用完成啟動事件並響應第一個請求
+- import_s: 導入 app.main 的耗時
+- rss_mb: 完成啟動後的常駐內存
+- first_use: 延遲加載的重量級依賴(jira、ReportLab)在第一次使用時的導入耗時和內存增量
+
+在基準提交和當前提交上分別運行並用 benchmarks.compare 對比，即可得到改動前後的啟動時間和每個工作進程的內存。
+
+用法:
+    python -m benchmarks.startup_benchmark --runs 10 --output results/startup.json
+
+默認使用臨時SQLite數據庫(啟動時按模型建表)，可通過 DATABASE_URL 指定其他數據庫。
+結果以JSON格式輸出到標準輸出，可通過 --output 寫入文件。
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# 只在特定功能中使用的重量級依賴：模塊名 -> 第一次使用時導入的模塊
+HEAVY_MODULES = {
+    "jira": ("jira",),
+    "reportlab": ("reportlab.lib.colors", "reportlab.platypus", "reportlab.lib.styles"),
+}
+
+
+def _rss_mb() -> float:
+    """當前進程的常駐內存(MB)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        import resource
+        # 非Linux平台只能取得峰值
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / 1024 / 1024 if sys.platform == "darwin" else maxrss / 1024
+
+
+async def _first_request(app) -> int:
+    """不經過HTTP客戶端直接以ASGI調用 /ping，避免客戶端庫的導入計入內存"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/ping", "raw_path": b"/ping", "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+    }
+    status = 0
+    requested = False
+    finished = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # 響應發送完畢前連接保持打開
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body", False):
+            finished.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+async def worker() -> None:
+    """子進程：導入並啟動應用，以JSON行報告各項數值"""
+    started = time.perf_counter()
+    from app.main import app
+    import_s = time.perf_counter() - started
+    rss_import = _rss_mb()
+
+    await app.router.startup()
+    status = await _first_request(app)
+    print(json.dumps({"ready": True, "status": status}), flush=True)
+    result = {
+        "import_s": round(import_s, 4),
+        "startup_s": round(time.perf_counter() - started, 4),
+        "rss_after_import_mb": round(rss_import, 2),
+        "rss_mb": round(_rss_mb(), 2),
+        "modules": len(sys.modules),
+        "heavy_loaded_at_startup": sorted(name for name in HEAVY_MODULES if name in sys.modules),
+    }
+    await app.router.shutdown()
+
+    first_use = {}
+    for name, modules in HEAVY_MODULES.items():
+        if name in sys.modules:
+            continue
+        rss_before = _rss_mb()
+        started = time.perf_counter()
+        for module in modules:
+            __import__(module)
+        first_use[name] = {"import_s": round(time.perf_counter() - started, 4), "rss_mb": round(_rss_mb() - rss_before, 2)}
+    result["first_use"] = first_use
+    print(json.dumps(result, ensure_ascii=False), flush=True)
+
+
+def run_once(env: dict) -> dict:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.startup_benchmark", "--worker"],
+        stdout=subprocess.PIPE, env=env, text=True,
+    )
+    result = {}
+    for line in process.stdout:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            # 應用自身的日誌輸出原樣轉發到標準錯誤
+            sys.stderr.write(line)
+            continue
+        if message.pop("ready", False):
+            result["cold_start_s"] = round(time.perf_counter() - started, 4)
+            if message["status"] != 200:
+                raise RuntimeError(f"/ping 返回 {message['status']}")
+        else:
+            result.update(message)
+            break
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        # 結果已經取得；較早的提交在關閉時可能因後台任務無法退出
+        process.kill()
+        process.wait()
+    if "import_s" not in result:
+        raise RuntimeError(f"子進程退出碼 {process.returncode}")
+    return result
+
+
+def _git() -> dict:
+    def run(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": run("rev-parse", "HEAD") or None, "dirty": bool(run("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def _median(values: list) -> float:
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="啟動子進程的次數，結果取中位數")
+    parser.add_argument("--output", help="結果JSON文件路徑")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        asyncio.run(worker())
+        return 0
+
+    env = dict(os.environ)
+    if "DATABASE_URL" not in env:
+        env["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/startup_benchmark.db"
+        env.pop("ASYNC_DATABASE_URL", None)
+    # 第一輪預熱文件系統緩存和字節碼，不計入結果
+    run_once(env)
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    results = {
+        "benchmark": "startup",
+        "meta": {"git": _git(), "python": sys.version.split()[0], "database": env["DATABASE_URL"].split("://", 1)[0]},
+        "runs": len(runs),
+    }
+    for key in ("cold_start_s", "import_s", "startup_s", "rss_after_import_mb", "rss_mb", "modules"):
+        results[key] = _median([run[key] for run in runs])
+    results["heavy_loaded_at_startup"] = runs[-1]["heavy_loaded_at_startup"]
+    results["first_use"] = {
+        name: {key: _median([run["first_use"][name][key] for run in runs]) for key in ("import_s", "rss_mb")}
+        for name in runs[-1]["first_use"]
+    }
+
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
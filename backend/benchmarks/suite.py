@@ -0,0 +1,291 @@
+"""熱點路徑基準測試套件
+
+在 benchmarks.datagen 生成的數據上運行，結果附帶提交號和數據規模，供 benchmarks.compare 對比兩次提交：
+- micro: 計劃狀態統計、報告數據加載、PDF / HTML 報告渲染、執行列表序列化
+- http: 對熱點路由施加並發負載(執行列表翻頁、計劃摘要、計劃詳情、批量上傳測試結果、PDF報告即時生成)
+
+默認在進程內通過ASGI調用路由；指定 --base-url 時對運行中的服務施壓(此時報告緩存文件位於服務端，PDF下載可能命中緩存)。
+批量上傳會寫入新的執行記錄，重複運行前應重新生成數據以保證可比。
+
+用法:
+    DATABASE_URL=postgresql://user:@localhost/testmanagement \\
+        python -m benchmarks.suite --concurrency 20 --requests 500 --output results/HEAD.json
+
+結果以JSON格式輸出到標準輸出，可通過 --output 寫入文件。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import func, select, text
+
+from app.api.routes import api_integration, reports, test_executions, test_plans
+from app.api.serialization import NegotiatedResponse, ResponseEncodingMiddleware
+from app.db.database import AsyncSessionLocal, async_engine
+from app.models.models import TestExecution
+from app.services.report_service import load_report_data, plan_status_counts, render_html_report, render_pdf_report
+from app.services.result_store import RESULT_STORAGE
+from benchmarks.serialization_benchmark import micro as serialization_micro
+
+TABLES = ("test_plans", "test_cases", "test_executions", "test_results")
+
+
+def _stats(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min_ms": round(samples[0] * 1000, 3),
+        "median_ms": round(samples[len(samples) // 2] * 1000, 3),
+        "p95_ms": round(samples[max(int(len(samples) * 0.95) - 1, 0)] * 1000, 3),
+    }
+
+
+async def _repeat(fn, repeat: int) -> dict:
+    """預熱一次後重複執行 repeat 次；fn 可以是普通函數或協程函數"""
+    samples = []
+    for n in range(repeat + 1):
+        started = time.perf_counter()
+        result = fn()
+        if asyncio.iscoroutine(result):
+            await result
+        if n:
+            samples.append(time.perf_counter() - started)
+    return _stats(samples)
+
+
+def _git() -> dict:
+    def run(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True).stdout.strip()
+    try:
+        return {
+            "commit": run("rev-parse", "HEAD") or None,
+            "dirty": bool(run("status", "--porcelain", "--untracked-files=no")),
+        }
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+async def _table_rows(db) -> dict:
+    """各表行數；PostgreSQL使用統計信息中的估計值(包括分區)，避免在千萬行的表上全表計數"""
+    if db.bind.dialect.name != "postgresql":
+        return {table: await db.scalar(text(f"SELECT count(*) FROM {table}")) for table in TABLES}
+    rows = {}
+    for table in TABLES:
+        rows[table] = int(await db.scalar(text(
+            "SELECT coalesce(sum(greatest(c.reltuples, 0)), 0) FROM pg_class c "
+            "WHERE c.oid = CAST(:t AS regclass) OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = CAST(:t AS regclass))"
+        ).bindparams(t=table)))
+    return rows
+
+
+async def metadata(test_plan_id: int) -> dict:
+    async with AsyncSessionLocal() as db:
+        if db.bind.dialect.name == "postgresql":
+            server_version = await db.scalar(text("SHOW server_version"))
+        else:
+            server_version = await db.scalar(text("SELECT sqlite_version()"))
+        plan_executions = await db.scalar(
+            select(func.count()).select_from(TestExecution).where(TestExecution.test_plan_id == test_plan_id)
+        )
+        table_rows = await _table_rows(db)
+    return {
+        "git": _git(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": async_engine.dialect.name,
+        "server_version": server_version,
+        "result_storage": RESULT_STORAGE,
+        "rows": table_rows,
+        "test_plan_id": test_plan_id,
+        "plan_executions": plan_executions,
+    }
+
+
+def _remove_report_files(test_plan_id: int):
+    for suffix in ("pdf", "html"):
+        path = os.path.join(os.getcwd(), "reports", f"test_plan_{test_plan_id}_report.{suffix}")
+        if os.path.exists(path):
+            os.remove(path)
+
+
+async def micro(test_plan_id: int, repeat: int, page_size: int) -> dict:
+    async def status_counts():
+        async with AsyncSessionLocal() as db:
+            await plan_status_counts(db, test_plan_id)
+
+    async def report_data():
+        async with AsyncSessionLocal() as db:
+            return await load_report_data(test_plan_id, db)
+
+    results = {
+        "plan_status_counts": await _repeat(status_counts, repeat),
+        "load_report_data": await _repeat(report_data, repeat),
+    }
+    # 渲染器是純CPU路徑，在同一份已加載的數據上測量
+    data = await report_data()
+    try:
+        results["render_html_report"] = await _repeat(lambda: render_html_report(data), repeat)
+        results["render_pdf_report"] = await _repeat(lambda: render_pdf_report(data), repeat)
+    finally:
+        _remove_report_files(test_plan_id)
+    results["serialization"] = await serialization_micro(test_plan_id, page_size, repeat)
+    return results
+
+
+def build_app() -> FastAPI:
+    app = FastAPI(default_response_class=NegotiatedResponse)
+    app.add_middleware(ResponseEncodingMiddleware)
+    for module, prefix in ((test_plans, "test-plans"), (test_executions, "test-executions"),
+                           (reports, "reports"), (api_integration, "integration")):
+        app.include_router(module.router, prefix=f"/api/{prefix}")
+    return app
+
+
+async def _drive(client: httpx.AsyncClient, name: str, make_request, concurrency: int, total: int, items: int = 1) -> dict:
+    """以 concurrency 並發發送 total 個請求；make_request(n) 返回 (方法, 路徑, 參數)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(n):
+        nonlocal errors
+        async with semaphore:
+            method, path, kwargs = make_request(n)
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(total / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000, 2),
+        "p99_ms": round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 2),
+    }
+    if items > 1:
+        result["items_per_s"] = round(total * items / elapsed, 1)
+    return {name: result}
+
+
+async def http(test_plan_id: int, plan_executions: int, args) -> dict:
+    rng = random.Random(args.seed)
+    async with AsyncSessionLocal() as db:
+        case_ids = (await db.scalars(
+            select(TestExecution.test_case_id).where(TestExecution.test_plan_id == test_plan_id)
+            .distinct().limit(args.batch_size)
+        )).all()
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=None)
+    else:
+        client = httpx.AsyncClient(app=build_app(), base_url="http://bench", timeout=None)
+
+    results = {}
+    async with client:
+        last_page = max(plan_executions - args.page_size, 0)
+        results.update(await _drive(client, "list_executions", lambda n: (
+            "GET", "/api/test-executions/",
+            {"params": {"test_plan_id": test_plan_id, "limit": args.page_size, "skip": rng.randint(0, last_page)}},
+        ), args.concurrency, args.requests))
+        results.update(await _drive(client, "plan_summary", lambda n: (
+            "GET", f"/api/reports/summary/{test_plan_id}", {},
+        ), args.concurrency, args.requests))
+        results.update(await _drive(client, "get_plan", lambda n: (
+            "GET", f"/api/test-plans/{test_plan_id}", {},
+        ), args.concurrency, args.requests))
+
+        key = (await client.post("/api/integration/api-keys", params={"name": "benchmark suite"})).json()["key"]
+        batch = {
+            "test_plan_id": test_plan_id,
+            "results": [
+                {
+                    "test_case_id": case_ids[n % len(case_ids)],
+                    "status": "passed" if n % 5 else "failed",
+                    "duration": n % 60,
+                    "executed_by": "benchmark",
+                    "steps": [
+                        {"step_number": s, "step_description": f"基準步驟 {s}", "status": "passed"}
+                        for s in range(1, args.steps + 1)
+                    ],
+                }
+                for n in range(args.batch_size)
+            ],
+        }
+        results.update(await _drive(client, "upload_results", lambda n: (
+            "POST", "/api/integration/test-results/batch", {"json": batch, "headers": {"X-API-Key": key}},
+        ), args.concurrency, args.upload_requests, items=args.batch_size))
+
+        # 報告下載會緩存生成的文件：逐個請求並在每次之前刪除緩存，測量即時生成的耗時
+        def cold_report(n):
+            _remove_report_files(test_plan_id)
+            return "GET", f"/api/reports/download/{test_plan_id}", {"params": {"format": "pdf"}}
+
+        try:
+            results.update(await _drive(client, "download_pdf_report", cold_report, 1, args.report_requests))
+        finally:
+            _remove_report_files(test_plan_id)
+    return results
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plan-id", type=int, help="測試的計劃ID，默認為最後一個有執行記錄的計劃")
+    parser.add_argument("--only", choices=("micro", "http"), help="只運行其中一部分")
+    parser.add_argument("--repeat", type=int, default=5, help="微基準的重複次數")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="每個讀取路由的請求數")
+    parser.add_argument("--upload-requests", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=50, help="每次批量上傳的測試結果數")
+    parser.add_argument("--steps", type=int, default=5, help="上傳的每個測試結果的步驟數")
+    parser.add_argument("--report-requests", type=int, default=3)
+    parser.add_argument("--base-url", help="對運行中的服務施壓，例如 http://localhost:8000")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="結果JSON文件路徑")
+    args = parser.parse_args(argv)
+
+    test_plan_id = args.plan_id
+    if test_plan_id is None:
+        async with AsyncSessionLocal() as db:
+            test_plan_id = await db.scalar(select(func.max(TestExecution.test_plan_id)))
+        if test_plan_id is None:
+            parser.error("數據庫中沒有執行記錄，請先運行 python -m benchmarks.datagen")
+
+    results = {"benchmark": "suite", "meta": await metadata(test_plan_id)}
+    if args.only in (None, "micro"):
+        results["micro"] = await micro(test_plan_id, args.repeat, args.page_size)
+    if args.only in (None, "http"):
+        results["http"] = await http(test_plan_id, results["meta"]["plan_executions"], args)
+
+    # 關閉連接池(SQLite下連接的工作線程會阻止進程退出)
+    await async_engine.dispose()
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload)
+    print(payload)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
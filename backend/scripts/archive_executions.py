@@ -0,0 +1,39 @@
+"""將舊的測試執行記錄歸檔到冷存儲(Parquet)
+
+用法:
+    python -m scripts.archive_executions --older-than-days 180
+    python -m scripts.archive_executions --inactive-plans --uri s3://bucket/testmanagement-archive
+
+可通過 cron 等定時任務週期執行。
+"""
+import argparse
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from app.db.database import AsyncSessionLocal, async_engine
+from app.services import archive_service
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="歸檔舊的測試執行記錄")
+    parser.add_argument("--older-than-days", type=int, default=archive_service.ARCHIVE_AFTER_DAYS,
+                        help="歸檔創建時間早於該天數的執行記錄(0表示不按時間歸檔)")
+    parser.add_argument("--inactive-plans", action="store_true", help="同時歸檔非活動測試計劃的全部執行記錄")
+    parser.add_argument("--uri", help="歸檔存儲位置，默認使用 ARCHIVE_URI 環境變量")
+    args = parser.parse_args(argv)
+
+    if args.uri:
+        archive_service.ARCHIVE_URI = args.uri
+    older_than = None
+    if args.older_than_days > 0:
+        older_than = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+
+    async with AsyncSessionLocal() as db:
+        result = await archive_service.archive_executions(db, older_than, args.inactive_plans)
+    await async_engine.dispose()
+    print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
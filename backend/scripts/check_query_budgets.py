@@ -0,0 +1,142 @@
+"""檢查熱點路由和服務的SQL語句數不隨數據規模增長(N+1檢測)
+
+在臨時數據庫中逐步增加執行記錄、步驟結果和測試案例，每個規模下調用各路由並統計語句數，
+語句數隨規模變化或超過路由聲明的預算(query_budget)時以非零狀態退出。
+
+用法:
+    python -m scripts.check_query_budgets
+    # 指定規模；默認使用臨時SQLite文件，也可指向一個空的PostgreSQL測試庫
+    DATABASE_URL=postgresql://user:@localhost/tm_check python -m scripts.check_query_budgets --sizes 1,20,120
+
+不要在有業務數據的數據庫上運行：會寫入測試數據。
+"""
+import os
+import sys
+import tempfile
+
+# 必須在導入應用之前設置：預算超出時拋出異常，路由返回500
+os.environ.setdefault("QUERY_BUDGET_MODE", "raise")
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/check_query_budgets.db"
+
+import argparse
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+
+from app.api.routes import changes, reports, test_cases, test_executions, test_plans
+from app.api.serialization import NegotiatedResponse
+from app.core.query_budget import QueryBudgetExceeded, QueryBudgetMiddleware, assert_constant_queries
+from app.db.database import DB_CREATE_ALL, AsyncSessionLocal, async_engine, create_schema
+from app.models.models import TestCase, TestExecution, TestPlan, TestResult
+from app.services.report_service import load_report_data
+
+
+def build_app() -> FastAPI:
+    app = FastAPI(default_response_class=NegotiatedResponse)
+    app.add_middleware(QueryBudgetMiddleware)
+    for module, prefix in ((test_plans, "test-plans"), (test_cases, "test-cases"),
+                           (test_executions, "test-executions"), (reports, "reports"), (changes, "changes")):
+        app.include_router(module.router, prefix=f"/api/{prefix}")
+    return app
+
+
+class Dataset:
+    """一個測試計劃，按需增長到 n 個執行記錄(每個3個步驟結果，各自對應一個測試案例)"""
+
+    def __init__(self):
+        self.plan_id = None
+        self.execution_id = None
+        self.size = 0
+
+    async def grow(self, size: int):
+        async with AsyncSessionLocal() as db:
+            if self.plan_id is None:
+                plan = TestPlan(name="query budget check")
+                db.add(plan)
+                await db.flush()
+                self.plan_id = plan.id
+            cases = [TestCase(title=f"案例 {n}", steps="1. 打開頁面", expected_result="成功") for n in range(self.size, size)]
+            db.add_all(cases)
+            await db.flush()
+            executions = [
+                TestExecution(
+                    test_plan_id=self.plan_id, test_case_id=case.id, status="passed", executed_by="check",
+                    test_results=[
+                        TestResult(step_number=s, step_description=f"步驟 {s}", status="passed") for s in range(1, 4)
+                    ],
+                )
+                for case in cases
+            ]
+            db.add_all(executions)
+            await db.commit()
+            if self.execution_id is None and executions:
+                self.execution_id = executions[0].id
+            self.size = size
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,10,60", help="以逗號分隔的數據規模(每個測試計劃的執行記錄數)")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    if DB_CREATE_ALL:
+        await create_schema()
+    client = httpx.AsyncClient(app=build_app(), base_url="http://check")
+
+    async def get(path, **params):
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+
+    async def report_data():
+        async with AsyncSessionLocal() as db:
+            await load_report_data(dataset.plan_id, db)
+
+    async def download_report():
+        path = os.path.join(os.getcwd(), "reports", f"test_plan_{dataset.plan_id}_report.html")
+        if os.path.exists(path):
+            os.remove(path)
+        try:
+            await get(f"/api/reports/download/{dataset.plan_id}", format="html")
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    checks = {
+        "GET /api/test-executions/": lambda: get("/api/test-executions/", test_plan_id=dataset.plan_id, limit=100),
+        "GET /api/test-executions/?expand": lambda: get(
+            "/api/test-executions/", test_plan_id=dataset.plan_id, limit=100, expand="test_results,test_case,test_plan"
+        ),
+        "GET /api/test-executions/{id}": lambda: get(f"/api/test-executions/{dataset.execution_id}"),
+        "GET /api/test-plans/": lambda: get("/api/test-plans/", limit=100),
+        "GET /api/test-plans/{id}": lambda: get(f"/api/test-plans/{dataset.plan_id}"),
+        "GET /api/test-cases/": lambda: get("/api/test-cases/", limit=100),
+        "GET /api/reports/summary/{id}": lambda: get(f"/api/reports/summary/{dataset.plan_id}"),
+        "GET /api/reports/download/{id}": download_report,
+        "GET /api/changes/": lambda: get("/api/changes/", limit=100),
+        "load_report_data": report_data,
+    }
+
+    results = []
+    failed = False
+    async with client:
+        for name, call in checks.items():
+            # 每項檢查使用新的數據集，規模從小到大增長
+            dataset = Dataset()
+            try:
+                queries = await assert_constant_queries(call, dataset.grow, sizes)
+                results.append({"check": name, "queries": queries, "status": "ok"})
+            except (AssertionError, QueryBudgetExceeded, httpx.HTTPStatusError) as e:
+                failed = True
+                results.append({"check": name, "status": "failed", "error": str(e)})
+
+    await async_engine.dispose()
+    print(json.dumps({"sizes": sizes, "results": results}, ensure_ascii=False, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
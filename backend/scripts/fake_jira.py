@@ -0,0 +1,272 @@
+"""本地模擬Jira服務器(REST API v2 子集)，用於測試和基準測試Jira集成
+
+用法:
+    python -m scripts.fake_jira --port 8089 --projects PROJ,QA --issues 500 --latency-ms 50 --rate-limit 20
+    JIRA_URL=http://localhost:8089 JIRA_USERNAME=test JIRA_API_TOKEN=test uvicorn app.main:app
+
+問題鍵 <項目>-<1..issues> 均視為存在，搜索接口支持 key in (...) 形式的JQL。支持HTTP/1.1持久連接；
+指定 --rate-limit 時每秒超出該數量的API請求返回 429 和 Retry-After 頭，模擬Jira Cloud的限流。
+GET /_fake/stats 返回各接口的請求數和已接受的TCP連接數，GET /_fake/issues/<鍵> 返回問題的狀態和評論，
+POST /_fake/reset 清空統計和問題狀態。
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+TRANSITIONS = [
+    {"id": "11", "name": "To Do", "to": {"name": "To Do"}},
+    {"id": "21", "name": "In Progress", "to": {"name": "In Progress"}},
+    {"id": "31", "name": "Done", "to": {"name": "Done"}},
+    {"id": "41", "name": "Reopen", "to": {"name": "Reopened"}},
+]
+
+ISSUE_PATH = re.compile(r"^/rest/api/2/issue/(?P<key>[A-Z][A-Z0-9]*-\d+)(?P<rest>/comment|/transitions)?$")
+FIELDS = [("summary", "Summary"), ("status", "Status"), ("project", "Project"), ("issuetype", "Issue Type")]
+
+# 支持 key in (A-1, B-2) 和 key = A-1 兩種JQL
+JQL_KEYS = re.compile(r"^\s*(?:issue)?key\s*(?:in\s*\((?P<keys>[^)]*)\)|=\s*(?P<key>[^\s)]+))\s*$", re.IGNORECASE)
+# 與Jira Cloud一致，單頁最多返回100個問題
+SEARCH_MAX_RESULTS = 100
+FAKE_ISSUE_PATH = re.compile(r"^/_fake/issues/(?P<key>[A-Z][A-Z0-9]*-\d+)$")
+
+
+class FakeJiraState:
+    """模擬服務器的狀態：問題狀態、評論和請求統計"""
+
+    def __init__(self, projects, issues: int, latency_ms: float = 0, rate_limit: int = 0):
+        self.projects = set(projects)
+        self.issues = issues
+        self.latency = latency_ms / 1000
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.statuses: Dict[str, str] = {}
+            self.comments: Dict[str, list] = {}
+            self.requests: Counter = Counter()
+            self.connections = 0
+            self.rate_limited = 0
+            self._window = (0, 0)  # (秒, 該秒內的請求數)
+
+    def throttle(self) -> Optional[float]:
+        """超出每秒請求數上限時返回建議的重試等待秒數"""
+        if not self.rate_limit:
+            return None
+        with self.lock:
+            now = time.time()
+            second, count = self._window
+            if int(now) != second:
+                second, count = int(now), 0
+            if count >= self.rate_limit:
+                self.rate_limited += 1
+                return second + 1 - now
+            self._window = (second, count + 1)
+            return None
+
+    def add_comment(self, key: str, body: str) -> str:
+        with self.lock:
+            comments = self.comments.setdefault(key, [])
+            comments.append(body)
+            return str(len(comments))
+
+    def exists(self, key: str) -> bool:
+        project, _, number = key.partition("-")
+        return project in self.projects and 1 <= int(number) <= self.issues
+
+    def issue(self, key: str, base_url: str) -> Dict[str, Any]:
+        project, _, number = key.partition("-")
+        return {
+            "id": str(10000 + int(number)),
+            "key": key,
+            "self": f"{base_url}/rest/api/2/issue/{key}",
+            "fields": {
+                "summary": f"模擬問題 {key}",
+                "status": {"name": self.statuses.get(key, "To Do")},
+                "project": {"key": project, "name": project},
+                "issuetype": {"name": "Bug" if int(number) % 2 else "Story"},
+            },
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "total_requests": sum(self.requests.values()),
+                "connections": self.connections,
+                "rate_limited": self.rate_limited,
+                "comments": sum(len(c) for c in self.comments.values()),
+            }
+
+
+class FakeJiraHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeJiraState = None
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _base_url(self) -> str:
+        return f"http://{self.headers.get('Host', 'localhost')}"
+
+    def _body(self) -> Optional[dict]:
+        return json.loads(self._raw_body) if self._raw_body else None
+
+    def _send(self, status: int, payload: Any = None, headers: Optional[Dict[str, str]] = None) -> None:
+        body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json;charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _route(self, method: str) -> Tuple[int, Any, Optional[Dict[str, str]]]:
+        path = urlsplit(self.path).path
+        state = self.state
+        with state.lock:
+            state.requests[f"{method} {ISSUE_PATH.sub(lambda m: '/rest/api/2/issue/{key}' + (m['rest'] or ''), path)}"] += 1
+
+        if path == "/_fake/stats":
+            return 200, state.stats(), None
+        if path == "/_fake/reset" and method == "POST":
+            state.reset()
+            return 204, None, None
+        fake_issue = FAKE_ISSUE_PATH.match(path)
+        if fake_issue:
+            key = fake_issue["key"]
+            with state.lock:
+                return 200, {"status": state.statuses.get(key, "To Do"), "comments": list(state.comments.get(key, []))}, None
+
+        retry_after = state.throttle()
+        if retry_after is not None:
+            # 與Jira一致：Retry-After 為整數秒
+            return 429, {"errorMessages": ["Rate limit exceeded."], "errors": {}}, {"Retry-After": str(max(1, round(retry_after)))}
+
+        if state.latency:
+            time.sleep(state.latency)
+
+        if path == "/rest/api/2/serverInfo":
+            return 200, {
+                "baseUrl": self._base_url(), "version": "9.4.0", "versionNumbers": [9, 4, 0],
+                "deploymentType": "Server", "serverTitle": "Fake Jira",
+            }, None
+
+        if path == "/rest/api/2/field" and method == "GET":
+            # 客戶端首次搜索時讀取字段列表，用於將JQL字段名轉換為字段ID
+            return 200, [
+                {"id": field_id, "key": field_id, "name": name, "custom": False, "clauseNames": [field_id]}
+                for field_id, name in FIELDS
+            ], None
+        if path == "/rest/api/2/search" and method == "GET":
+            return self._search(parse_qs(urlsplit(self.path).query))
+
+        match = ISSUE_PATH.match(path)
+        if not match:
+            return 404, {"errorMessages": [f"未實現的接口: {method} {path}"], "errors": {}}, None
+        key, rest = match["key"], match["rest"]
+        if not state.exists(key):
+            return 404, {"errorMessages": ["Issue Does Not Exist"], "errors": {}}, None
+
+        if rest is None and method == "GET":
+            return 200, state.issue(key, self._base_url()), None
+        if rest == "/comment" and method == "POST":
+            body = (self._body() or {}).get("body", "")
+            comment_id = state.add_comment(key, body)
+            return 201, {"id": comment_id, "body": body, "self": f"{self._base_url()}/rest/api/2/issue/{key}/comment/{comment_id}"}, None
+        if rest == "/transitions" and method == "GET":
+            return 200, {"expand": "transitions", "transitions": TRANSITIONS}, None
+        if rest == "/transitions" and method == "POST":
+            body = self._body() or {}
+            transition_id = str((body.get("transition") or {}).get("id"))
+            target = next((t["to"]["name"] for t in TRANSITIONS if t["id"] == transition_id), None)
+            if target is None:
+                return 400, {"errorMessages": [f"無效的轉換: {transition_id}"], "errors": {}}, None
+            with state.lock:
+                state.statuses[key] = target
+            # 轉換時通過 update.comment 附帶的評論
+            for operation in (body.get("update") or {}).get("comment", []):
+                if "add" in operation:
+                    state.add_comment(key, operation["add"].get("body", ""))
+            return 204, None, None
+        return 405, {"errorMessages": [f"不支持的方法: {method}"], "errors": {}}, None
+
+    def _search(self, params: Dict[str, list]) -> Tuple[int, Any, None]:
+        jql = params.get("jql", [""])[0]
+        match = JQL_KEYS.match(jql)
+        if not match:
+            return 400, {"errorMessages": [f"不支持的JQL: {jql}"], "errors": {}}, None
+        keys = [k.strip().strip("'\"").upper() for k in (match["keys"] or match["key"]).split(",") if k.strip()]
+        existing = [k for k in dict.fromkeys(keys) if self.state.exists(k)]
+        # validateQuery 為真時，與Jira一樣拒絕包含不存在問題鍵的查詢
+        if params.get("validateQuery", ["true"])[0].lower() in ("true", "strict") and len(existing) < len(set(keys)):
+            missing = next(k for k in keys if k not in existing)
+            return 400, {"errorMessages": [f"An issue with key '{missing}' does not exist for field 'key'."], "errors": {}}, None
+        start = int(params.get("startAt", ["0"])[0])
+        limit = min(int(params.get("maxResults", ["50"])[0]), SEARCH_MAX_RESULTS)
+        page = existing[start:start + limit]
+        return 200, {
+            "startAt": start, "maxResults": limit, "total": len(existing),
+            "issues": [self.state.issue(key, self._base_url()) for key in page],
+        }, None
+
+    def _handle(self, method: str) -> None:
+        # 先讀完請求體：提前返回錯誤時未讀取的請求體會破壞持久連接上的下一個請求
+        length = int(self.headers.get("Content-Length") or 0)
+        self._raw_body = self.rfile.read(length) if length else b""
+        status, payload, headers = self._route(method)
+        self._send(status, payload, headers)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+
+def start_server(port: int = 0, projects=("PROJ",), issues: int = 1000, latency_ms: float = 0, rate_limit: int = 0):
+    """在後台線程中啟動模擬服務器，返回 (服務器, 狀態, 基礎URL)；port=0 時自動選擇端口"""
+    state = FakeJiraState(projects, issues, latency_ms, rate_limit)
+    handler = type("BoundFakeJiraHandler", (FakeJiraHandler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模擬Jira服務器")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--projects", default="PROJ", help="項目鍵列表(逗號分隔)")
+    parser.add_argument("--issues", type=int, default=1000, help="每個項目的問題數")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每個API請求的模擬延遲(毫秒)")
+    parser.add_argument("--rate-limit", type=int, default=0, help="每秒允許的API請求數，超出返回429(0表示不限流)")
+    args = parser.parse_args(argv)
+
+    server, _, url = start_server(args.port, args.projects.split(","), args.issues, args.latency_ms, args.rate_limit)
+    print(f"模擬Jira服務器已啟動: {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
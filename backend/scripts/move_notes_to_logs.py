@@ -0,0 +1,65 @@
+"""將貼在 test_executions.notes 中的長控制台日誌移入壓縮的執行日誌
+
+用法:
+    # 移動超過4096個字符的備註
+    python -m scripts.move_notes_to_logs
+    python -m scripts.move_notes_to_logs --min-size 65536 --test-plan-id 42
+
+備註內容追加到執行日誌末尾，原字段替換為一行指向日誌接口的說明。轉換按批提交，可隨時中斷後重新執行。
+"""
+import argparse
+import asyncio
+import json
+
+from sqlalchemy import func, select
+
+from app.db.database import AsyncSessionLocal, async_engine
+from app.models.models import TestExecution
+from app.services.execution_log import append_log
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="將長備註移入執行日誌")
+    parser.add_argument("--min-size", type=int, default=4096, help="只移動超過該字符數的備註")
+    parser.add_argument("--test-plan-id", type=int, help="只處理指定測試計劃的執行記錄")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    moved = 0
+    moved_bytes = 0
+    last_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            query = (
+                select(TestExecution.id)
+                .where(func.length(TestExecution.notes) > args.min_size, TestExecution.id > last_id)
+                .order_by(TestExecution.id)
+                .limit(args.batch_size)
+            )
+            if args.test_plan_id:
+                query = query.where(TestExecution.test_plan_id == args.test_plan_id)
+            ids = (await db.scalars(query)).all()
+            if not ids:
+                break
+            for execution_id in ids:
+                execution = await db.get(TestExecution, execution_id)
+                data = execution.notes.encode("utf-8")
+                if not data.endswith(b"\n"):
+                    data += b"\n"
+                # 先寫入日誌再替換備註；中途失敗重新執行時最多重複追加一次
+                await append_log(db, execution_id, data)
+                execution = await db.get(TestExecution, execution_id)
+                execution.notes = f"[日誌已移至 /api/test-executions/{execution_id}/log，{len(data)} 字節]"
+                await db.commit()
+                moved += 1
+                moved_bytes += len(data)
+            db.expunge_all()
+            last_id = ids[-1]
+            print(f"已移動 {moved} 個執行記錄的備註")
+    await async_engine.dispose()
+
+    print(json.dumps({"moved_executions": moved, "moved_bytes": moved_bytes}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""在逐行存儲與緊湊存儲之間轉換已有的步驟結果
+
+用法:
+    # 將所有執行記錄的 test_results 行打包到 test_executions.packed_results
+    python -m scripts.pack_test_results
+    # 只轉換某個測試計劃
+    python -m scripts.pack_test_results --test-plan-id 42
+    # 回退：將打包的步驟結果展開為 test_results 行
+    python -m scripts.pack_test_results --unpack
+
+轉換按批提交，可隨時中斷後重新執行。
+"""
+import argparse
+import asyncio
+import json
+
+from sqlalchemy import exists, select
+from sqlalchemy.orm import selectinload
+
+from app.db.database import AsyncSessionLocal, async_engine
+from app.models.models import TestExecution, TestResult
+from app.services.result_store import convert_execution
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description="轉換步驟結果的存儲佈局")
+    parser.add_argument("--unpack", action="store_true", help="將緊湊存儲展開為逐行存儲")
+    parser.add_argument("--test-plan-id", type=int, help="只轉換指定測試計劃的執行記錄")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    if args.unpack:
+        pending = TestExecution.packed_results.isnot(None)
+    else:
+        pending = exists().where(TestResult.test_execution_id == TestExecution.id)
+
+    converted = 0
+    last_id = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            query = (
+                select(TestExecution)
+                .options(selectinload(TestExecution.test_results))
+                .where(pending, TestExecution.id > last_id)
+                .order_by(TestExecution.id)
+                .limit(args.batch_size)
+            )
+            if args.test_plan_id:
+                query = query.where(TestExecution.test_plan_id == args.test_plan_id)
+            executions = (await db.scalars(query)).all()
+            if not executions:
+                break
+            for execution in executions:
+                await convert_execution(db, execution, packed=not args.unpack)
+            await db.commit()
+            db.expunge_all()
+            converted += len(executions)
+            last_id = executions[-1].id
+            print(f"已轉換 {converted} 個執行記錄")
+    await async_engine.dispose()
+
+    print(json.dumps({"converted_executions": converted, "layout": "rows" if args.unpack else "packed"}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())